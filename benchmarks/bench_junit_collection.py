@@ -0,0 +1,61 @@
+"""Benchmark of JUnit parsing, showing that peak memory doesn't grow with file size.
+
+Usage:
+
+    python benchmarks/bench_junit_collection.py
+"""
+
+import re
+import resource
+import tempfile
+import time
+from pathlib import Path
+
+from nydok.plugin.junit import JUNIT_PATTERN, parse_junit
+
+TESTCASE = (
+    '<testcase classname="suite{suite}" name="FR{no:06}: Test case {no}" time="0.01">'
+    "<system-out>{output}</system-out></testcase>\n"
+)
+OUTPUT = "Some captured output from the test case. " * 20
+
+SIZES = [20_000, 80_000, 320_000]
+
+
+def write_junit(path: Path, no_testcases: int, no_suites: int = 10) -> None:
+    per_suite = no_testcases // no_suites
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n<testsuites>\n')
+        for suite in range(no_suites):
+            f.write(f'<testsuite name="suite{suite}" tests="{per_suite}">\n')
+            for no in range(suite * per_suite, (suite + 1) * per_suite):
+                f.write(TESTCASE.format(suite=suite, no=no, output=OUTPUT))
+            f.write("</testsuite>\n")
+        f.write("</testsuites>\n")
+
+
+def main():
+    pattern = re.compile(JUNIT_PATTERN)
+
+    print(f"{'Test cases':>10} | {'Size (MB)':>9} | {'Time (s)':>8} | {'Peak RSS (MB)':>13}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for no_testcases in SIZES:
+            path = Path(tmp_dir) / f"bench{no_testcases}.junit.xml"
+            write_junit(path, no_testcases)
+
+            start = time.perf_counter()
+            count = sum(1 for _ in parse_junit(path, pattern))
+            elapsed = time.perf_counter() - start
+            assert count == no_testcases
+
+            # ru_maxrss is in kilobytes on Linux
+            peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+            print(
+                f"{no_testcases:>10} | {path.stat().st_size / 1e6:>9.1f} | {elapsed:>8.2f} | "
+                f"{peak_rss:>13.0f}"
+            )
+            path.unlink()
+
+
+if __name__ == "__main__":
+    main()
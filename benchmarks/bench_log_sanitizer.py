@@ -0,0 +1,69 @@
+"""Benchmark of pipeline log sanitizing, on a synthetic 100 MB log fed in chunks.
+
+Usage:
+
+    python benchmarks/bench_log_sanitizer.py
+"""
+
+import time
+import tracemalloc
+
+from nydok.logs import LogSanitizer
+
+LOG_SIZE = 100 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# A mix of colored output, progress bars overwritten using carriage returns and
+# text needing HTML escaping, as found in typical job logs
+LINES = (
+    "\x1b[32;1m$ pytest -q tests/\x1b[0;m\n",
+    "".join(f"Downloading package {p}%\r" for p in range(0, 100, 10)) + "Downloaded package\n",
+    "tests/test_module.py ........................................ [ 42%]\n",
+    "E       assert response.status_code < 400 && 'error' not in body\n",
+    "\x1b[0Ksection_start:1650000000:build[collapsed=true]\r\x1b[0KBuilding <app>\n",
+)
+BLOCK = "".join(LINES) * 100
+
+
+def iter_chunks():
+    remaining = LOG_SIZE
+    text = BLOCK * (CHUNK_SIZE // len(BLOCK) + 1)
+    while remaining > 0:
+        # Chunks of varying offset, so escape sequences and lines are split arbitrarily
+        for offset in range(0, len(BLOCK), 997):
+            chunk = text[offset : offset + CHUNK_SIZE]
+            yield chunk
+            remaining -= len(chunk)
+            if remaining <= 0:
+                break
+
+
+def sanitize() -> int:
+    sanitizer = LogSanitizer()
+    output_size = 0
+    for chunk in iter_chunks():
+        output_size += len(sanitizer.feed(chunk))
+    return output_size + len(sanitizer.flush())
+
+
+def main():
+    size = sum(len(chunk) for chunk in iter_chunks())
+
+    start = time.perf_counter()
+    output_size = sanitize()
+    elapsed = time.perf_counter() - start
+
+    # Memory is measured in a separate run, as tracing allocations slows it down a lot
+    tracemalloc.start()
+    sanitize()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"Input:       {size / 1e6:.0f} MB")
+    print(f"Output:      {output_size / 1e6:.0f} MB")
+    print(f"Time:        {elapsed:.2f} s ({size / 1e6 / elapsed:.0f} MB/s)")
+    print(f"Peak memory: {peak / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
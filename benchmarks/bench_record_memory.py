@@ -0,0 +1,155 @@
+"""Benchmark of the memory used by requirement and test case records, at 100k of each.
+
+Compares plain dataclasses, with a copy of each ID, text and path per record as
+decoded from a JSON results file, to the slotted schema classes sharing them through
+an `InternTable`, as done by the plugin and when loading results.
+
+Usage:
+
+    python benchmarks/bench_record_memory.py
+"""
+
+import gc
+import json
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, List, Tuple
+
+from nydok.schema import FrozenRequirement, FrozenTestCase, InternTable, Requirement, TestCase
+
+NO_RECORDS = 100_000
+# Requirements per specification file, and per test case
+REQS_PER_FILE = 500
+REQS_PER_TEST_CASE = 2
+
+FUNC_SRC = (
+    '@testcase(["FR{no:06}", "FR{next:06}"], io=[((1, 2), 3)], ref_ids=["RA{ra:03}"])\n'
+    "def test_requirement_{no}(io=None):\n"
+    "    for (a, b), expected in io:\n"
+    "        assert add(a, b) == expected\n"
+)
+
+
+@dataclass
+class OldTestCase:
+    ids: List[str]
+    testcase_id: str
+    desc: str
+    io: List[Tuple[Any, Any]]
+    func_name: str
+    func_src: str
+    ref_ids: List[str]
+    skip: bool
+    passed: bool
+
+
+@dataclass
+class OldRequirement:
+    id: str
+    desc: str
+    file_path: Path
+    line_no: int
+    ref_ids: List[str]
+
+
+def make_records() -> Tuple[str, str]:
+    """Returns the requirements and test cases sections, as JSON like in a results file."""
+    requirements = {}
+    test_cases = {}
+    for no in range(NO_RECORDS):
+        req_id = f"FR{no:06}"
+        requirements[req_id] = {
+            "id": req_id,
+            "desc": f"The system must do something useful, number {no}.",
+            "file_path": f"specifications/part{no // REQS_PER_FILE:03}.spec.md",
+            "line_no": no % REQS_PER_FILE + 1,
+            "ref_ids": [f"UR{no // 10:06}"],
+        }
+        first = no - no % REQS_PER_TEST_CASE
+        test_cases[req_id] = {
+            "ids": [f"FR{first + i:06}" for i in range(REQS_PER_TEST_CASE)],
+            "testcase_id": f"TC{first // REQS_PER_TEST_CASE:06}",
+            "desc": f"Test of requirement {first}",
+            "io": [[[1, 2], 3]],
+            "func_name": f"test_requirement_{first}",
+            "func_src": FUNC_SRC.format(no=first, next=first + 1, ra=first % 1000),
+            "ref_ids": [f"RA{first % 1000:03}"],
+            "skip": False,
+            "passed": True,
+        }
+    return json.dumps(requirements), json.dumps(test_cases)
+
+
+def decode_old(requirements: str, test_cases: str) -> list:
+    records: list = []
+    for requirement in json.loads(requirements).values():
+        records.append(
+            OldRequirement(**{**requirement, "file_path": Path(requirement["file_path"])})
+        )
+    for test_case in json.loads(test_cases).values():
+        records.append(OldTestCase(**test_case))
+    return records
+
+
+def decode_new(requirements: str, test_cases: str, frozen: bool = False) -> list:
+    table = InternTable()
+    requirement_cls = FrozenRequirement if frozen else Requirement
+    test_case_cls = FrozenTestCase if frozen else TestCase
+    records: list = []
+    for requirement in json.loads(requirements).values():
+        requirement.update(
+            id=table.get_id(requirement["id"]),
+            file_path=table.get_path(requirement["file_path"]),
+            ref_ids=table.get_ids(requirement["ref_ids"]),
+        )
+        records.append(requirement_cls(**requirement))
+    for test_case in json.loads(test_cases).values():
+        test_case.update(
+            ids=table.get_ids(test_case["ids"]),
+            testcase_id=table.get_id(test_case["testcase_id"]),
+            func_name=table.get_text(test_case["func_name"]),
+            func_src=table.get_text(test_case["func_src"]),
+            ref_ids=table.get_ids(test_case["ref_ids"]),
+        )
+        records.append(test_case_cls(**test_case))
+    return records
+
+
+def measure(decode: Callable[[str, str], list], requirements: str, test_cases: str):
+    # Time without tracing, as tracemalloc slows down allocations considerably
+    start = time.perf_counter()
+    decode(requirements, test_cases)
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    records = decode(requirements, test_cases)
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert len(records) == 2 * NO_RECORDS
+    return elapsed, retained
+
+
+def main():
+    requirements, test_cases = make_records()
+
+    print(f"{NO_RECORDS} requirements and {NO_RECORDS} test cases")
+    print(f"{'Representation':>22} | {'Memory (MB)':>11} | {'Bytes/record':>12} | {'Time (s)':>8}")
+    for name, decode in [
+        ("Plain dataclasses", decode_old),
+        ("Slotted, interned", decode_new),
+        ("Slotted, frozen", lambda r, t: decode_new(r, t, frozen=True)),
+    ]:
+        elapsed, retained = measure(decode, requirements, test_cases)
+        print(
+            f"{name:>22} | {retained / 1e6:>11.1f} | {retained / (2 * NO_RECORDS):>12.0f} | "
+            f"{elapsed:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
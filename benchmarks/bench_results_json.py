@@ -0,0 +1,103 @@
+"""Benchmark of writing a JSON results file with 100k requirements and test cases.
+
+Compares encoding the whole document with `json.dumps` and `DataclassJsonEncoder`,
+which deep copies each record with `dataclasses.asdict`, to streaming it to the file
+record by record with `nydok.jsonwriter.dump`.
+
+Usage:
+
+    python benchmarks/bench_results_json.py
+"""
+
+import json
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+from nydok import jsonwriter
+from nydok.schema import DataclassJsonEncoder, Requirement, TestCase
+from nydok.traceability import TraceabilityIndex
+
+NO_RECORDS = 100_000
+
+FUNC_SRC = (
+    '@testcase(["FR{no:06}"], io=[((1, 2), 3)], ref_ids=["RA{ra:03}"])\n'
+    "def test_requirement_{no}(io=None):\n"
+    "    for (a, b), expected in io:\n"
+    "        assert add(a, b) == expected\n"
+)
+
+
+def make_document() -> Dict[str, Any]:
+    requirements = {}
+    test_cases = {}
+    for no in range(NO_RECORDS):
+        req_id = f"FR{no:06}"
+        requirements[req_id] = Requirement(
+            req_id,
+            f"The system must do something useful, number {no}.",
+            Path(f"specifications/part{no // 500:03}.spec.md"),
+            no % 500 + 1,
+            [f"UR{no // 10:06}"],
+        )
+        test_cases[req_id] = TestCase(
+            [req_id],
+            f"TC{no:06}",
+            f"Test of requirement {no}",
+            [((1, 2), 3)],
+            f"test_requirement_{no}",
+            FUNC_SRC.format(no=no, ra=no % 1000),
+            [f"RA{no % 1000:03}"],
+            False,
+            True,
+        )
+    return {
+        "test_cases": test_cases,
+        "requirements": requirements,
+        "risk_assessments": {},
+        "index": TraceabilityIndex.build(requirements, test_cases),
+    }
+
+
+def write_json_dumps(document: Dict[str, Any], path: Path) -> None:
+    path.write_text(json.dumps(document, cls=DataclassJsonEncoder, indent=4))
+
+
+def write_jsonwriter(document: Dict[str, Any], path: Path) -> None:
+    with open(path, "w") as sink:
+        jsonwriter.dump(document, sink)
+
+
+def measure(write: Callable[[Dict[str, Any], Path], None], document: Dict[str, Any], path: Path):
+    # Time without tracing, as tracemalloc slows down allocations considerably
+    start = time.perf_counter()
+    write(document, path)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    write(document, path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    document = make_document()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        outputs = []
+        print(f"{NO_RECORDS} requirements and {NO_RECORDS} test cases")
+        print(f"{'Writer':>12} | {'Time (s)':>8} | {'Peak memory (MB)':>16}")
+        for name, write in [("json.dumps", write_json_dumps), ("jsonwriter", write_jsonwriter)]:
+            path = Path(tmp_dir) / f"{name}.json"
+            elapsed, peak = measure(write, document, path)
+            outputs.append(path.read_bytes())
+            print(f"{name:>12} | {elapsed:>8.2f} | {peak / 1e6:>16.1f}")
+
+        assert outputs[0] == outputs[1]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Benchmark of specification parsing, showing that it scales linearly with file size.
+
+Usage:
+
+    python benchmarks/bench_spec_collection.py
+"""
+
+import re
+import time
+from pathlib import Path
+
+from nydok.plugin.specification import DEFAULT_REQ_PATTERN, parse_requirements
+
+# Each block is one requirement with some surrounding prose, about 160 bytes
+BLOCK = (
+    "Some descriptive text for the requirement below, as found in a typical specification.\n\n"
+    "- FR{no:06} [UR{ref:06}]: The system must do something useful, number {no}.\n\n"
+)
+
+SIZES = [2_000, 4_000, 8_000, 16_000, 32_000]
+
+
+def make_spec(no_reqs: int) -> str:
+    return "# Specification\n\n" + "".join(
+        BLOCK.format(no=no, ref=no // 10) for no in range(no_reqs)
+    )
+
+
+def main():
+    pattern = re.compile(DEFAULT_REQ_PATTERN)
+
+    print(f"{'Requirements':>12} | {'Size (MB)':>9} | {'Time (s)':>8} | {'us/req':>6}")
+    for no_reqs in SIZES:
+        md_data = make_spec(no_reqs)
+
+        start = time.perf_counter()
+        reqs = parse_requirements(md_data, pattern, Path("bench.spec.md"))
+        elapsed = time.perf_counter() - start
+
+        assert len(reqs) == no_reqs
+        assert reqs[-1].line_no == md_data[: md_data.rindex("- FR")].count("\n") + 1
+
+        print(
+            f"{no_reqs:>12} | {len(md_data) / 1e6:>9.2f} | {elapsed:>8.4f} | "
+            f"{elapsed / no_reqs * 1e6:>6.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,32 @@
-import json
+import asyncio
+import os
+import secrets
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Callable, Collection, Dict, Iterator, List, Optional, Set, TextIO, Tuple
 
 import click
 
+from .commitrange import COMMIT_SOURCES
+from .gitlab import MR_APIS, MR_LOOKUPS, GitLabClient, set_client
+from .gitlab_async import AsyncGitLabClient
+from .httpcache import HttpCache
+from .logs import LOG_MODES, LogOptions
 from .report import (
-    create_codereview_report,
-    create_pipeline_logs_report,
-    create_risk_report,
-    create_test_overview_report,
-    create_test_case_report,
-    create_traceability_matrix,
+    write_codereview_report,
+    write_codereview_report_async,
+    write_local_codereview_report,
+    write_pipeline_logs_report,
+    write_pipeline_logs_report_async,
+    write_risk_report,
+    write_test_case_report,
+    write_test_overview_report,
+    write_traceability_matrix,
 )
-from .schema import Requirement, RiskAssessment, TestCase
+from .results import SECTIONS, Results, write_json
+from .traceability import TraceabilityGraph
 
 
 @click.group()
@@ -25,18 +39,99 @@ def report():
     pass
 
 
-def _load_json(path: Path):
-    data = json.loads(path.read_text())
-    return {
-        "test_cases": {_id: TestCase(**test_case) for _id, test_case in data["test_cases"].items()},
-        "requirements": {
-            _id: Requirement(**requirement) for _id, requirement in data["requirements"].items()
-        },
-        "risk_assessments": {
-            _id: RiskAssessment.from_dict(_id, risk_assessment)
-            for _id, risk_assessment in data["risk_assessments"].items()
-        },
-    }
+@cli.command(help="Export a results file, e.g. in compact SQLite format, as JSON.")
+@click.argument("result", type=click.Path(exists=True))
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(writable=True),
+    required=True,
+    help="Output path for the JSON results file.",
+)
+def export_json(result, output):
+    data = _load_results(Path(result))
+    write_json(
+        Path(output),
+        dict(data["test_cases"]),
+        dict(data["requirements"]),
+        dict(data["risk_assessments"]),
+        data.index,
+    )
+
+
+# Reports created from a results file, with the results sections they need
+RESULT_REPORTS = {
+    "traceability-matrix": ("requirements", "test_cases"),
+    "risk-assessment": ("risk_assessments",),
+    "test-overview": ("requirements", "test_cases"),
+    "test-cases": ("requirements", "test_cases"),
+}
+
+# Fields of the results sections which a report never reads, and so aren't decoded
+UNUSED_FIELDS: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    "traceability-matrix": {
+        "requirements": ("file_path", "line_no"),
+        "test_cases": ("io", "func_src"),
+    },
+    "risk-assessment": {},
+    "test-overview": {
+        "requirements": ("file_path", "line_no"),
+        "test_cases": ("io", "func_src"),
+    },
+    "test-cases": {
+        "requirements": ("file_path", "line_no"),
+    },
+}
+
+
+def _load_results(path: Path, report_names: Collection[str] = ()) -> Results:
+    """Lazily loads a results file, skipping fields that none of the given reports read."""
+    omit_fields: Dict[str, Set[str]] = {}
+    if report_names:
+        for section in SECTIONS:
+            omit_fields[section] = set.intersection(
+                *(set(UNUSED_FIELDS[name].get(section, ())) for name in report_names)
+            )
+    # Decoded objects are shared between concurrently created reports, so are read-only
+    return Results(path, omit_fields=omit_fields, frozen=True)
+
+
+def _get_graph(results: Results) -> TraceabilityGraph:
+    """Builds the traceability graph of a results file, using its stored index."""
+    return TraceabilityGraph(
+        results["requirements"].values(), results["test_cases"].values(), results.index
+    )
+
+
+@contextmanager
+def _open_output(output: str) -> Iterator[TextIO]:
+    """Opens the output path for writing, or stdout if output is '-'.
+
+    The report is written to a temporary file next to the output path, which replaces
+    the output once the report is complete. If writing fails, any previous report at
+    the output path is left as it was.
+    """
+    if output == "-":
+        yield sys.stdout
+        return
+
+    output_path = Path(output)
+    # Created like the output would be, rather than with the private mode of tempfile
+    temp_path = output_path.with_name(f".{output_path.name}.{secrets.token_hex(4)}.tmp")
+    try:
+        with open(temp_path, "x") as f:
+            yield f
+        os.replace(temp_path, output_path)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+
+
+def _parse_categories(categories: Optional[str]) -> Optional[List[Tuple[str, str]]]:
+    if not categories:
+        return None
+    assert len(categories.split(",")) % 2 == 0, "Categories must be in pairs."
+    return list(zip(categories.split(",")[::2], categories.split(",")[1::2]))
 
 
 @report.command(help="Create traceability matrix.")
@@ -55,21 +150,19 @@ def _load_json(path: Path):
     help="Output path (default: stdout).",
 )
 def traceability_matrix(result, base_prefix, categories, output):
-    if categories:
-        assert len(categories.split(",")) % 2 == 0, "Categories must be in pairs."
-        categories = list(zip(categories.split(",")[::2], categories.split(",")[1::2]))
-
-    data = _load_json(Path(result))
-    report = create_traceability_matrix(
-        data["requirements"].values(),
-        data["test_cases"].values(),
-        base_prefix=base_prefix,
-        categories=categories,
-    )
-    if output == "-":
-        sys.stdout.write(report + "\n")
-    else:
-        Path(output).write_text(report)
+    categories = _parse_categories(categories)
+
+    data = _load_results(Path(result), ["traceability-matrix"])
+    with _open_output(output) as sink:
+        write_traceability_matrix(
+            sink,
+            data["requirements"].values(),
+            data["test_cases"].values(),
+            base_prefix=base_prefix,
+            categories=categories,
+        )
+        if output == "-":
+            sink.write("\n")
 
 
 @report.command(help="Create risk assessment tables.")
@@ -82,13 +175,9 @@ def traceability_matrix(result, base_prefix, categories, output):
     help="Output path (default: stdout).",
 )
 def risk_assessment(result, output):
-    data = _load_json(Path(result))
-    report = create_risk_report(data["risk_assessments"])
-
-    if output == "-":
-        sys.stdout.write(report)
-    else:
-        Path(output).write_text(report)
+    data = _load_results(Path(result), ["risk-assessment"])
+    with _open_output(output) as sink:
+        write_risk_report(sink, data["risk_assessments"])
 
 
 @report.command(help="Create test overview table.")
@@ -101,15 +190,13 @@ def risk_assessment(result, output):
     help="Output path (default: stdout).",
 )
 def test_overview(result, output):
-    data = _load_json(Path(result))
-    report = create_test_overview_report(
-        data["requirements"].values(),
-        data["test_cases"].values(),
-    )
-    if output == "-":
-        sys.stdout.write(report)
-    else:
-        Path(output).write_text(report)
+    data = _load_results(Path(result), ["test-overview"])
+    with _open_output(output) as sink:
+        write_test_overview_report(
+            sink,
+            data["requirements"].values(),
+            data["test_cases"].values(),
+        )
 
 
 @report.command(help="Create test case report.")
@@ -122,77 +209,318 @@ def test_overview(result, output):
     help="Output path (default: stdout).",
 )
 def test_cases(result, output):
-    data = _load_json(Path(result))
-    report = create_test_case_report(
-        data["requirements"].values(),
-        data["test_cases"].values(),
-    )
-    if output == "-":
-        sys.stdout.write(report)
-    else:
-        Path(output).write_text(report)
+    data = _load_results(Path(result), ["test-cases"])
+    with _open_output(output) as sink:
+        write_test_case_report(
+            sink,
+            data["requirements"].values(),
+            data["test_cases"].values(),
+            graph=_get_graph(data),
+        )
 
 
-@report.command(help="Create code review table.")
+@report.command(
+    name="all",
+    help=(
+        "Create several reports from a results file, loading it only once. "
+        "Each report is written to <report>.md in the output directory. "
+        f"Reports: {', '.join(RESULT_REPORTS)}."
+    ),
+)
+@click.argument("result", type=click.Path(exists=True))
 @click.option(
-    "--repo-path",
-    "-r",
-    type=str,
+    "--output-dir",
+    "-d",
+    type=click.Path(file_okay=False, writable=True),
     required=True,
-    help="Gitlab repository path. E.g. my-group/my-project.",
+    help="Output directory for the reports.",
 )
 @click.option(
-    "--to-ref",
-    "-c",
+    "--reports",
     type=str,
-    default="main",
-    help="Git ref for end of commit range. Default is default branch configured for repository.",
+    help="Comma separated reports to create. Default is all reports.",
 )
 @click.option(
-    "--from-ref",
-    "-f",
+    "--base-prefix", type=str, help="Prefix to use as basis (filter) for traceability matrix."
+)
+@click.option(
+    "--categories",
     type=str,
-    help="Git ref for start of commit range. Default is all history.",
+    help="Categories for traceability matrix (title,prefix). Repeat for multiple.",
 )
 @click.option(
-    "--output",
-    "-o",
-    type=click.Path(writable=True),
-    default="-",
-    help="Output path (default: stdout).",
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of reports to create concurrently. Default is 1.",
 )
-def code_review(repo_path, to_ref, from_ref, output):
-    report = create_codereview_report(
-        repo_path=repo_path,
-        to_ref=to_ref,
-        from_ref=from_ref,
-    )
-    if output == "-":
-        sys.stdout.write(report)
-    else:
-        Path(output).write_text(report)
+def all_reports(result, output_dir, reports, base_prefix, categories, jobs):
+    categories = _parse_categories(categories)
+    report_names = reports.split(",") if reports else list(RESULT_REPORTS)
+    if unknown := set(report_names) - set(RESULT_REPORTS):
+        raise click.BadParameter(f"Unknown reports: {', '.join(sorted(unknown))}")
 
+    # Decode the needed sections and build the shared graph once, before any concurrent use
+    results = _load_results(Path(result), report_names)
+    data = {
+        section: results[section]
+        for report_name in report_names
+        for section in RESULT_REPORTS[report_name]
+    }
+    graph = None
+    if "requirements" in data:
+        graph = _get_graph(results)
 
-@report.command(help="Create pipeline logs report.")
-@click.option(
+    writers: Dict[str, Callable[[TextIO], None]] = {
+        "traceability-matrix": lambda sink: write_traceability_matrix(
+            sink,
+            data["requirements"].values(),
+            data["test_cases"].values(),
+            base_prefix=base_prefix,
+            categories=categories,
+            graph=graph,
+        ),
+        "risk-assessment": lambda sink: write_risk_report(sink, data["risk_assessments"]),
+        "test-overview": lambda sink: write_test_overview_report(
+            sink, data["requirements"].values(), data["test_cases"].values()
+        ),
+        "test-cases": lambda sink: write_test_case_report(
+            sink, data["requirements"].values(), data["test_cases"].values(), graph=graph
+        ),
+    }
+
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    def create_report(report_name: str) -> None:
+        with _open_output(str(Path(output_dir) / f"{report_name}.md")) as sink:
+            writers[report_name](sink)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        # Consume the results to raise any errors from the reports
+        list(executor.map(create_report, report_names))
+
+
+# Option for caching Gitlab responses, shared by the reports fetching data from Gitlab
+cache_dir_option = click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, writable=True),
+    help=(
+        "Directory for caching Gitlab responses between runs. Immutable data is reused "
+        "as-is, other responses are revalidated with Gitlab. Default is no caching."
+    ),
+)
+
+repo_path_option = click.option(
     "--repo-path",
     "-r",
     type=str,
     required=True,
     help="Gitlab repository path. E.g. my-group/my-project.",
 )
-@click.option(
-    "--pipeline-id",
-    "-p",
-    type=click.INT,
-    required=True,
-    help="Pipeline ID in Gitlab from which to retrieve job logs.",
+
+
+def _add_options(options: List[Callable]) -> Callable:
+    """Returns a decorator adding several click options, in the given order."""
+
+    def decorator(f):
+        for option in reversed(options):
+            f = option(f)
+        return f
+
+    return decorator
+
+
+# End of the commit range of the code review report, unless created offline
+DEFAULT_TO_REF = "main"
+
+code_review_options = _add_options(
+    [
+        click.option(
+            "--to-ref",
+            "-c",
+            type=str,
+            help=(
+                f"Git ref for end of commit range. Default: '{DEFAULT_TO_REF}', or HEAD of the "
+                "local clone with --offline."
+            ),
+        ),
+        click.option(
+            "--from-ref",
+            "-f",
+            type=str,
+            help="Git ref for start of commit range. Default is all history.",
+        ),
+        click.option(
+            "--mr-lookup",
+            type=click.Choice(MR_LOOKUPS),
+            default="auto",
+            help=(
+                "How to find the merge requests of the commit range: 'list' lists merged "
+                "merge requests, 'commits' looks them up per merge commit. Default 'auto' "
+                "picks the cheaper one for the range size."
+            ),
+        ),
+        click.option(
+            "--mr-api",
+            type=click.Choice(MR_APIS),
+            default="rest",
+            help=(
+                "Gitlab API to fetch merge requests with. 'graphql' fetches them in "
+                "batches together with who approved them, and reports the approvers "
+                "rather than the reviewers. Default is 'rest'."
+            ),
+        ),
+        click.option(
+            "--commit-source",
+            type=click.Choice(COMMIT_SOURCES),
+            default="auto",
+            help=(
+                "Where to list the commits of the range from: 'git' uses the local clone "
+                "in --git-dir, 'api' pages through them with the Gitlab API. Default "
+                "'auto' uses the local clone if it is complete (not shallow) and has the "
+                "commits."
+            ),
+        ),
+        click.option(
+            "--git-dir",
+            type=click.Path(file_okay=False),
+            default=".",
+            help="Local clone of the repository. Default is the current directory.",
+        ),
+    ]
 )
+
+pipeline_logs_options = _add_options(
+    [
+        click.option(
+            "--pipeline-id",
+            "-p",
+            type=click.INT,
+            required=True,
+            help="Pipeline ID in Gitlab from which to retrieve job logs.",
+        ),
+        click.option(
+            "--job-names",
+            "-j",
+            type=str,
+            help=(
+                "Comma separated job names in pipeline for only including certain jobs. Glob "
+                "patterns, e.g. 'test-*', are supported. Default is all jobs."
+            ),
+        ),
+        click.option(
+            "--job-regex",
+            type=str,
+            help="Regex for only including jobs whose names contain a match.",
+        ),
+        click.option(
+            "--include-downstream",
+            is_flag=True,
+            help=(
+                "Include jobs of downstream (child and multi-project) pipelines, named "
+                "'<trigger job>/<job>'."
+            ),
+        ),
+        click.option(
+            "--log-mode",
+            type=click.Choice(LOG_MODES),
+            default="full",
+            help=(
+                "Which parts of the logs to include: 'full' logs, the first and last lines "
+                "('head-tail'), lines matching patterns with context ('matches') or Gitlab "
+                "collapsible sections ('sections'). Default is 'full'."
+            ),
+        ),
+        click.option(
+            "--log-lines",
+            type=click.IntRange(min=0),
+            default=100,
+            help=(
+                "Number of lines at the start and end of each log, for 'head-tail'. Default is 100."
+            ),
+        ),
+        click.option(
+            "--log-context",
+            type=click.IntRange(min=0),
+            default=10,
+            help="Number of lines around each matching line, for 'matches'. Default is 10.",
+        ),
+        click.option(
+            "--log-pattern",
+            "log_patterns",
+            type=str,
+            multiple=True,
+            help="Regex for lines to include, for 'matches'. Can be repeated. Default is failures.",
+        ),
+        click.option(
+            "--log-section",
+            "log_sections",
+            type=str,
+            multiple=True,
+            help="Glob pattern of section names to include, for 'sections'. Can be repeated.",
+        ),
+        click.option(
+            "--artifacts-dir",
+            type=click.Path(file_okay=False, writable=True),
+            help="Directory to write the full logs to, gzip compressed and linked from the report.",
+        ),
+    ]
+)
+
+
+def _enable_cache(cache_dir: Optional[str]) -> None:
+    if cache_dir:
+        set_client(GitLabClient(cache=HttpCache(Path(cache_dir))))
+
+
+def _get_log_options(
+    log_mode: str,
+    log_lines: int,
+    log_context: int,
+    log_patterns: Tuple[str, ...],
+    log_sections: Tuple[str, ...],
+    artifacts_dir: Optional[str],
+    output: str,
+) -> LogOptions:
+    log_options = LogOptions(mode=log_mode, lines=log_lines, context=log_context)
+    if log_patterns:
+        log_options.patterns = list(log_patterns)
+    if log_sections:
+        log_options.sections = list(log_sections)
+    if artifacts_dir:
+        log_options.artifacts_dir = artifacts_dir
+        # Link to the logs relative to the report
+        if output != "-":
+            log_options.artifacts_link = Path(
+                os.path.relpath(artifacts_dir, Path(output).absolute().parent)
+            ).as_posix()
+    return log_options
+
+
+@report.command(help="Create code review table.")
 @click.option(
-    "--job-names",
-    "-j",
+    "--repo-path",
+    "-r",
     type=str,
-    help="Job names in pipeline for only including certain jobs. Default is all jobs.",
+    help="Gitlab repository path. E.g. my-group/my-project. Required unless --offline.",
+)
+@code_review_options
+@click.option(
+    "--offline",
+    is_flag=True,
+    help=(
+        "Create the report from the merge commits in the local clone in --git-dir, "
+        "without accessing Gitlab."
+    ),
+)
+@click.option(
+    "--mr-dump",
+    type=click.Path(exists=True, dir_okay=False),
+    help=(
+        "JSON file with merge requests exported from the Gitlab API, used with --offline "
+        "in addition to the merge commits."
+    ),
 )
 @click.option(
     "--output",
@@ -201,13 +529,174 @@ def code_review(repo_path, to_ref, from_ref, output):
     default="-",
     help="Output path (default: stdout).",
 )
-def pipeline_logs(repo_path, pipeline_id, job_names, output):
-    job_names = job_names.split(",") if job_names else None
+@cache_dir_option
+def code_review(
+    repo_path,
+    to_ref,
+    from_ref,
+    mr_lookup,
+    mr_api,
+    commit_source,
+    git_dir,
+    offline,
+    mr_dump,
+    output,
+    cache_dir,
+):
+    if offline:
+        # Detached CI clones often have no local branches, so default to what's checked out
+        with _open_output(output) as sink:
+            write_local_codereview_report(
+                sink, git_dir=git_dir, to_ref=to_ref, from_ref=from_ref, mr_dump=mr_dump
+            )
+        return
+    to_ref = to_ref or DEFAULT_TO_REF
+    if mr_dump:
+        raise click.UsageError("--mr-dump requires --offline.")
+    if not repo_path:
+        raise click.UsageError("Missing option '--repo-path'.")
+
+    _enable_cache(cache_dir)
+    with _open_output(output) as sink:
+        write_codereview_report(
+            sink,
+            repo_path=repo_path,
+            to_ref=to_ref,
+            from_ref=from_ref,
+            mr_lookup=mr_lookup,
+            mr_api=mr_api,
+            commit_source=commit_source,
+            git_dir=git_dir,
+        )
 
-    report = create_pipeline_logs_report(
-        repo_path=repo_path, pipeline_id=pipeline_id, job_names=job_names
+
+@report.command(help="Create pipeline logs report.")
+@repo_path_option
+@pipeline_logs_options
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(writable=True),
+    default="-",
+    help="Output path (default: stdout).",
+)
+@cache_dir_option
+def pipeline_logs(
+    repo_path,
+    pipeline_id,
+    job_names,
+    job_regex,
+    include_downstream,
+    log_mode,
+    log_lines,
+    log_context,
+    log_patterns,
+    log_sections,
+    artifacts_dir,
+    output,
+    cache_dir,
+):
+    _enable_cache(cache_dir)
+    log_options = _get_log_options(
+        log_mode, log_lines, log_context, log_patterns, log_sections, artifacts_dir, output
     )
-    if output == "-":
-        sys.stdout.write(report)
-    else:
-        Path(output).write_text(report)
+
+    with _open_output(output) as sink:
+        write_pipeline_logs_report(
+            sink,
+            repo_path=repo_path,
+            pipeline_id=pipeline_id,
+            job_names=job_names.split(",") if job_names else None,
+            job_regex=job_regex,
+            include_downstream=include_downstream,
+            log_options=log_options,
+        )
+
+
+@report.command(
+    name="gitlab",
+    help=(
+        "Create the code review and pipeline logs reports, fetching commits, merge "
+        "requests and job logs from Gitlab concurrently. The reports are written to "
+        "code-review.md and pipeline-logs.md in the output directory."
+    ),
+)
+@repo_path_option
+@code_review_options
+@pipeline_logs_options
+@click.option(
+    "--output-dir",
+    "-d",
+    type=click.Path(file_okay=False, writable=True),
+    required=True,
+    help="Output directory for the reports.",
+)
+@cache_dir_option
+def gitlab_reports(
+    repo_path,
+    to_ref,
+    from_ref,
+    mr_lookup,
+    mr_api,
+    commit_source,
+    git_dir,
+    pipeline_id,
+    job_names,
+    job_regex,
+    include_downstream,
+    log_mode,
+    log_lines,
+    log_context,
+    log_patterns,
+    log_sections,
+    artifacts_dir,
+    output_dir,
+    cache_dir,
+):
+    to_ref = to_ref or DEFAULT_TO_REF
+    _enable_cache(cache_dir)
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    code_review_path = Path(output_dir) / "code-review.md"
+    pipeline_logs_path = Path(output_dir) / "pipeline-logs.md"
+    log_options = _get_log_options(
+        log_mode,
+        log_lines,
+        log_context,
+        log_patterns,
+        log_sections,
+        artifacts_dir,
+        str(pipeline_logs_path),
+    )
+
+    async def create_reports() -> None:
+        # One client for both reports, bounding the total number of concurrent requests
+        client = AsyncGitLabClient()
+        with (
+            _open_output(str(code_review_path)) as code_review_sink,
+            _open_output(str(pipeline_logs_path)) as pipeline_logs_sink,
+        ):
+            await asyncio.gather(
+                write_codereview_report_async(
+                    code_review_sink,
+                    repo_path=repo_path,
+                    to_ref=to_ref,
+                    from_ref=from_ref,
+                    mr_lookup=mr_lookup,
+                    mr_api=mr_api,
+                    commit_source=commit_source,
+                    git_dir=git_dir,
+                    client=client,
+                ),
+                write_pipeline_logs_report_async(
+                    pipeline_logs_sink,
+                    repo_path=repo_path,
+                    pipeline_id=pipeline_id,
+                    job_names=job_names.split(",") if job_names else None,
+                    job_regex=job_regex,
+                    include_downstream=include_downstream,
+                    log_options=log_options,
+                    client=client,
+                ),
+            )
+
+    asyncio.run(create_reports())
@@ -0,0 +1,171 @@
+import subprocess
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional
+
+from . import gitlab_async
+from .gitlab import GitLabClient, fetch_commits_for_ref, get_commit_id
+from .gitlab_async import AsyncGitLabClient
+
+# Where to list the commits of a range from
+COMMIT_SOURCES = ("auto", "git", "api")
+# Commit id, parent ids and committer date of each commit listed from a local clone
+GIT_LOG_FORMAT = "%H%x00%P%x00%cI"
+
+
+@dataclass
+class CommitRange:
+    """Commits of a range, newest first, with the set of their ids for membership tests.
+
+    Attributes:
+        commits: The commits as returned by the Gitlab API, or with the same `id`,
+            `parent_ids` and `committed_date` fields if listed from a local clone.
+        source: Where the commits were listed from, `git` or `api`.
+        ids: Ids of the commits.
+    """
+
+    commits: List[Dict[str, Any]]
+    source: str
+    ids: FrozenSet[str] = field(init=False)
+
+    def __post_init__(self):
+        self.ids = frozenset(c["id"] for c in self.commits)
+
+    def __contains__(self, commit_id: object) -> bool:
+        return commit_id in self.ids
+
+    def __len__(self) -> int:
+        return len(self.commits)
+
+
+def _git(git_dir: str, *args: str) -> str:
+    return subprocess.run(
+        ["git", "-C", git_dir, *args], check=True, capture_output=True, text=True
+    ).stdout
+
+
+def _is_complete_clone(git_dir: str) -> bool:
+    try:
+        return _git(git_dir, "rev-parse", "--is-shallow-repository").strip() == "false"
+    except (OSError, subprocess.CalledProcessError):
+        return False
+
+
+def list_local_commits(
+    git_dir: str, to_id: str, from_id: Optional[str] = None
+) -> Optional[List[Dict[str, Any]]]:
+    """Lists the commits of a range from a local clone, like the Gitlab API does.
+
+    Returns:
+        The commits, or None if the clone doesn't have both commits.
+    """
+    try:
+        for commit_id in filter(None, [to_id, from_id]):
+            _git(git_dir, "cat-file", "-e", f"{commit_id}^{{commit}}")
+        output = _git(
+            git_dir,
+            "log",
+            "--no-show-signature",
+            f"--format={GIT_LOG_FORMAT}",
+            # The same (symmetric) range as the API's `ref_name`
+            f"{from_id}...{to_id}" if from_id else to_id,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    commits = []
+    for line in output.splitlines():
+        commit_id, parent_ids, committed_date = line.split("\x00")
+        commits.append(
+            {"id": commit_id, "parent_ids": parent_ids.split(), "committed_date": committed_date}
+        )
+    return commits
+
+
+def get_local_commit_range(
+    repo_path: str,
+    to_ref: str,
+    from_ref: Optional[str] = None,
+    git_dir: str = ".",
+    client: Optional[GitLabClient] = None,
+) -> Optional[CommitRange]:
+    """Lists the commits of a range from a local clone of the repository, if possible.
+
+    The refs are resolved to commit ids with Gitlab, so the range is the same as listed
+    by Gitlab, also if the clone's branches are outdated. Shallow clones, as made by
+    Gitlab CI by default, are not used, since they lack the older commits.
+
+    Returns:
+        The commit range, or None if `git_dir` isn't a complete clone with both commits.
+    """
+    if not _is_complete_clone(git_dir):
+        return None
+
+    to_id = get_commit_id(repo_path, to_ref, client=client)
+    from_id = get_commit_id(repo_path, from_ref, client=client) if from_ref else None
+    commits = list_local_commits(git_dir, to_id, from_id)
+    return CommitRange(commits, "git") if commits is not None else None
+
+
+def _local_clone_error(git_dir: str) -> RuntimeError:
+    return RuntimeError(f"'{git_dir}' is not a complete clone with the commits of the range")
+
+
+def resolve_commit_range(
+    repo_path: str,
+    to_ref: Optional[str] = None,
+    from_ref: Optional[str] = None,
+    commit_source: str = "api",
+    git_dir: str = ".",
+    client: Optional[GitLabClient] = None,
+) -> CommitRange:
+    """Lists the commits of a range, from a local clone or by paging through the Gitlab API.
+
+    Listing the commits with the API takes one request per 100 commits, which adds up
+    for long histories, while a local clone lists them in milliseconds.
+
+    Args:
+        repo_path: Gitlab repository path.
+        to_ref: End of the range. Default: The default branch, listed with the API.
+        from_ref: Start of the range. Default: All history.
+        commit_source: `git` to list the commits from the clone in `git_dir`, `api` to
+            list them with the Gitlab API, or `auto` to use the clone if possible.
+        git_dir: Directory of the local clone.
+        client: Gitlab client. Default: The shared client.
+    """
+    if commit_source not in COMMIT_SOURCES:
+        raise ValueError(f"Unknown commit source '{commit_source}'")
+
+    if commit_source != "api" and to_ref:
+        commit_range = get_local_commit_range(repo_path, to_ref, from_ref, git_dir, client)
+        if commit_range is not None:
+            return commit_range
+    if commit_source == "git":
+        raise _local_clone_error(git_dir)
+
+    return CommitRange(fetch_commits_for_ref(repo_path, to_ref, from_ref, client), "api")
+
+
+async def resolve_commit_range_async(
+    repo_path: str,
+    to_ref: Optional[str] = None,
+    from_ref: Optional[str] = None,
+    commit_source: str = "api",
+    git_dir: str = ".",
+    client: Optional[AsyncGitLabClient] = None,
+) -> CommitRange:
+    """Asyncio version of `resolve_commit_range`."""
+    if commit_source not in COMMIT_SOURCES:
+        raise ValueError(f"Unknown commit source '{commit_source}'")
+    client = client or AsyncGitLabClient()
+
+    if commit_source != "api" and to_ref:
+        commit_range = await client.run(
+            get_local_commit_range, repo_path, to_ref, from_ref, git_dir, client.client
+        )
+        if commit_range is not None:
+            return commit_range
+    if commit_source == "git":
+        raise _local_clone_error(git_dir)
+
+    commits = await gitlab_async.fetch_commits_for_ref(repo_path, to_ref, from_ref, client)
+    return CommitRange(commits, "api")
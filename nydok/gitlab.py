@@ -1,8 +1,56 @@
+import codecs
+import fnmatch
 import os
-from typing import Any, Dict, List, Optional
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
 from urllib.parse import quote_plus
 
 import requests  # type: ignore
+from requests.adapters import HTTPAdapter  # type: ignore
+from urllib3.util.retry import Retry
+
+from .httpcache import HttpCache
+
+# Rate limiting and server errors, which are retried with backoff
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Ways of looking up the merge requests for a commit range
+MR_LOOKUPS = ("auto", "list", "commits")
+# APIs for fetching merge requests. GraphQL also gives who approved each merge request.
+MR_APIS = ("rest", "graphql")
+# Maximum number of merge commits to look up merge requests for individually
+MAX_COMMIT_LOOKUPS = 500
+UPDATED_AFTER_MARGIN = timedelta(days=1)
+RE_COMMIT_SHA = re.compile(r"[0-9a-f]{40}")
+TRACE_CHUNK_SIZE = 64 * 1024
+# Maximum number of nodes per page of a GraphQL connection
+GRAPHQL_PAGE_SIZE = 100
+
+MERGE_REQUESTS_QUERY = """
+query($fullPath: ID!, $updatedAfter: Time, $iids: [String!], $first: Int, $after: String) {
+  project(fullPath: $fullPath) {
+    mergeRequests(
+      state: merged, updatedAfter: $updatedAfter, iids: $iids, first: $first, after: $after
+    ) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        mergeCommitSha
+        title
+        mergedAt
+        author { name }
+        reviewers { nodes { name } }
+        approvedBy { nodes { name } }
+      }
+    }
+  }
+}
+"""
+
+T = TypeVar("T")
+R = TypeVar("R")
 
 
 def get_api_url() -> str:
@@ -21,114 +69,606 @@ def get_gitlab_token() -> str:
     return os.environ["GITLAB_TOKEN"]
 
 
-def _get_paginated_results(url: str, params: Dict[str, Any]) -> List[Any]:
-    params = dict(params)
-    params.setdefault("per_page", 100)
+class GitLabClient:
+    """Client for the Gitlab REST API, sharing one pooled session between all requests.
+
+    Connections are kept alive and reused, and failed requests are retried with exponential
+    backoff on rate limiting (429) and server errors (5xx), respecting any `Retry-After`
+    header. Concurrent requests, see `map`, are limited to `max_workers` at a time.
+
+    Args:
+        api_url: Gitlab API URL. Default: Taken from the `GITLAB_URL` environment variable.
+        graphql_url: Gitlab GraphQL API URL. Default: Next to `api_url`.
+        token: Gitlab access token. Default: Taken from the `GITLAB_TOKEN` environment variable.
+        max_workers: Maximum number of concurrent requests.
+        retries: Maximum number of retries per request.
+        backoff_factor: Backoff factor between retries, in seconds.
+        timeout: Timeout for connecting and reading, in seconds.
+        cache: Optional on-disk cache for responses.
+    """
+
+    def __init__(
+        self,
+        api_url: Optional[str] = None,
+        token: Optional[str] = None,
+        max_workers: int = 8,
+        retries: int = 5,
+        backoff_factor: float = 0.5,
+        timeout: float = 60,
+        cache: Optional[HttpCache] = None,
+        graphql_url: Optional[str] = None,
+    ):
+        self.api_url = api_url or get_api_url()
+        if graphql_url is None:
+            graphql_url = (
+                re.sub(r"/api/v4/?$", "/api/graphql", api_url) if api_url else get_graphql_url()
+            )
+        self.graphql_url = graphql_url
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.cache = cache
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=["GET", "POST"],
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        # Requests wait for a free connection, so at most max_workers run at a time, also
+        # when made from several threads outside of `map`, e.g. by `AsyncGitLabClient`
+        adapter = HTTPAdapter(pool_maxsize=max_workers, pool_block=True, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Authorization"] = f"Bearer {token or get_gitlab_token()}"
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def get(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        immutable: bool = False,
+        **kwargs,
+    ) -> requests.Response:
+        """Performs a GET request, through the cache if enabled.
+
+        Args:
+            url: URL to fetch.
+            params: Query parameters.
+            immutable: Whether the resource never changes, so a cached response can be
+                used without revalidating it.
+            kwargs: Passed on to `requests.Session.get`.
+        """
+        if self.cache is None:
+            return self.session.get(url, params=params, timeout=self.timeout, **kwargs)
+
+        prepared_url = requests.Request("GET", url, params=params).prepare().url
+        return self.cache.get(
+            self.session, str(prepared_url), immutable=immutable, timeout=self.timeout, **kwargs
+        )
 
-    def _get_results(next_page: Optional[str] = None):
-        fetch_url = next_page if next_page else url
-        resp = requests.get(
-            fetch_url,
-            params=params,
-            headers={"Authorization": f"Bearer {get_gitlab_token()}"},
+    def get_json(
+        self, url: str, params: Optional[Dict[str, Any]] = None, immutable: bool = False
+    ) -> Any:
+        resp = self.get(url, params=params, immutable=immutable)
+        assert resp.status_code == 200, (
+            f"Resource {url} returned status code {resp.status_code}.\n{resp.text}"
+        )
+        return resp.json()
+
+    def get_paginated(self, url: str, params: Dict[str, Any], immutable: bool = False) -> List[Any]:
+        """Fetches all pages of a paginated resource, returning the concatenated results.
+
+        If the first response gives the total number of pages (`X-Total-Pages`), the
+        remaining pages are fetched concurrently. Otherwise, e.g. for keyset pagination
+        or large collections where Gitlab omits the totals, `Link` headers are followed
+        one page at a time.
+        """
+        params = dict(params)
+        params.setdefault("per_page", 100)
+
+        def _get_results(next_page: Optional[str] = None, page_params=params):
+            fetch_url = next_page if next_page else url
+            resp = self.get(fetch_url, params=page_params, immutable=immutable)
+            assert resp.status_code == 200, (
+                f"Resource {fetch_url} returned status code {resp.status_code}.\n{resp.text}"
+            )
+
+            return resp
+
+        resp = _get_results()
+        api_results = resp.json()
+
+        total_pages = int(resp.headers.get("X-Total-Pages") or 0)
+        if total_pages > 1:
+            page = int(resp.headers.get("X-Page") or 1)
+            pages = self.map(
+                lambda page_no: _get_results(page_params={**params, "page": page_no}).json(),
+                range(page + 1, total_pages + 1),
+            )
+            for page_results in pages:
+                api_results.extend(page_results)
+            return api_results
+
+        next_page = resp.links.get("next", {}).get("url")
+        while next_page:
+            resp = _get_results(next_page)
+            api_results.extend(resp.json())
+            next_page = resp.links.get("next", {}).get("url")
+        return api_results
+
+    def post_graphql(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        """Performs a GraphQL query, returning its data."""
+        resp = self.session.post(
+            self.graphql_url,
+            json={"query": query, "variables": variables},
+            timeout=self.timeout,
         )
         assert resp.status_code == 200, (
-            f"Resource {fetch_url} returned status code {resp.status_code}.\n{resp.text}"
+            f"GraphQL query returned status code {resp.status_code}.\n{resp.text}"
         )
+        result = resp.json()
+        if result.get("errors"):
+            messages = "\n".join(error["message"] for error in result["errors"])
+            raise RuntimeError(f"GraphQL query failed:\n{messages}")
+        return result["data"]
+
+    def get_graphql_nodes(
+        self, query: str, variables: Dict[str, Any], path: List[str]
+    ) -> List[Dict[str, Any]]:
+        """Fetches all nodes of a GraphQL connection, following its cursor page by page.
+
+        Args:
+            query: Query taking `first` and `after` variables for the connection.
+            variables: Other variables of the query.
+            path: Field names leading from the query data to the connection.
+        """
+        nodes: List[Dict[str, Any]] = []
+        cursor = None
+        while True:
+            data: Any = self.post_graphql(
+                query, {**variables, "first": GRAPHQL_PAGE_SIZE, "after": cursor}
+            )
+            for field in path:
+                data = data[field]
+                if data is None:
+                    raise RuntimeError(f"GraphQL query returned no {field}")
+            nodes.extend(data["nodes"])
+            if not data["pageInfo"]["hasNextPage"]:
+                return nodes
+            cursor = data["pageInfo"]["endCursor"]
+
+    def map(self, fn: Callable[[T], R], items: Iterable[T]) -> List[R]:
+        """Calls `fn` for each item concurrently, returning the results in order of the items.
+
+        Calls made from within `fn` run sequentially in the calling worker, since waiting
+        for other workers of the bounded pool could otherwise deadlock.
+        """
+        if getattr(self._local, "in_worker", False):
+            return [fn(item) for item in items]
+
+        def _call(item: T) -> R:
+            self._local.in_worker = True
+            try:
+                return fn(item)
+            finally:
+                self._local.in_worker = False
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return list(self._executor.map(_call, items))
+
+    def close(self) -> None:
+        if self._executor:
+            self._executor.shutdown()
+            self._executor = None
+        self.session.close()
+        if self.cache:
+            self.cache.close()
+
+
+_client: Optional[GitLabClient] = None
+
+
+def get_client() -> GitLabClient:
+    """Returns the shared client, created from the environment upon first use."""
+    global _client
+    if _client is None:
+        _client = GitLabClient()
+    return _client
+
+
+def set_client(client: GitLabClient) -> None:
+    """Replaces the shared client, e.g. for enabling the cache."""
+    global _client
+    _client = client
+
+
+def _is_commit_sha(ref: Optional[str]) -> bool:
+    return bool(ref and RE_COMMIT_SHA.fullmatch(ref))
+
+
+def _get_paginated_results(
+    url: str, params: Dict[str, Any], client: Optional[GitLabClient] = None
+) -> List[Any]:
+    return (client or get_client()).get_paginated(url, params)
+
+
+def get_commit_for_tag(repo_path: str, tag: str, client: Optional[GitLabClient] = None) -> str:
+    client = client or get_client()
+    url_encoded_repo_path = quote_plus(repo_path)
 
-        return resp.json(), resp.links.get("next", {}).get("url")
+    fetch_url = client.api_url + f"/projects/{url_encoded_repo_path}/repository/tags/{tag}"
+    # Tags are treated as immutable once created
+    return client.get_json(fetch_url, immutable=True)["commit"]["id"]
 
-    api_results, next_page = _get_results()
-    while next_page:
-        next_jobs, next_page = _get_results(next_page)
-        api_results.extend(next_jobs)
-    return api_results
 
+def get_commit_id(repo_path: str, ref: str, client: Optional[GitLabClient] = None) -> str:
+    """Returns the id of the commit which a branch, tag or commit SHA refers to."""
+    if _is_commit_sha(ref):
+        return ref
 
-def get_commit_for_tag(repo_path: str, tag: str) -> str:
+    client = client or get_client()
     url_encoded_repo_path = quote_plus(repo_path)
-
-    fetch_url = get_api_url() + f"/projects/{url_encoded_repo_path}/repository/tags/{tag}"
-    resp = requests.get(
-        fetch_url,
-        headers={"Authorization": f"Bearer {get_gitlab_token()}"},
-    )
-    assert resp.status_code == 200, (
-        f"Resource {fetch_url} returned status code {resp.status_code}.\n{resp.text}"
-    )
-    return resp.json()["commit"]["id"]
+    return client.get_json(
+        client.api_url + f"/projects/{url_encoded_repo_path}/repository/commits/{quote_plus(ref)}"
+    )["id"]
 
 
-def get_commits_for_ref(
-    repo_path: str, to_ref: Optional[str] = None, from_ref: Optional[str] = None
-) -> List[str]:
-    """Fetches all commit ids for given branch"""
+def fetch_commits_for_ref(
+    repo_path: str,
+    to_ref: Optional[str] = None,
+    from_ref: Optional[str] = None,
+    client: Optional[GitLabClient] = None,
+) -> List[Dict[str, Any]]:
+    """Fetches all commits for given branch, as returned by the Gitlab API"""
 
+    client = client or get_client()
     url_encoded_repo_path = quote_plus(repo_path)
 
-    params = {}
-    if from_ref or to_ref:
-        from_ref = from_ref or ""
-        to_ref = to_ref or ""
-        params["ref_name"] = f"{from_ref}...{to_ref}"
+    # The commits of a range between commit SHAs never change
+    immutable = _is_commit_sha(to_ref) and (not from_ref or _is_commit_sha(from_ref))
 
-    api_commits = _get_paginated_results(
-        get_api_url() + f"/projects/{url_encoded_repo_path}/repository/commits",
+    return client.get_paginated(
+        client.api_url + f"/projects/{url_encoded_repo_path}/repository/commits",
         {"ref_name": f"{from_ref}...{to_ref}" if from_ref else to_ref},
+        immutable=immutable,
     )
 
+
+def get_commits_for_ref(
+    repo_path: str,
+    to_ref: Optional[str] = None,
+    from_ref: Optional[str] = None,
+    client: Optional[GitLabClient] = None,
+) -> List[str]:
+    """Fetches all commit ids for given branch"""
+
+    api_commits = fetch_commits_for_ref(repo_path, to_ref, from_ref=from_ref, client=client)
+
     commits = [c["id"] for c in api_commits]
     return commits
 
 
-def fetch_mergerequests(repo_path: str) -> List[Dict[str, str]]:
+def _to_merge_request(mr: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        "merge_commit_sha": mr["merge_commit_sha"],
+        "title": mr["title"],
+        "merged_at": mr["merged_at"],
+        "author": mr["author"]["name"],
+        "reviewers": ",".join(sorted(r["name"] for r in mr["reviewers"])),
+        # Approvals need a request per merge request, so reviewers are taken as approvers
+        "approved_by": ",".join(sorted(r["name"] for r in mr["reviewers"])),
+    }
+
+
+def fetch_mergerequests(
+    repo_path: str, client: Optional[GitLabClient] = None, updated_after: Optional[str] = None
+) -> List[Dict[str, str]]:
+    """Fetches all merged merge requests, optionally only those updated after a given time."""
+    client = client or get_client()
     url_encoded_repo_path = quote_plus(repo_path)
 
-    api_mrs = _get_paginated_results(
-        get_api_url() + f"/projects/{url_encoded_repo_path}/merge_requests",
-        {
-            "state": "merged",
-        },
+    params = {"state": "merged"}
+    if updated_after:
+        params["updated_after"] = updated_after
+
+    api_mrs = client.get_paginated(
+        client.api_url + f"/projects/{url_encoded_repo_path}/merge_requests",
+        params,
     )
 
-    merge_requests = []
-    for mr in api_mrs:
-        merge_requests.append(
+    return [_to_merge_request(mr) for mr in api_mrs]
+
+
+def fetch_mergerequests_graphql(
+    repo_path: str,
+    client: Optional[GitLabClient] = None,
+    updated_after: Optional[str] = None,
+    iids: Optional[List[str]] = None,
+) -> List[Dict[str, str]]:
+    """Fetches merged merge requests with who approved them, using the GraphQL API.
+
+    A page of merge requests, including their reviewers and approvers, is fetched
+    with a single query, rather than with one request per merge request.
+
+    Args:
+        repo_path: Gitlab repository path.
+        client: Gitlab client. Default: The shared client.
+        updated_after: Only fetch merge requests updated after this time.
+        iids: Only fetch the merge requests with these internal IDs.
+    """
+    client = client or get_client()
+
+    variables: Dict[str, Any] = {"fullPath": repo_path, "updatedAfter": updated_after}
+    if iids is None:
+        batches = [variables]
+    else:
+        # Look up the given merge requests a page at a time
+        batches = [
+            {**variables, "iids": iids[i : i + GRAPHQL_PAGE_SIZE]}
+            for i in range(0, len(iids), GRAPHQL_PAGE_SIZE)
+        ]
+
+    api_mrs = [
+        mr
+        for batch in batches
+        for mr in client.get_graphql_nodes(
+            MERGE_REQUESTS_QUERY, batch, ["project", "mergeRequests"]
+        )
+    ]
+    return [
+        {
+            "merge_commit_sha": mr["mergeCommitSha"],
+            "title": mr["title"],
+            "merged_at": mr["mergedAt"],
+            "author": mr["author"]["name"],
+            "reviewers": ",".join(sorted(u["name"] for u in mr["reviewers"]["nodes"])),
+            "approved_by": ",".join(sorted(u["name"] for u in mr["approvedBy"]["nodes"])),
+        }
+        for mr in api_mrs
+    ]
+
+
+def _select_commit_mrs(
+    commits: List[str], all_api_mrs: Iterable[List[Dict[str, Any]]]
+) -> List[Dict[str, Any]]:
+    merge_requests: Dict[str, Dict[str, Any]] = {}
+    for sha, api_mrs in zip(commits, all_api_mrs):
+        for mr in api_mrs:
+            # Merge requests are also returned for the commits on their source branch
+            if mr["state"] == "merged" and mr["merge_commit_sha"] == sha:
+                merge_requests[sha] = mr
+    return list(merge_requests.values())
+
+
+def fetch_mergerequests_for_commits(
+    repo_path: str,
+    commits: List[str],
+    client: Optional[GitLabClient] = None,
+    mr_api: str = "rest",
+) -> List[Dict[str, str]]:
+    """Fetches the merged merge requests which were merged by the given commits.
+
+    Merge requests are looked up per commit, concurrently. With the `graphql` API,
+    the found merge requests are then fetched again in batches, including approvers.
+    """
+    client = client or get_client()
+    url_encoded_repo_path = quote_plus(repo_path)
+
+    def _get_commit_mrs(sha: str) -> List[Dict[str, Any]]:
+        return client.get_paginated(
+            client.api_url
+            + f"/projects/{url_encoded_repo_path}/repository/commits/{sha}/merge_requests",
+            {},
+        )
+
+    api_mrs = _select_commit_mrs(commits, client.map(_get_commit_mrs, commits))
+    if mr_api == "graphql":
+        return fetch_mergerequests_graphql(
+            repo_path, client, iids=[str(mr["iid"]) for mr in api_mrs]
+        )
+    return [_to_merge_request(mr) for mr in api_mrs]
+
+
+def fetch_mergerequests_for_range(
+    repo_path: str,
+    api_commits: List[Dict[str, Any]],
+    full_history: bool = False,
+    mr_lookup: str = "auto",
+    client: Optional[GitLabClient] = None,
+    mr_api: str = "rest",
+) -> List[Dict[str, str]]:
+    """Fetches merged merge requests, narrowing the query to a commit range.
+
+    Two lookups are supported:
+
+    - `list`: Lists merged merge requests. Unless the range covers the full history,
+        only merge requests updated after the oldest commit in the range are listed.
+    - `commits`: Looks up the merge requests of each merge commit in the range. Commits
+        are taken as merge commits if they have several parents, or if the parents
+        aren't known.
+
+    With `auto`, merge requests are looked up per commit if the range has at most
+    `MAX_COMMIT_LOOKUPS` merge commits, otherwise they are listed.
+
+    Args:
+        repo_path: Gitlab repository path.
+        api_commits: Commits in the range, as returned by `fetch_commits_for_ref`.
+        full_history: Whether the range covers the full history of the ref.
+        mr_lookup: One of `auto`, `list` or `commits`.
+        client: Gitlab client. Default: The shared client.
+        mr_api: API to fetch the merge requests with, `rest` or `graphql`. With `graphql`,
+            `approved_by` lists who approved each merge request, rather than its reviewers.
+
+    Returns:
+        Merged merge requests. These may include merge requests outside the range,
+        so the result still needs filtering against the commits.
+    """
+    mr_lookup, merge_commits, updated_after = _resolve_mr_lookup(
+        api_commits, full_history, mr_lookup, mr_api
+    )
+    if mr_lookup == "commits":
+        return fetch_mergerequests_for_commits(
+            repo_path, merge_commits, client=client, mr_api=mr_api
+        )
+    if mr_api == "graphql":
+        return fetch_mergerequests_graphql(repo_path, client=client, updated_after=updated_after)
+    return fetch_mergerequests(repo_path, client=client, updated_after=updated_after)
+
+
+def _resolve_mr_lookup(
+    api_commits: List[Dict[str, Any]], full_history: bool, mr_lookup: str, mr_api: str = "rest"
+) -> Tuple[str, List[str], Optional[str]]:
+    """Returns the lookup to use, the merge commits, and the time to list MRs updated after."""
+    if mr_lookup not in MR_LOOKUPS:
+        raise ValueError(f"Unknown merge request lookup '{mr_lookup}'")
+    if mr_api not in MR_APIS:
+        raise ValueError(f"Unknown merge request API '{mr_api}'")
+
+    merge_commits = [
+        c["id"] for c in api_commits if c.get("parent_ids") is None or len(c["parent_ids"]) > 1
+    ]
+    if mr_lookup == "auto":
+        use_commits = not full_history and len(merge_commits) <= MAX_COMMIT_LOOKUPS
+        mr_lookup = "commits" if use_commits else "list"
+
+    updated_after = None
+    commit_dates = [c["committed_date"] for c in api_commits if c.get("committed_date")]
+    if not full_history and commit_dates and len(commit_dates) == len(api_commits):
+        # A merge request is updated when merged, which is no earlier than the oldest
+        # commit in the range. Allow for clock skew between committers and Gitlab.
+        oldest = min(datetime.fromisoformat(d.replace("Z", "+00:00")) for d in commit_dates)
+        updated_after = (oldest - UPDATED_AFTER_MARGIN).isoformat()
+    return mr_lookup, merge_commits, updated_after
+
+
+def _is_job_selected(
+    name: str, job_names: Optional[List[str]] = None, job_regex: Optional[str] = None
+) -> bool:
+    if job_names and not any(
+        name == pattern or fnmatch.fnmatchcase(name, pattern) for pattern in job_names
+    ):
+        return False
+    if job_regex and not re.search(job_regex, name):
+        return False
+    return True
+
+
+def get_pipeline_jobs(
+    repo_path: str,
+    pipeline_id: int,
+    job_names: Optional[List[str]] = None,
+    client: Optional[GitLabClient] = None,
+    job_regex: Optional[str] = None,
+    include_downstream: bool = False,
+) -> List[Dict[str, Any]]:
+    """Fetches the finished jobs of a pipeline, optionally only those selected by name.
+
+    If several attempts of a job have the same name, only the latest one is included.
+    Jobs of downstream pipelines are named after the triggering (bridge) job, e.g.
+    `deploy/smoke-test` for job `smoke-test` in the pipeline triggered by `deploy`.
+    Each returned job also has the repository path of its project in `project_path`,
+    as downstream pipelines may belong to other projects.
+
+    Args:
+        repo_path: Gitlab repository path.
+        pipeline_id: ID of the pipeline.
+        job_names: Names or glob patterns of the jobs to include. Default is all jobs.
+        client: Gitlab client. Default: The shared client.
+        job_regex: Regex which the names of the jobs to include must contain a match for.
+        include_downstream: Whether to include jobs of downstream pipelines.
+
+    Returns:
+        The selected jobs, as returned by the Gitlab API.
+    """
+    client = client or get_client()
+
+    def _get_jobs(repo_path: str, pipeline_id: int, name_prefix: str) -> Iterator[Dict[str, Any]]:
+        url = client.api_url + f"/projects/{quote_plus(repo_path)}/pipelines/{str(pipeline_id)}"
+
+        api_jobs = client.get_paginated(
+            url + "/jobs",
             {
-                "merge_commit_sha": mr["merge_commit_sha"],
-                "title": mr["title"],
-                "merged_at": mr["merged_at"],
-                "author": mr["author"]["name"],
-                "approved_by": ",".join(sorted(r["name"] for r in mr["reviewers"])),
-            }
+                "scope": ["failed", "success"],
+            },
         )
-    return merge_requests
+        for job in api_jobs:
+            yield {**job, "name": name_prefix + job["name"], "project_path": repo_path}
+
+        if include_downstream:
+            for bridge in client.get_paginated(url + "/bridges", {}):
+                downstream = bridge.get("downstream_pipeline")
+                if downstream:
+                    yield from _get_jobs(
+                        str(downstream["project_id"]),
+                        downstream["id"],
+                        f"{name_prefix}{bridge['name']}/",
+                    )
+
+    return _select_latest_jobs(_get_jobs(repo_path, pipeline_id, ""), job_names, job_regex)
+
+
+def _select_latest_jobs(
+    jobs: Iterable[Dict[str, Any]],
+    job_names: Optional[List[str]] = None,
+    job_regex: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    # Select the jobs before downloading anything, keeping the latest attempt per name
+    selected: Dict[str, Dict[str, Any]] = {}
+    for job in jobs:
+        if not _is_job_selected(job["name"], job_names, job_regex):
+            continue
+        if job["name"] not in selected or job["id"] > selected[job["name"]]["id"]:
+            selected[job["name"]] = job
+    return list(selected.values())
+
+
+def iter_job_trace(
+    repo_path: str,
+    job_id: int,
+    client: Optional[GitLabClient] = None,
+    chunk_size: int = TRACE_CHUNK_SIZE,
+) -> Iterator[str]:
+    """Streams the trace (log) of a job, yielding it in decoded chunks."""
+    client = client or get_client()
+    url_encoded_repo_path = quote_plus(repo_path)
+
+    # Only finished jobs are listed, so their traces never change
+    with client.get(
+        client.api_url + f"/projects/{url_encoded_repo_path}/jobs/{str(job_id)}/trace",
+        immutable=True,
+        stream=True,
+    ) as resp:
+        if resp.status_code != 200:
+            raise RuntimeError(f"Failed to obtain log for job {job_id}")
+
+        decoder = codecs.getincrementaldecoder(resp.encoding or "utf-8")(errors="replace")
+        for chunk in resp.iter_content(chunk_size):
+            yield decoder.decode(chunk)
+        yield decoder.decode(b"", final=True)
 
 
 def get_pipeline_logs(
-    repo_path: str, pipeline_id: int, job_names: Optional[List[str]] = None
+    repo_path: str,
+    pipeline_id: int,
+    job_names: Optional[List[str]] = None,
+    client: Optional[GitLabClient] = None,
 ) -> Dict[str, str]:
-    url_encoded_repo_path = quote_plus(repo_path)
+    client = client or get_client()
+    jobs = get_pipeline_jobs(repo_path, pipeline_id, job_names=job_names, client=client)
 
-    api_jobs = _get_paginated_results(
-        get_api_url() + f"/projects/{url_encoded_repo_path}/pipelines/{str(pipeline_id)}/jobs",
-        {
-            "scope": ["failed", "success"],
-        },
-    )
+    def _get_trace(job: Dict[str, Any]) -> str:
+        return "".join(iter_job_trace(job["project_path"], job["id"], client=client))
 
     logs: Dict[str, str] = {}
-    for job in api_jobs:
-        if job_names and job["name"] not in job_names:
-            continue
-
-        resp = requests.get(
-            get_api_url() + f"/projects/{url_encoded_repo_path}/jobs/{str(job['id'])}/trace",
-            headers={"Authorization": f"Bearer {get_gitlab_token()}"},
-        )
-        if resp.status_code != 200:
-            raise RuntimeError(f"Failed to obtain log for job {job['id']}")
-
-        logs[job["name"]] = resp.text
+    for job, trace in zip(jobs, client.map(_get_trace, jobs)):
+        logs[job["name"]] = trace
 
     return logs
@@ -0,0 +1,153 @@
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+from . import gitlab
+from .gitlab import GitLabClient, get_client
+
+R = TypeVar("R")
+
+
+class AsyncGitLabClient:
+    """Asyncio client for the Gitlab REST API, for overlapping independent fetches.
+
+    Requests are made by a `GitLabClient` in worker threads, so its pooled session,
+    retries and cache are shared with synchronous code. At most `max_concurrency`
+    fetches run at a time, however many are awaited concurrently. The requests of
+    all fetches together are bounded by the `max_workers` of the client.
+
+    Args:
+        client: Client making the requests. Default: The shared client.
+        max_concurrency: Maximum number of concurrent fetches.
+            Default: `max_workers` of the client.
+    """
+
+    def __init__(
+        self, client: Optional[GitLabClient] = None, max_concurrency: Optional[int] = None
+    ):
+        self.client = client or get_client()
+        self.api_url = self.client.api_url
+        self._semaphore = asyncio.Semaphore(max_concurrency or self.client.max_workers)
+
+    async def run(self, fn: Callable[..., R], *args, **kwargs) -> R:
+        """Runs a blocking call, such as a request, in a worker thread once a slot is free."""
+        async with self._semaphore:
+            return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+# Each fetch runs the synchronous version in a worker thread. Pages and per-commit
+# lookups are still fetched concurrently by the `GitLabClient` pool, while awaiting
+# several fetches together overlaps them with each other.
+
+
+async def get_commit_for_tag(
+    repo_path: str, tag: str, client: Optional[AsyncGitLabClient] = None
+) -> str:
+    """See `nydok.gitlab.get_commit_for_tag`."""
+    client = client or AsyncGitLabClient()
+    return await client.run(gitlab.get_commit_for_tag, repo_path, tag, client=client.client)
+
+
+async def fetch_commits_for_ref(
+    repo_path: str,
+    to_ref: Optional[str] = None,
+    from_ref: Optional[str] = None,
+    client: Optional[AsyncGitLabClient] = None,
+) -> List[Dict[str, Any]]:
+    """See `nydok.gitlab.fetch_commits_for_ref`."""
+    client = client or AsyncGitLabClient()
+    return await client.run(
+        gitlab.fetch_commits_for_ref, repo_path, to_ref, from_ref, client=client.client
+    )
+
+
+async def get_commits_for_ref(
+    repo_path: str,
+    to_ref: Optional[str] = None,
+    from_ref: Optional[str] = None,
+    client: Optional[AsyncGitLabClient] = None,
+) -> List[str]:
+    """See `nydok.gitlab.get_commits_for_ref`."""
+    client = client or AsyncGitLabClient()
+    return await client.run(
+        gitlab.get_commits_for_ref, repo_path, to_ref, from_ref, client=client.client
+    )
+
+
+async def fetch_mergerequests(
+    repo_path: str,
+    client: Optional[AsyncGitLabClient] = None,
+    updated_after: Optional[str] = None,
+) -> List[Dict[str, str]]:
+    """See `nydok.gitlab.fetch_mergerequests`."""
+    client = client or AsyncGitLabClient()
+    return await client.run(
+        gitlab.fetch_mergerequests, repo_path, client=client.client, updated_after=updated_after
+    )
+
+
+async def fetch_mergerequests_graphql(
+    repo_path: str,
+    client: Optional[AsyncGitLabClient] = None,
+    updated_after: Optional[str] = None,
+    iids: Optional[List[str]] = None,
+) -> List[Dict[str, str]]:
+    """See `nydok.gitlab.fetch_mergerequests_graphql`."""
+    client = client or AsyncGitLabClient()
+    return await client.run(
+        gitlab.fetch_mergerequests_graphql, repo_path, client.client, updated_after, iids
+    )
+
+
+async def fetch_mergerequests_for_range(
+    repo_path: str,
+    api_commits: List[Dict[str, Any]],
+    full_history: bool = False,
+    mr_lookup: str = "auto",
+    client: Optional[AsyncGitLabClient] = None,
+    mr_api: str = "rest",
+) -> List[Dict[str, str]]:
+    """See `nydok.gitlab.fetch_mergerequests_for_range`."""
+    client = client or AsyncGitLabClient()
+    return await client.run(
+        gitlab.fetch_mergerequests_for_range,
+        repo_path,
+        api_commits,
+        full_history=full_history,
+        mr_lookup=mr_lookup,
+        client=client.client,
+        mr_api=mr_api,
+    )
+
+
+async def get_pipeline_jobs(
+    repo_path: str,
+    pipeline_id: int,
+    job_names: Optional[List[str]] = None,
+    client: Optional[AsyncGitLabClient] = None,
+    job_regex: Optional[str] = None,
+    include_downstream: bool = False,
+) -> List[Dict[str, Any]]:
+    """See `nydok.gitlab.get_pipeline_jobs`."""
+    client = client or AsyncGitLabClient()
+    return await client.run(
+        gitlab.get_pipeline_jobs,
+        repo_path,
+        pipeline_id,
+        job_names=job_names,
+        client=client.client,
+        job_regex=job_regex,
+        include_downstream=include_downstream,
+    )
+
+
+async def get_pipeline_logs(
+    repo_path: str,
+    pipeline_id: int,
+    job_names: Optional[List[str]] = None,
+    client: Optional[AsyncGitLabClient] = None,
+) -> Dict[str, str]:
+    """See `nydok.gitlab.get_pipeline_logs`."""
+    client = client or AsyncGitLabClient()
+    return await client.run(
+        gitlab.get_pipeline_logs, repo_path, pipeline_id, job_names=job_names, client=client.client
+    )
@@ -0,0 +1,280 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import BinaryIO, Optional, Tuple
+
+import requests  # type: ignore
+from requests.structures import CaseInsensitiveDict  # type: ignore
+from requests.utils import get_encoding_from_headers  # type: ignore
+
+CACHE_FILE_NAME = "http-cache.sqlite"
+# Directory next to the database for the bodies of streamed responses
+BODIES_DIR_NAME = "bodies"
+DEFAULT_MAX_SIZE = 1024**3
+# Size of the chunks which streamed bodies are copied in
+CHUNK_SIZE = 64 * 1024
+# Caches written with another version of the schema are discarded
+CACHE_VERSION = 3
+
+CACHE_SCHEMA = f"""
+DROP TABLE IF EXISTS responses;
+CREATE TABLE responses (
+    key TEXT PRIMARY KEY,
+    headers TEXT NOT NULL,
+    body BLOB,
+    body_file TEXT,
+    etag TEXT,
+    immutable INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX responses_last_access ON responses (last_access);
+PRAGMA user_version = {CACHE_VERSION};
+"""
+
+
+class _BodyFile:
+    """Stands in for `Response.raw`, streaming a cached body from a file.
+
+    The file is closed once read to the end, or when the response is closed.
+    """
+
+    def __init__(self, f: BinaryIO):
+        self._file = f
+
+    def read(self, size: int = -1) -> bytes:
+        if self._file.closed:
+            return b""
+        data = self._file.read(size)
+        if not data:
+            self._file.close()
+        return data
+
+    def close(self) -> None:
+        self._file.close()
+
+    release_conn = close
+
+
+class HttpCache:
+    """Persistent cache of successful HTTP GET responses, stored in a SQLite database.
+
+    Responses for immutable resources, such as finished job traces, are used without
+    contacting the server. Other responses are stored with their `ETag`, and revalidated
+    using `If-None-Match`. Responses without an `ETag` aren't cached, unless immutable.
+    When the total size of the bodies exceeds `max_size`, the least recently used
+    responses are evicted.
+
+    Responses are stored per URL, which includes the host, and per credentials, so a
+    cache shared between jobs never serves a response to a token it wasn't fetched with.
+    Only a hash of the credentials is stored.
+
+    Bodies of streamed requests, such as job traces, are copied to a file per response
+    a chunk at a time, and the response then streams the body from that file. Other
+    bodies are stored in the database. The cache can be shared between threads.
+
+    Args:
+        cache_dir: Directory to store the cache in. Created if it doesn't exist.
+        max_size: Maximum total size of cached response bodies, in bytes.
+    """
+
+    def __init__(self, cache_dir: Path, max_size: int = DEFAULT_MAX_SIZE):
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self._bodies_dir = cache_dir / BODIES_DIR_NAME
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(
+            cache_dir / CACHE_FILE_NAME, check_same_thread=False, isolation_level=None
+        )
+        (version,) = self._con.execute("PRAGMA user_version").fetchone()
+        if version != CACHE_VERSION:
+            self._con.executescript(CACHE_SCHEMA)
+            shutil.rmtree(self._bodies_dir, ignore_errors=True)
+        self._bodies_dir.mkdir(exist_ok=True)
+        # Kept up to date when storing and evicting, so the table is only summed once
+        (self._total_size,) = self._con.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+
+    @staticmethod
+    def _get_key(session: requests.Session, url: str, headers: dict) -> str:
+        authorization = headers.get("Authorization") or session.headers.get("Authorization") or ""
+        credentials = hashlib.sha256(str(authorization).encode()).hexdigest()
+        return f"{credentials} {url}"
+
+    def get(self, session: requests.Session, url: str, immutable: bool = False, **kwargs):
+        """Performs a GET request through the cache.
+
+        Args:
+            session: Session to perform the request with, if needed.
+            url: Fully prepared URL, including any query string.
+            immutable: Whether the resource never changes once it exists.
+            kwargs: Passed on to `session.get`.
+
+        Returns:
+            The `requests.Response`, either from the server or reconstructed from the cache.
+        """
+        headers = dict(kwargs.pop("headers", None) or {})
+        key = self._get_key(session, url, headers)
+        with self._lock:
+            row = self._con.execute(
+                "SELECT headers, body, body_file, etag, immutable FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+
+        cached = None
+        if row:
+            cached_headers, body, body_file, etag, cached_immutable = row
+            cached = self._to_response(url, cached_headers, body, body_file)
+        if cached is not None:
+            if cached_immutable:
+                self._touch(key)
+                return cached
+            headers["If-None-Match"] = etag
+
+        resp = session.get(url, headers=headers, **kwargs)
+        if cached is not None and resp.status_code == 304:
+            resp.close()
+            self._touch(key)
+            return cached
+        if cached is not None:
+            cached.close()
+
+        etag = resp.headers.get("ETag")
+        if resp.status_code == 200 and (immutable or etag):
+            if kwargs.get("stream"):
+                return self._store_streamed(key, url, resp, etag, immutable)
+            self._store(key, resp.headers, resp.content, None, etag, immutable)
+        return resp
+
+    def _touch(self, key: str) -> None:
+        with self._lock:
+            self._con.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+
+    def _get_body_path(self, key: str) -> Path:
+        return self._bodies_dir / hashlib.sha256(key.encode()).hexdigest()
+
+    def _store_streamed(
+        self,
+        key: str,
+        url: str,
+        resp: requests.Response,
+        etag: Optional[str],
+        immutable: bool,
+    ) -> requests.Response:
+        # Copy the body to a file a chunk at a time, rather than reading it into memory
+        size = 0
+        with resp, tempfile.NamedTemporaryFile(dir=self._bodies_dir, delete=False) as f:
+            for chunk in resp.raw.stream(CHUNK_SIZE, decode_content=True):
+                f.write(chunk)
+                size += len(chunk)
+
+        if size > self.max_size:
+            body = open(f.name, "rb")
+            # Removed once closed, or right away where open files can be removed
+            try:
+                os.unlink(f.name)
+            except OSError:
+                pass
+            return self._to_file_response(url, resp.headers, body)
+
+        body_path = self._get_body_path(key)
+        os.replace(f.name, body_path)
+        self._store(key, resp.headers, None, (body_path.name, size), etag, immutable)
+        return self._to_file_response(url, resp.headers, open(body_path, "rb"))
+
+    def _store(
+        self,
+        key: str,
+        headers: CaseInsensitiveDict,
+        body: Optional[bytes],
+        body_file: Optional[Tuple[str, int]],
+        etag: Optional[str],
+        immutable: bool,
+    ) -> None:
+        file_name, size = body_file if body_file else (None, len(body or b""))
+        if size > self.max_size:
+            return
+
+        with self._lock:
+            replaced = self._con.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self._con.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    json.dumps(dict(headers)),
+                    body,
+                    file_name,
+                    etag,
+                    int(immutable),
+                    size,
+                    time.time(),
+                ),
+            )
+            self._total_size += size - (replaced[0] if replaced else 0)
+            if self._total_size > self.max_size:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Delete least recently used responses until within the size limit, reading
+        # them in order of last access only as far as needed
+        to_delete = []
+        with closing(
+            self._con.execute("SELECT key, body_file, size FROM responses ORDER BY last_access")
+        ) as cursor:
+            for key, body_file, size in cursor:
+                if self._total_size <= self.max_size:
+                    break
+                to_delete.append((key, body_file))
+                self._total_size -= size
+        self._con.executemany("DELETE FROM responses WHERE key = ?", [(k,) for k, _ in to_delete])
+        for _, body_file in to_delete:
+            if body_file:
+                (self._bodies_dir / body_file).unlink(missing_ok=True)
+
+    def _to_response(
+        self, url: str, headers: str, body: Optional[bytes], body_file: Optional[str]
+    ) -> Optional[requests.Response]:
+        """Returns a cached response, or None if its body file no longer exists."""
+        if body_file is None:
+            resp = self._create_response(url, CaseInsensitiveDict(json.loads(headers)))
+            resp._content = body
+            resp._content_consumed = True
+            return resp
+        try:
+            raw = open(self._bodies_dir / body_file, "rb")
+        except FileNotFoundError:
+            return None
+        return self._to_file_response(url, CaseInsensitiveDict(json.loads(headers)), raw)
+
+    def _to_file_response(
+        self, url: str, headers: CaseInsensitiveDict, raw: BinaryIO
+    ) -> requests.Response:
+        resp = self._create_response(url, headers)
+        # The body is already decoded, so it's read as is by `iter_content`
+        resp.headers.pop("Content-Encoding", None)
+        resp.raw = _BodyFile(raw)
+        return resp
+
+    @staticmethod
+    def _create_response(url: str, headers: CaseInsensitiveDict) -> requests.Response:
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.url = url
+        resp.headers = headers
+        resp.encoding = get_encoding_from_headers(resp.headers)
+        return resp
+
+    def close(self) -> None:
+        self._con.close()
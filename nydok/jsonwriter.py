@@ -0,0 +1,136 @@
+import dataclasses
+import json
+from json.encoder import encode_basestring_ascii  # type: ignore[attr-defined]
+from typing import Any, Dict, Mapping, TextIO, Tuple
+
+from .schema import DataclassJsonEncoder
+
+INDENT = " " * 4
+
+# Line break and indentation for each nesting level
+_NEW_LINES = ["\n" + INDENT * level for level in range(16)]
+# Names and encoded keys of the fields of each dataclass
+_FIELD_KEYS: Dict[type, Tuple[Tuple[str, str], ...]] = {}
+
+
+def _new_line(level: int) -> str:
+    if level < len(_NEW_LINES):
+        return _NEW_LINES[level]
+    return "\n" + INDENT * level
+
+
+def _encode_fallback(o: Any, level: int) -> str:
+    # Line breaks in JSON output are only ever between items, so nesting the output
+    # is a matter of indenting each line
+    return json.dumps(o, cls=DataclassJsonEncoder, indent=4).replace("\n", _new_line(level))
+
+
+def _encode_list(o: Any, level: int) -> str:
+    if not o:
+        return "[]"
+    new_line = _new_line(level + 1)
+    return (
+        "["
+        + new_line
+        + ("," + new_line).join([_encode(item, level + 1) for item in o])
+        + _new_line(level)
+        + "]"
+    )
+
+
+def _encode_dict(o: Mapping[Any, Any], level: int) -> str:
+    if not o:
+        return "{}"
+    if not all(isinstance(key, str) for key in o):
+        # Other keys are converted to strings, which is left to the json module
+        return _encode_fallback(o, level)
+    new_line = _new_line(level + 1)
+    return (
+        "{"
+        + new_line
+        + ("," + new_line).join(
+            [
+                f"{encode_basestring_ascii(key)}: {_encode(value, level + 1)}"
+                for key, value in o.items()
+            ]
+        )
+        + _new_line(level)
+        + "}"
+    )
+
+
+def _encode_dataclass(o: Any, level: int) -> str:
+    field_keys = _FIELD_KEYS.get(type(o))
+    if field_keys is None:
+        field_keys = _FIELD_KEYS[type(o)] = tuple(
+            (f.name, encode_basestring_ascii(f.name) + ": ") for f in dataclasses.fields(o)
+        )
+    if not field_keys:
+        return "{}"
+    new_line = _new_line(level + 1)
+    return (
+        "{"
+        + new_line
+        + ("," + new_line).join(
+            [key + _encode(getattr(o, name), level + 1) for name, key in field_keys]
+        )
+        + _new_line(level)
+        + "}"
+    )
+
+
+def _encode(o: Any, level: int) -> str:
+    # Checked in the same order as by the json module, so values encode the same
+    if isinstance(o, str):
+        return encode_basestring_ascii(o)
+    if o is None:
+        return "null"
+    if o is True:
+        return "true"
+    if o is False:
+        return "false"
+    if isinstance(o, int):
+        return int.__repr__(o)
+    if isinstance(o, (list, tuple)):
+        return _encode_list(o, level)
+    if isinstance(o, dict):
+        return _encode_dict(o, level)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return _encode_dataclass(o, level)
+    return _encode_fallback(o, level)
+
+
+def dump(document: Mapping[str, Any], sink: TextIO) -> None:
+    """Writes a results document as JSON, one record at a time.
+
+    The output is identical to `json.dumps(document, cls=DataclassJsonEncoder, indent=4)`,
+    but dataclasses are encoded field by field, rather than first being deep copied into
+    dictionaries by `dataclasses.asdict`. Sections which are mappings, such as the test
+    cases, are written to the sink record by record, so the document as a whole is never
+    held in memory.
+
+    Args:
+        document: Results sections, given their names.
+        sink: Text stream to write to.
+    """
+    if not document:
+        sink.write("{}")
+        return
+
+    separator = "{" + _new_line(1)
+    for name, section in document.items():
+        sink.write(f"{separator}{encode_basestring_ascii(name)}: ")
+        separator = "," + _new_line(1)
+
+        if not (
+            isinstance(section, dict) and section and all(isinstance(key, str) for key in section)
+        ):
+            sink.write(_encode(section, 1))
+            continue
+
+        record_separator = "{" + _new_line(2)
+        for key, record in section.items():
+            sink.write(f"{record_separator}{encode_basestring_ascii(key)}: {_encode(record, 2)}")
+            record_separator = "," + _new_line(2)
+        sink.write(_new_line(1) + "}")
+    sink.write("\n}")
@@ -0,0 +1,278 @@
+import fnmatch
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Iterable, Iterator, List, Optional
+
+RE_ANSI = re.compile(r"\x1B\[[0-9;]*[ABCDEFGHJKSTfmnsulh]")
+# An escape sequence which may be completed by the following text
+RE_PARTIAL_ANSI = re.compile(r"\x1B(\[[0-9;]*)?")
+# Gitlab collapsible section markers, once ANSI escape sequences are removed. Markers
+# start a line or follow a carriage return, as the end of a section and the start of
+# the next one are often written on the same line.
+RE_SECTION_MARKER = re.compile(r"(?:^|(?<=\r))section_(?P<kind>start|end):\d+:(?P<name>[^\[\r\n]+)")
+
+LOG_MODES = ("full", "head-tail", "matches", "sections")
+# Lines considered as failures, if no other patterns are given
+DEFAULT_LOG_PATTERNS = [r"(?i)\b(error|errors|fail|failed|failure|exception|traceback)\b"]
+
+
+@dataclass
+class LogOptions:
+    """Options for which parts of job logs to include in the pipeline logs report.
+
+    Attributes:
+        mode: One of
+            - `full`: The full logs.
+            - `head-tail`: The first and last `lines` lines.
+            - `matches`: Lines matching any of `patterns`, with `context` lines around them.
+            - `sections`: Gitlab collapsible sections with names matching any of `sections`.
+        lines: Number of lines to keep at the start and the end, for `head-tail`.
+        context: Number of lines to keep before and after each match, for `matches`.
+        patterns: Regexes for `matches`. Default is lines indicating failures.
+        sections: Glob patterns of section names, for `sections`.
+        artifacts_dir: Directory to write the full logs to, compressed, if given.
+        artifacts_link: Path or URL of `artifacts_dir` to link to from the report.
+            Default is `artifacts_dir`.
+    """
+
+    mode: str = "full"
+    lines: int = 100
+    context: int = 10
+    patterns: List[str] = field(default_factory=lambda: list(DEFAULT_LOG_PATTERNS))
+    sections: List[str] = field(default_factory=lambda: ["*"])
+    artifacts_dir: Optional[str] = None
+    artifacts_link: Optional[str] = None
+
+    def __post_init__(self):
+        if self.mode not in LOG_MODES:
+            raise ValueError(f"Unknown log mode '{self.mode}'")
+
+
+class AnsiStripper:
+    """Removes ANSI escape sequences from text given in chunks.
+
+    A chunk may end in the middle of an escape sequence, in which case the start of the
+    sequence is held back until the next chunk.
+    """
+
+    def __init__(self):
+        self._pending = ""
+
+    def feed(self, text: str) -> str:
+        text = self._pending + text
+        self._pending = ""
+
+        esc_pos = text.rfind("\x1b")
+        if esc_pos != -1 and RE_PARTIAL_ANSI.fullmatch(text, esc_pos):
+            text, self._pending = text[:esc_pos], text[esc_pos:]
+        return RE_ANSI.sub("", text)
+
+    def flush(self) -> str:
+        text, self._pending = self._pending, ""
+        return RE_ANSI.sub("", text)
+
+
+def _overwrite_line(line: str) -> str:
+    # Keep the text after the last carriage return which is followed by more text.
+    # Unlike a terminal, text written before it is dropped entirely, even where the new
+    # text is shorter. Progress bars clear the line before redrawing it anyway, using an
+    # escape sequence which is removed with the others before this point.
+    # Trailing carriage returns are kept, as text may still follow them.
+    text = line.rstrip("\r")
+    return text[text.rfind("\r") + 1 :] + line[len(text) :]
+
+
+class LogSanitizer:
+    """Converts a log, given in chunks, to HTML for embedding in the report.
+
+    Each chunk goes through the following steps:
+
+    - ANSI escape sequences are removed.
+    - Of text overwritten using carriage returns, only the text after the last one
+        is kept, showing the final state of progress bars and similar.
+    - `&`, `<` and `>` are HTML escaped.
+    - Line breaks are converted to `<br>`.
+
+    As carriage returns affect the whole line, the last, incomplete line of a chunk is
+    held back until its end is known. Overwritten text is removed from it as more of
+    it arrives, so memory use is bounded by the longest text between carriage returns.
+
+    Args:
+        strip_ansi: Whether to remove ANSI escape sequences. Can be disabled if the
+            text is already stripped.
+    """
+
+    def __init__(self, strip_ansi: bool = True):
+        self._ansi_stripper = AnsiStripper() if strip_ansi else None
+        self._pending = ""
+
+    def _convert(self, text: str) -> str:
+        text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+        lines = text.split("\n")
+        if "\r" in text:
+            lines = [_overwrite_line(line) if "\r" in line else line for line in lines]
+            return "<br>".join(lines).replace("\r", "")
+        return "<br>".join(lines)
+
+    def feed(self, text: str) -> str:
+        if self._ansi_stripper:
+            text = self._ansi_stripper.feed(text)
+        text = self._pending + text
+        line_end = text.rfind("\n") + 1
+        text, self._pending = text[:line_end], text[line_end:]
+        if "\r" in self._pending:
+            self._pending = _overwrite_line(self._pending)
+        return self._convert(text)
+
+    def flush(self) -> str:
+        text = self._pending
+        if self._ansi_stripper:
+            text += self._ansi_stripper.flush()
+        self._pending = ""
+        return self._convert(text)
+
+
+def iter_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """Splits text given in chunks into lines, keeping the line breaks."""
+    pending = ""
+    for chunk in chunks:
+        lines = (pending + chunk).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    if pending:
+        yield pending
+
+
+def _omitted(no_lines: int) -> str:
+    return f"[... {no_lines} lines omitted ...]\n"
+
+
+class LogFilter:
+    """Selects the lines of a log to include in the report, keeping the full log."""
+
+    def feed(self, line: str) -> Iterator[str]:
+        yield line
+
+    def finish(self) -> Iterator[str]:
+        yield from ()
+
+
+class HeadTailLogFilter(LogFilter):
+    """Keeps the first and last `lines` lines of a log."""
+
+    def __init__(self, lines: int):
+        self.lines = lines
+        self._no_lines = 0
+        self._tail: Deque[str] = deque(maxlen=lines)
+
+    def feed(self, line: str) -> Iterator[str]:
+        self._no_lines += 1
+        if self._no_lines <= self.lines:
+            yield line
+        else:
+            self._tail.append(line)
+
+    def finish(self) -> Iterator[str]:
+        omitted = self._no_lines - self.lines - len(self._tail)
+        if omitted > 0:
+            yield _omitted(omitted)
+        yield from self._tail
+
+
+class MatchLogFilter(LogFilter):
+    """Keeps the lines matching any of the patterns, with `context` lines around them."""
+
+    def __init__(self, patterns: List[str], context: int):
+        self.patterns = [re.compile(p) for p in patterns]
+        self.context = context
+        self._before: Deque[str] = deque(maxlen=context)
+        self._after = 0
+        self._omitted = 0
+
+    def feed(self, line: str) -> Iterator[str]:
+        if any(p.search(line) for p in self.patterns):
+            omitted = self._omitted - len(self._before)
+            if omitted > 0:
+                yield _omitted(omitted)
+            yield from self._before
+            yield line
+            self._before.clear()
+            self._omitted = 0
+            self._after = self.context
+        elif self._after > 0:
+            self._after -= 1
+            yield line
+        else:
+            self._before.append(line)
+            self._omitted += 1
+
+    def finish(self) -> Iterator[str]:
+        if self._omitted > 0:
+            yield _omitted(self._omitted)
+
+
+class SectionLogFilter(LogFilter):
+    """Keeps the Gitlab collapsible sections with names matching any of the glob patterns.
+
+    Nested sections are kept if they, or any of their enclosing sections, match.
+    """
+
+    def __init__(self, sections: List[str]):
+        self.sections = sections
+        # Names of the currently open sections, and whether each is kept
+        self._open: List[str] = []
+        self._kept: List[bool] = []
+        self._omitted = 0
+
+    def _keep(self) -> bool:
+        return bool(self._kept) and self._kept[-1]
+
+    def feed(self, line: str) -> Iterator[str]:
+        # The line is kept if any part of it is within a kept section
+        keep = self._keep()
+        for marker in RE_SECTION_MARKER.finditer(line):
+            name = marker["name"]
+            if marker["kind"] == "start":
+                self._open.append(name)
+                self._kept.append(
+                    self._keep() or any(fnmatch.fnmatchcase(name, p) for p in self.sections)
+                )
+                keep = keep or self._keep()
+            elif name in self._open:
+                # Close the section, and any sections left open within it
+                while self._open.pop() != name:
+                    self._kept.pop()
+                self._kept.pop()
+
+        if keep:
+            if self._omitted:
+                yield _omitted(self._omitted)
+                self._omitted = 0
+            yield line
+        else:
+            self._omitted += 1
+
+    def finish(self) -> Iterator[str]:
+        if self._omitted > 0:
+            yield _omitted(self._omitted)
+
+
+def create_log_filter(options: LogOptions) -> LogFilter:
+    if options.mode == "head-tail":
+        return HeadTailLogFilter(options.lines)
+    if options.mode == "matches":
+        return MatchLogFilter(options.patterns, options.context)
+    if options.mode == "sections":
+        return SectionLogFilter(options.sections)
+    return LogFilter()
+
+
+def get_artifact_name(job_name: str, job_id: int) -> str:
+    """Returns the file name of the compressed full log of a job.
+
+    The job ID keeps the name unique, also for job names differing only in characters
+    which aren't allowed in file names, such as `deploy/test` and `deploy_test`.
+    """
+    return re.sub(r"[^\w.-]+", "_", job_name) + f"-{job_id}.log.gz"
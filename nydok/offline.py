@@ -0,0 +1,143 @@
+import json
+import re
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .commitrange import CommitRange, _git, _is_complete_clone, _local_clone_error
+from .gitlab import _to_merge_request
+
+# Fields of each commit: id, parent ids, committer date, author name and message
+GIT_LOG_FORMAT = "%H%x00%P%x00%cI%x00%an%x00%B%x1e"
+
+# Reference to the merge request in merge commits created by Gitlab
+RE_MERGE_REQUEST_REF = re.compile(r"^See merge request (?P<reference>\S+![0-9]+)\s*$", re.M)
+# Trailers added by the `%{approved_by}` variable of Gitlab merge commit templates
+RE_APPROVED_BY = re.compile(r"^Approved-by: (?P<name>.+?)(?: <[^<>]*>)?\s*$", re.M)
+
+
+def _to_utc(date: str) -> str:
+    # Committer dates keep the committer's UTC offset, while Gitlab returns dates in UTC.
+    # Use Gitlab's format, so dates from both sources sort and display alike.
+    utc_date = datetime.fromisoformat(date).astimezone(timezone.utc)
+    return utc_date.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def _parse_merge_commit(
+    commit: Dict[str, Any], message: str, authors: Dict[str, str]
+) -> Optional[Dict[str, str]]:
+    # Gitlab's default merge commit message is the subject, the merge request title,
+    # any closed issues, and the merge request reference, separated by empty lines
+    if not RE_MERGE_REQUEST_REF.search(message):
+        return None
+    paragraphs = [p.strip() for p in message.strip().split("\n\n")]
+    has_title = len(paragraphs) > 2 and not RE_MERGE_REQUEST_REF.match(paragraphs[1])
+    title = paragraphs[1] if has_title else paragraphs[0]
+
+    # The merged branch is the second parent, and its last commit is the closest
+    # to the merge request author available in the history
+    source_commit = commit["parent_ids"][1]
+    return {
+        "merge_commit_sha": commit["id"],
+        "title": " ".join(title.splitlines()),
+        "merged_at": _to_utc(commit["committed_date"]),
+        "author": authors.get(source_commit, commit["author_name"]),
+        "reviewers": "",
+        "approved_by": ",".join(sorted(RE_APPROVED_BY.findall(message))),
+    }
+
+
+def load_mergerequest_dump(path: Path) -> Dict[str, Dict[str, str]]:
+    """Loads merge requests exported from the Gitlab API, by the commit which merged them.
+
+    The file contains a JSON list of merge requests as returned by the Gitlab REST API,
+    e.g. from `/projects/:id/merge_requests?state=merged`. Merge requests may also have
+    an `approved_by` list, as returned by `/projects/:id/merge_requests/:iid/approvals`,
+    in which case the approvers are used rather than the reviewers.
+
+    Merge requests merged without a merge commit are taken as merged by their squash
+    commit if squashed, and otherwise, for fast-forward merges, by the last commit of
+    their source branch. That commit is reported as their `merge_commit_sha`.
+    """
+    merge_requests = {}
+    for mr in json.loads(path.read_text()):
+        sha = mr.get("merge_commit_sha") or mr.get("squash_commit_sha") or mr.get("sha")
+        if not sha:
+            continue
+        merge_request = _to_merge_request({**mr, "merge_commit_sha": sha})
+        if "approved_by" in mr:
+            merge_request["approved_by"] = ",".join(
+                sorted(a["user"]["name"] for a in mr["approved_by"])
+            )
+        merge_requests[sha] = merge_request
+    return merge_requests
+
+
+def get_local_mergerequests(
+    git_dir: str = ".",
+    to_ref: Optional[str] = None,
+    from_ref: Optional[str] = None,
+    mr_dump: Optional[Path] = None,
+) -> Tuple[CommitRange, List[Dict[str, str]]]:
+    """Derives the merge requests of a commit range from a local clone, without Gitlab.
+
+    Merge requests are taken from the merge commits created by Gitlab, which reference
+    their merge request. Approvers are taken from `Approved-by` trailers, which Gitlab
+    adds if the project's merge commit template has `%{approved_by}`. Merge requests
+    from `mr_dump` take precedence, and also cover squashed and fast-forward merges.
+
+    Args:
+        git_dir: Directory of a complete (not shallow) clone of the repository.
+        to_ref: End of the commit range. Default: `HEAD`.
+        from_ref: Start of the commit range. Default: All history.
+        mr_dump: Optional file with merge requests exported from Gitlab.
+            See `load_mergerequest_dump`.
+
+    Returns:
+        The commit range, and the merge requests. These may include merge requests
+        from the dump outside the range, so the result still needs filtering.
+    """
+    if not _is_complete_clone(git_dir):
+        raise _local_clone_error(git_dir)
+
+    to_ref = to_ref or "HEAD"
+    try:
+        output = _git(
+            git_dir,
+            "log",
+            "--no-show-signature",
+            f"--format={GIT_LOG_FORMAT}",
+            f"{from_ref}...{to_ref}" if from_ref else to_ref,
+            "--",
+        )
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to list the commits in '{git_dir}':\n{e.stderr}") from e
+
+    commits: List[Dict[str, Any]] = []
+    messages: Dict[str, str] = {}
+    for record in output.split("\x1e")[:-1]:
+        commit_id, parent_ids, committed_date, author_name, message = record.lstrip("\n").split(
+            "\x00"
+        )
+        commits.append(
+            {
+                "id": commit_id,
+                "parent_ids": parent_ids.split(),
+                "committed_date": committed_date,
+                "author_name": author_name,
+            }
+        )
+        messages[commit_id] = message
+
+    authors = {c["id"]: c["author_name"] for c in commits}
+    merge_requests = {}
+    for commit in commits:
+        if len(commit["parent_ids"]) > 1:
+            merge_request = _parse_merge_commit(commit, messages[commit["id"]], authors)
+            if merge_request:
+                merge_requests[commit["id"]] = merge_request
+    if mr_dump:
+        merge_requests.update(load_mergerequest_dump(mr_dump))
+
+    return CommitRange(commits, "git"), list(merge_requests.values())
@@ -1,82 +1,122 @@
 import re
-from typing import Dict, List
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
 
 import lxml.etree  # type: ignore
 import pytest
 
 from ..exception import FailedTestCaseException
 from ..schema import TestCase
+from .parsepool import parse_pool
 
 JUNIT_PATTERN = r"(?P<req_id>[A-Z,0-9]+)( \[(?P<refs>[A-Z,0-9]+)\])?: (?P<desc>.*)"
 
 
+def _parse_testcase(testcase, pattern):
+    name = testcase.attrib["name"]
+    classname = testcase.attrib.get("classname", "")
+    # file = testcase.attrib.get("file", "")
+    # line_no = testcase.attrib.get("line", "")
+
+    failures: List[str] = []
+    for failure in testcase.findall("failure"):
+        failures.append(failure.text)
+
+    skipped: List[str] = []
+    for skip in testcase.findall("skipped"):
+        skipped.append(skip.text)
+
+    # Parse out references
+    for re_result in re.finditer(pattern, name):
+        matches = re_result.groupdict()
+        refs = []
+        if matches.get("refs"):
+            refs = matches["refs"].split(",")
+        test_case = TestCase(
+            matches["req_id"].split(","),
+            None,
+            matches.get("desc"),
+            None,
+            classname,
+            None,
+            refs,
+            False,
+            not bool(failures),
+        )
+        yield name, test_case, failures
+
+
+def _free(element) -> None:
+    # Release an element that has been processed, including already processed
+    # siblings still referenced from the parent, so memory stays flat
+    element.clear()
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
+
+
+def parse_junit(path: Path, pattern: re.Pattern) -> Iterator[Tuple[str, TestCase, List[str]]]:
+    """Parses test cases from a JUnit XML file, streaming it element by element.
+
+    Only `testcase` elements of the `testsuite` elements directly below the root element
+    are considered. Each element is released once processed, so memory use doesn't grow
+    with the file size. Results are yielded as each `testsuite` element ends.
+
+    We allow several results for a testcase within a single testsuite.
+    If there are no failures, we select the first test case.
+    If there are failures, we select the first failure.
+
+    Args:
+        path: Path to the JUnit XML file.
+        pattern: Regex for parsing requirement IDs, references and description from
+            test case names.
+
+    Yields:
+        Tuples of test case name, TestCase and failure messages.
+    """
+    depth = 0
+    chosen_testcases: Dict[str, Tuple[str, TestCase, List[str]]] = {}
+    for event, element in lxml.etree.iterparse(str(path), events=("start", "end")):
+        if event == "start":
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth == 2 and element.tag == "testcase":
+            if element.getparent().tag == "testsuite":
+                for name, test_case, failures in _parse_testcase(element, pattern):
+                    if name not in chosen_testcases or (failures and not chosen_testcases[name][2]):
+                        chosen_testcases[name] = (name, test_case, failures)
+            _free(element)
+        elif depth == 1:
+            if element.tag == "testsuite":
+                yield from chosen_testcases.values()
+                chosen_testcases = {}
+            _free(element)
+
+
+def parse_junit_file(path: Path, junit_regex: str) -> List[Tuple[str, TestCase, List[str]]]:
+    return list(parse_junit(path, re.compile(junit_regex)))
+
+
+def get_junit_regex(config) -> str:
+    return (
+        config.getoption("nydok-junit-regex") or config.getini("nydok-junit-regex") or JUNIT_PATTERN
+    )
+
+
 class JUnitFile(pytest.File):
     def collect(self):
-        with open(self.fspath) as f:
-            xml_data = lxml.etree.parse(f)
-            testsuites = xml_data.getroot()
-
-            pattern = re.compile(
-                self.session.config.getoption("nydok-junit-regex")
-                or self.session.config.getini("nydok-junit-regex")
-                or JUNIT_PATTERN
-            )
+        file_path = Path(self.fspath)
 
-            for testsuite in testsuites.findall("testsuite"):
-                testcases = testsuite.findall("testcase")
-
-                # We allow several results for a testcase within a single testsuite
-                # If there are no failures, we select the first test case.
-                # If there are failures, we select the first failure.
-                chosen_testcases: Dict[str, JUnitItem] = {}
-                for testcase in testcases:
-                    name = testcase.attrib["name"]
-                    classname = testcase.attrib.get("classname", "")
-                    # file = testcase.attrib.get("file", "")
-                    # line_no = testcase.attrib.get("line", "")
-
-                    failures: List[str] = []
-                    for failure in testcase.findall("failure"):
-                        failures.append(failure.text)
-
-                    skipped: List[str] = []
-                    for skip in testcase.findall("skipped"):
-                        skipped.append(skip.text)
-
-                    # testcase_data = {
-                    #     "path": self.fspath,
-                    #     "name": name,
-                    #     "file": file,
-                    #     "line_no": line_no,
-                    #     "failures": failures,
-                    #     "skipped": skipped,
-                    # }
-
-                    # Parse out references
-                    for re_result in re.finditer(pattern, name):
-                        matches = re_result.groupdict()
-                        refs = []
-                        if matches.get("refs"):
-                            refs = matches["refs"].split(",")
-                        test_case = TestCase(
-                            matches["req_id"].split(","),
-                            None,
-                            matches.get("desc"),
-                            None,
-                            classname,
-                            None,
-                            refs,
-                            False,
-                            not bool(failures),
-                        )
-                        if name not in chosen_testcases or (
-                            failures and not chosen_testcases[name].failures
-                        ):
-                            chosen_testcases[name] = JUnitItem.from_parent(
-                                self, name=name, test_case=test_case, failures=failures
-                            )
+        # Test cases may already have been parsed in the parse pool
+        parsed = parse_pool.get_result(file_path)
+        if parsed is None:
+            parsed = parse_junit(file_path, re.compile(get_junit_regex(self.session.config)))
 
-                yield from chosen_testcases.values()
+        for name, test_case, failures in parsed:
+            yield JUnitItem.from_parent(self, name=name, test_case=test_case, failures=failures)
 
 
 class JUnitItem(pytest.Item):
@@ -0,0 +1,74 @@
+import fnmatch
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+SPEC_SUFFIX = ".spec.md"
+JUNIT_SUFFIX = ".junit.xml"
+
+
+def find_files(
+    paths: Iterable[Path],
+    norecursedirs: List[str],
+    is_ignored: Optional[Callable[[Path], bool]] = None,
+) -> Iterator[Path]:
+    """Finds specification and JUnit files at or below the given paths.
+
+    Directories matching any of the `norecursedirs` patterns are skipped, like py.test does,
+    as are files and directories for which `is_ignored` returns True.
+    """
+    is_ignored = is_ignored or (lambda path: False)
+    for path in paths:
+        if path.is_file():
+            if path.name.endswith((SPEC_SUFFIX, JUNIT_SUFFIX)) and not is_ignored(path):
+                yield path
+            continue
+        for dir_path, dir_names, file_names in os.walk(path):
+            dir_names[:] = sorted(
+                d
+                for d in dir_names
+                if not any(fnmatch.fnmatch(d, p) for p in norecursedirs)
+                and not is_ignored(Path(dir_path) / d)
+            )
+            for file_name in sorted(file_names):
+                file_path = Path(dir_path) / file_name
+                if file_name.endswith((SPEC_SUFFIX, JUNIT_SUFFIX)) and not is_ignored(file_path):
+                    yield file_path
+
+
+class ParsePool:
+    """Parses specification and JUnit files in a process pool ahead of collection.
+
+    Files are submitted before py.test starts collecting, after which `SpecFile` and
+    `JUnitFile` only need to look up the parsed results to create their Items.
+    Files which weren't submitted, or failed to parse, are not found in the pool,
+    in which case they are parsed as usual during collection (reporting any errors).
+    """
+
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._futures: Dict[Path, Future] = {}
+
+    def start(self, workers: int) -> None:
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+
+    def submit(self, path: Path, parse: Callable, regex: str) -> None:
+        assert self._executor, "Parse pool is not started"
+        path = Path(os.path.abspath(path))
+        self._futures[path] = self._executor.submit(parse, path, regex)
+
+    def get_result(self, path: Path) -> Optional[list]:
+        future = self._futures.pop(Path(os.path.abspath(path)), None)
+        if future is None or future.exception() is not None:
+            return None
+        return future.result()
+
+    def shutdown(self) -> None:
+        if self._executor:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+        self._futures = {}
+
+
+parse_pool = ParsePool()
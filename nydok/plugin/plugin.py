@@ -4,8 +4,16 @@ from typing import Dict
 
 import pytest
 
-from .junit import JUNIT_PATTERN, JUnitFile, JUnitItem
-from .specification import DEFAULT_REQ_PATTERN, ReqItem, SpecFile
+from .junit import JUNIT_PATTERN, JUnitFile, JUnitItem, get_junit_regex, parse_junit_file
+from .parsepool import SPEC_SUFFIX, find_files, parse_pool
+from .specification import (
+    DEFAULT_REQ_PATTERN,
+    ReqItem,
+    SpecFile,
+    get_req_regex,
+    get_spec_cache,
+    parse_spec_file,
+)
 from .specsmanager import specs_manager
 from .testcase import REQ_TESTCASE_TAG
 
@@ -29,9 +37,30 @@ def pytest_addoption(parser):
         "nydok-specs-regex", f"Regex for specification parsing. Default: '{DEFAULT_REQ_PATTERN}'"
     )
     add_opt_ini("nydok-junit-regex", f"Regex for JUnit name parsing. Default: '{JUNIT_PATTERN}'")
+
+    spec_cache_help = (
+        "Cache parsed specification files in py.test's cache directory, "
+        "only parsing files that changed since the previous run."
+    )
+    group.addoption(
+        "--nydok-spec-cache", dest="nydok-spec-cache", action="store_true", help=spec_cache_help
+    )
+    parser.addini("nydok-spec-cache", spec_cache_help, type="bool", default=False)
+    parse_workers_help = (
+        "Number of processes for parsing specification and JUnit files ahead of collection. "
+        "Default: parse during collection"
+    )
+    group.addoption(
+        "--nydok-parse-workers", dest="nydok-parse-workers", help=parse_workers_help, type=int
+    )
+    parser.addini("nydok-parse-workers", parse_workers_help, type="string")
     add_opt_ini("nydok-risk-assessment", "Input path for risk assessment.")
     add_opt_ini("nydok-risk-priority-threshold", "Threshold for risk priority. Default: 'low'")
-    add_opt_ini("nydok-output", "Path for nydok json results file.")
+    add_opt_ini(
+        "nydok-output",
+        "Path for nydok results file. Written in compact SQLite format if the suffix is "
+        "'.db', '.sqlite' or '.sqlite3', otherwise as JSON.",
+    )
 
 
 def pytest_configure(config):
@@ -40,6 +69,49 @@ def pytest_configure(config):
         specs_manager.enable_risk_assessment(ra_file)
 
 
+def _get_parse_workers(config) -> int:
+    workers = config.getoption("nydok-parse-workers")
+    if workers is not None:
+        return workers
+    value = config.getini("nydok-parse-workers")
+    try:
+        return int(value or 0)
+    except ValueError:
+        raise pytest.UsageError(f"nydok-parse-workers must be an integer, got '{value}'")
+
+
+def pytest_collection(session):
+    """Pytest specific hook that is triggered before collection starts.
+
+    If enabled, specification and JUnit files are parsed in a process pool, leaving only
+    the creation of Items to collection. Paths which py.test ignores, e.g. through
+    `--ignore`, `--ignore-glob` or the `collect_ignore` of conftest files loaded before
+    collection, are not parsed.
+    """
+    config = session.config
+    workers = _get_parse_workers(config)
+    if workers < 1:
+        return
+
+    req_regex = get_req_regex(config)
+    junit_regex = get_junit_regex(config)
+    spec_cache = get_spec_cache(config)
+
+    paths = [config.invocation_params.dir / arg.split("::")[0] for arg in config.args]
+    parse_pool.start(workers)
+
+    def is_ignored(path: Path) -> bool:
+        return bool(config.hook.pytest_ignore_collect(collection_path=path, config=config))
+
+    for path in find_files(paths, config.getini("norecursedirs"), is_ignored):
+        if path.name.endswith(SPEC_SUFFIX):
+            # Unchanged cached files don't need parsing at all
+            if not (spec_cache and spec_cache.is_fresh(path, req_regex)):
+                parse_pool.submit(path, parse_spec_file, req_regex)
+        else:
+            parse_pool.submit(path, parse_junit_file, junit_regex)
+
+
 def pytest_collect_file(parent, path):
     """Pytest specific hook that is triggered for evaluating inclusion of a file in the tests."""
     if str(path).endswith(".spec.md"):
@@ -91,6 +163,8 @@ def pytest_collection_finish(session):
             return 1
         return 0
 
+    parse_pool.shutdown()
+
     session.items = sorted(session.items, key=sort_req_last)
 
     req_items = [i for i in session.items if isinstance(i, ReqItem)]
@@ -116,4 +190,4 @@ def pytest_sessionfinish(session):
 
     # Optionally write the results to a file
     if output := _get_option_or_ini(session.config, "nydok-output"):
-        specs_manager.to_json(Path(output))
+        specs_manager.write_results(Path(output))
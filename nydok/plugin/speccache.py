@@ -0,0 +1,93 @@
+import hashlib
+import io
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from ..schema import Requirement
+
+CACHE_KEY_PREFIX = "nydok/specs"
+
+
+class SpecCache:
+    """On-disk cache of requirements parsed from specification files.
+
+    Entries are stored in py.test's cache directory, one per specification file.
+    An entry is used as-is if the file's modification time and size are unchanged,
+    otherwise the file is read and the entry is used if its content hash matches.
+    Entries are only valid for the requirement regex they were parsed with.
+
+    Args:
+        cache: py.test's cache, i.e. `config.cache`.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def _get_key(self, path: Path) -> str:
+        path_hash = hashlib.sha1(str(path.resolve()).encode()).hexdigest()
+        return f"{CACHE_KEY_PREFIX}/{path_hash}"
+
+    def _get_entry(self, path: Path, req_regex: str) -> Optional[dict]:
+        entry = self.cache.get(self._get_key(path), None)
+        if entry and entry.get("regex") == req_regex:
+            return entry
+        return None
+
+    def is_fresh(self, path: Path, req_regex: str) -> bool:
+        """Returns whether a file's entry can be used without reading the file."""
+        entry = self._get_entry(path, req_regex)
+        if entry is None:
+            return False
+        stat = path.stat()
+        return (entry["mtime_ns"], entry["size"]) == (stat.st_mtime_ns, stat.st_size)
+
+    def get_requirements(
+        self,
+        path: Path,
+        req_regex: str,
+        parse: Callable[[str], List[Requirement]],
+    ) -> List[Requirement]:
+        """Returns the requirements of a specification file, parsing it only if changed.
+
+        Args:
+            path: Path to the specification file.
+            req_regex: Requirement regex used for parsing.
+            parse: Function parsing the file contents into requirements.
+
+        Returns:
+            Requirements in order of occurrence.
+        """
+        key = self._get_key(path)
+        entry = self._get_entry(path, req_regex)
+
+        stat = path.stat()
+        if entry and (entry["mtime_ns"], entry["size"]) == (stat.st_mtime_ns, stat.st_size):
+            return self._to_requirements(path, entry["requirements"])
+
+        data = path.read_bytes()
+        content_hash = hashlib.sha256(data).hexdigest()
+        if entry and entry["sha256"] == content_hash:
+            reqs = self._to_requirements(path, entry["requirements"])
+        else:
+            # Decode the same way as open() in text mode, including newline translation
+            reqs = parse(io.TextIOWrapper(io.BytesIO(data)).read())
+
+        self.cache.set(
+            key,
+            {
+                "path": str(path),
+                "regex": req_regex,
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "sha256": content_hash,
+                "requirements": [[r.id, r.desc, r.line_no, r.ref_ids] for r in reqs],
+            },
+        )
+        return reqs
+
+    @staticmethod
+    def _to_requirements(path: Path, entries: List[list]) -> List[Requirement]:
+        return [
+            Requirement(req_id, desc, path, line_no, ref_ids)
+            for req_id, desc, line_no, ref_ids in entries
+        ]
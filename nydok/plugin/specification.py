@@ -1,6 +1,7 @@
 import re
+from bisect import bisect_left
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Pattern
 
 import pytest
 
@@ -10,6 +11,8 @@ from ..exception import (
     MissingTestCaseException,
 )
 from ..schema import Requirement
+from .parsepool import parse_pool
+from .speccache import SpecCache
 from .specsmanager import specs_manager
 
 DEFAULT_REQ_PATTERN = r"- (?P<req_id>[A-Z]+[0-9]+)( \[(?P<refs>[A-Z,0-9]+)\])?: (?P<desc>.*)"
@@ -17,30 +20,78 @@ DEFAULT_REQ_PATTERN = r"- (?P<req_id>[A-Z]+[0-9]+)( \[(?P<refs>[A-Z,0-9]+)\])?:
 RE_NEW_LINE = re.compile(r"\n")
 
 
+def parse_requirements(md_data: str, pattern: Pattern[str], file_path: Path) -> List[Requirement]:
+    """Parses all requirements from a specification in a single forward pass.
+
+    Args:
+        md_data: Contents of the specification file.
+        pattern: Compiled requirement regex.
+        file_path: Path of the specification file.
+
+    Returns:
+        Requirements in order of occurrence.
+    """
+    # Offsets of all line breaks, for looking up the line number of each match
+    new_lines = [m.start() for m in RE_NEW_LINE.finditer(md_data)]
+
+    reqs: List[Requirement] = []
+    for m in pattern.finditer(md_data):
+        line_no = bisect_left(new_lines, m.start(1)) + 1
+        matches = m.groupdict()
+        req_id, desc = matches["req_id"], matches["desc"]
+        refs: List[str] = []
+        if matches.get("refs"):
+            refs = matches["refs"].split(",")
+        reqs.append(Requirement(req_id, desc, file_path, line_no, refs))
+    return reqs
+
+
+def parse_spec_file(path: Path, req_regex: str) -> List[Requirement]:
+    with open(path) as f:
+        return parse_requirements(f.read(), re.compile(req_regex), path)
+
+
+def get_req_regex(config) -> str:
+    return (
+        config.getoption("nydok-specs-regex")
+        or config.getini("nydok-specs-regex")
+        or DEFAULT_REQ_PATTERN
+    )
+
+
+def get_spec_cache(config) -> Optional[SpecCache]:
+    use_cache = config.getoption("nydok-spec-cache") or config.getini("nydok-spec-cache")
+    if use_cache and getattr(config, "cache", None) is not None:
+        return SpecCache(config.cache)
+    return None
+
+
 class SpecFile(pytest.File):
     def collect(self):
-        with open(self.fspath) as f:
-            md_data = f.read()
-
         # Get regex to use
-        req_regex = (
-            self.config.getoption("nydok-specs-regex")
-            or self.config.getini("nydok-specs-regex")
-            or DEFAULT_REQ_PATTERN
-        )
+        req_regex = get_req_regex(self.config)
+
+        file_path = Path(self.fspath)
+
+        # Requirements may already have been parsed in the parse pool
+        parsed = parse_pool.get_result(file_path)
+
+        def parse(md_data: str) -> List[Requirement]:
+            if parsed is not None:
+                return parsed
+            return parse_requirements(md_data, re.compile(req_regex), file_path)
+
+        if spec_cache := get_spec_cache(self.config):
+            reqs = spec_cache.get_requirements(file_path, req_regex, parse)
+        elif parsed is not None:
+            reqs = parsed
+        else:
+            reqs = parse_spec_file(file_path, req_regex)
 
-        # Parse out all requirements from file, and yield py.test Items
-        pattern = re.compile(req_regex)
-        for m in pattern.finditer(md_data):
-            line_no = len(RE_NEW_LINE.findall(md_data, 0, m.start(1))) + 1
-            matches = m.groupdict()
-            req_id, desc = matches["req_id"], matches["desc"]
-            refs = []
-            if matches.get("refs"):
-                refs = matches["refs"].split(",")
-            req = Requirement(req_id, desc, Path(self.fspath), line_no, refs)
+        # Add all requirements from file, and yield py.test Items
+        for req in reqs:
             specs_manager.add_requirement(req)
-            yield ReqItem.from_parent(self, name=req_id, req=req)
+            yield ReqItem.from_parent(self, name=req.id, req=req)
 
 
 class ReqItem(pytest.Item):
@@ -1,4 +1,3 @@
-import json
 from pathlib import Path
 from typing import Dict
 
@@ -8,13 +7,15 @@ from ..exception import (
     DuplicateRequirementException,
     RiskPriorityExceedsThresholdException,
 )
+from ..results import write_json, write_results
 from ..schema import (
-    DataclassJsonEncoder,
+    InternTable,
     Requirement,
     RiskAssessment,
     TestCase,
     RISK_ASSESSMENT_CATEGORIES,
 )
+from ..traceability import TraceabilityIndex
 
 
 class SpecsManager:
@@ -24,6 +25,8 @@ class SpecsManager:
         self.testcase_prefix = "TC"
         self.testcase_no = 1
         self.risk_assessments: Dict[str, RiskAssessment] = {}
+        # Shares IDs and file paths between records, also for those parsed in other processes
+        self._intern_table = InternTable()
 
     def enable_risk_assessment(self, path: str):
         with open(path, "r") as file:
@@ -34,6 +37,9 @@ class SpecsManager:
         return f"{self.testcase_prefix}{self.testcase_no:03}"
 
     def add_requirement(self, req: Requirement) -> None:
+        req.id = self._intern_table.get_id(req.id)
+        req.file_path = self._intern_table.get_path(req.file_path)
+        req.ref_ids = self._intern_table.get_ids(req.ref_ids)
         self.requirements[req.id] = req
 
     def _add_test_case(self, req_id: str, test_case: TestCase) -> None:
@@ -48,6 +54,8 @@ class SpecsManager:
         if not test_case.skip and not test_case.testcase_id:
             test_case.testcase_id = self._format_testcase_id()
             self.testcase_no += 1
+        test_case.ids = self._intern_table.get_ids(test_case.ids)
+        test_case.ref_ids = self._intern_table.get_ids(test_case.ref_ids)
 
         for _id in test_case.ids:
             self._add_test_case(_id, test_case)
@@ -79,17 +87,20 @@ class SpecsManager:
                         f"Risk assessment {ra_id}: mitigation_requirement_id '{req_id}' not found."
                     )
 
+    def get_index(self) -> TraceabilityIndex:
+        """Returns the index of requirements, test cases and references, as written to results."""
+        return TraceabilityIndex.build(self.requirements, self.test_cases)
+
     def to_json(self, path: Path):
-        data = json.dumps(
-            {
-                "test_cases": self.test_cases,
-                "requirements": self.requirements,
-                "risk_assessments": self.risk_assessments,
-            },
-            cls=DataclassJsonEncoder,
-            indent=4,
+        write_json(
+            path, self.test_cases, self.requirements, self.risk_assessments, self.get_index()
+        )
+
+    def write_results(self, path: Path):
+        """Writes the results file, in the format given by the file suffix."""
+        write_results(
+            path, self.test_cases, self.requirements, self.risk_assessments, self.get_index()
         )
-        path.write_text(data)
 
 
 specs_manager = SpecsManager()
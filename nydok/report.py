@@ -1,96 +1,138 @@
-import re
-from typing import Dict, List, Optional, Set, Tuple
-
-from .gitlab import fetch_mergerequests, get_commits_for_ref, get_pipeline_logs
+import asyncio
+import contextlib
+import gzip
+import io
+import shutil
+import tempfile
+from pathlib import Path
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    TextIO,
+    Tuple,
+)
+
+from . import gitlab_async
+from .commitrange import CommitRange, resolve_commit_range, resolve_commit_range_async
+from .gitlab import (
+    GitLabClient,
+    fetch_mergerequests_for_range,
+    get_client,
+    get_pipeline_jobs,
+    iter_job_trace,
+)
+from .gitlab_async import AsyncGitLabClient
+from .logs import (
+    AnsiStripper,
+    LogOptions,
+    LogSanitizer,
+    create_log_filter,
+    get_artifact_name,
+    iter_lines,
+)
+from .offline import get_local_mergerequests
 from .schema import Requirement, RiskAssessment, TestCase
+from .traceability import TraceabilityGraph
 
+# Size up to which job logs are kept in memory before spilling to disk
+LOG_SPOOL_SIZE = 1024 * 1024
 
-def _render_md_table(header, rows, max_col_width=100):
-    def _md_table_row(cols: List[str], col_widths: List[int]):
-        return " | ".join(
-            # Pad each entry with col_widths
-            [
-                "{h:<{w}}".format(
-                    h=cols[i],
-                    w=col_widths[i],
-                )
-                for i in range(0, len(cols))
-            ]
-        )
 
-    # Find max col size per column
-    max_col_size: List[int] = []
-    for idx in range(0, len(header)):
-        max_col_size.append(min(max([len(r[idx]) for r in [header] + rows]), max_col_width))
+class _RowSource:
+    """Re-iterable source of table rows, generating the rows anew for each iteration."""
 
-    result = ""
-    result += _md_table_row(header, max_col_size) + "\n"
-    result += (
-        _md_table_row(["-" * max_col_size[i] for i in range(0, len(header))], max_col_size) + "\n"
-    )
-    for row in rows:
-        result += _md_table_row(row, max_col_size) + "\n"
+    def __init__(self, generate_rows: Callable[[], Iterable[Sequence[str]]]):
+        self._generate_rows = generate_rows
 
-    return result
+    def __iter__(self) -> Iterator[Sequence[str]]:
+        return iter(self._generate_rows())
 
 
-def _get_ids_for_req(req: Requirement, req_impl: Optional[TestCase] = None) -> Set[str]:
-    ref_ids: Set[str] = set()
-    if req.ref_ids:
-        ref_ids.update(req.ref_ids)
-    if req_impl and req_impl.ref_ids:
-        ref_ids.update(req_impl.ref_ids)
+def _write_md_table(
+    sink: TextIO,
+    header: Sequence[str],
+    rows: Iterable[Sequence[str]],
+    max_col_width: int = 100,
+    col_widths: Optional[Sequence[int]] = None,
+) -> None:
+    """Writes a table in Markdown format to a text sink, one row at a time.
 
-    return ref_ids
+    Unless col_widths is given, the column widths are measured in a first pass
+    over the rows, keeping only the widths in memory. The rows are then generated
+    again and written directly to the sink. A one-shot iterator can't be iterated
+    twice, so it is materialized before measuring; use a list or a `_RowSource`.
 
+    Args:
+        sink: Text stream to write to, e.g. an open file or stdout.
+        header: Column titles.
+        rows: Table rows, each with one string per column.
+        max_col_width: Maximum padding width of each column.
+        col_widths: Fixed column widths. If given, rows are only iterated once.
+    """
+    if col_widths is None:
+        if iter(rows) is rows:
+            rows = list(rows)
+
+        # Find max col size per column
+        widths = [len(h) for h in header]
+        for row in rows:
+            for idx, col in enumerate(row):
+                if len(col) > widths[idx]:
+                    widths[idx] = len(col)
+        col_widths = [min(w, max_col_width) for w in widths]
+
+    # Pad each entry with col_widths
+    row_format = " | ".join(f"{{{idx}:<{w}}}" for idx, w in enumerate(col_widths)) + "\n"
+
+    sink.write(row_format.format(*header))
+    sink.write(row_format.format(*["-" * w for w in col_widths]))
+    for row in rows:
+        sink.write(row_format.format(*row))
 
-def _traverse_ids_for_req(
-    req: Requirement,
-    candidate_reqs: List[Requirement],
-    candidate_impl: List[TestCase],
-    prefix: str,
-    seen: Optional[Set[str]] = None,
-) -> Set[str]:
-    result: Set[str] = set()
 
-    if seen is None:
-        seen = set()
+def _render_md_table(header, rows, max_col_width=100) -> str:
+    buffer = io.StringIO()
+    _write_md_table(buffer, header, rows, max_col_width=max_col_width)
+    return buffer.getvalue()
 
-    req_impl = next((i for i in candidate_impl if req.id in i.ids), None)
-    ref_ids = _get_ids_for_req(req, req_impl)
-    for _id in ref_ids:
-        # Ensure no cycles, or we'll be stuck in an infinite loop
-        if _id in seen:
-            raise RuntimeError(f"Circular reference detected, {_id} has already been seen")
-        seen.add(_id)
 
-        if _id.startswith(prefix):
-            result.add(_id)
-        else:
-            # Traverse referenced (child) requirements to search for more matches
-            if referenced_req := next((r for r in candidate_reqs if r.id == _id), None):
-                result.update(
-                    _traverse_ids_for_req(
-                        referenced_req, candidate_reqs, candidate_impl, prefix, seen
-                    )
-                )
-    return result
+def _render(write_report: Callable[..., None], *args, **kwargs) -> str:
+    """Renders a report to a string, given the function writing it to a sink."""
+    buffer = io.StringIO()
+    write_report(buffer, *args, **kwargs)
+    return buffer.getvalue()
 
 
-def create_traceability_matrix(
-    reqs: List[Requirement],
-    test_cases: List[TestCase],
+def write_traceability_matrix(
+    sink: TextIO,
+    reqs: Iterable[Requirement],
+    test_cases: Iterable[TestCase],
     categories: Optional[List[Tuple[str, str]]] = None,
     base_prefix: Optional[str] = None,
     max_col_width=100,
-) -> str:
-    """Creates a traceability matrix in markdown format.
+    graph: Optional[TraceabilityGraph] = None,
+) -> None:
+    """Writes a traceability matrix in markdown format to a text sink.
 
     If categories is provided, the matrix will contain additional columns,
     one for each category, linking the different requirements together
     through their references.
 
+    The rows are generated twice, once to measure the column widths and once to write
+    them, rather than keeping the rendered table in memory. The category columns are
+    resolved before the first pass, so generating the rows again only repeats lookups.
+
     Args:
+        sink: Text stream to write the report to.
         reqs: Requirements to include.
         test_cases: TestCases for the Requirements
         categories: List of tuples, containing title and prefix that defines a category.
@@ -98,121 +140,161 @@ def create_traceability_matrix(
         base_prefix: Which requirement prefix to base the matrix upon. Required if
                      categories is provided.
         max_col_width: Maximum width of each column in the table.
-
-
-    Returns:
-        Traceability matrix table in Markdown format.
+        graph: Prebuilt graph of reqs and test_cases, e.g. shared between reports.
     """
     header = ["ID", "Description", "References", "Test case"]
 
     if categories:
         header = [c[0] for c in categories] + header
 
-    rows: List[List[str]] = []
-    for req in sorted(reqs, key=lambda x: x.id):
-        # If base_prefix is given, table only relates to matching requirements
-        if base_prefix and not req.id.startswith(base_prefix):
-            continue
-
-        req_test_case = next((i for i in test_cases if req.id in i.ids), None)
-
-        category_entries: List[str] = []
-        used_prefix_ids: Set[str] = set()
-        if categories:
-            for _, prefix in categories:
-                prefix_ids = _traverse_ids_for_req(req, reqs, test_cases, prefix)
-                if prefix_ids:
-                    category_entries.append(", ".join(sorted(prefix_ids)))
-                    used_prefix_ids.update(prefix_ids)
-                else:
-                    category_entries.append("-")
-
-        rows.append(
-            category_entries
-            + [
+    if graph is None:
+        graph = TraceabilityGraph(reqs, test_cases)
+
+    # If base_prefix is given, table only relates to matching requirements
+    base_reqs = [
+        req
+        for req in sorted(graph.all_requirements, key=lambda x: x.id)
+        if not base_prefix or req.id.startswith(base_prefix)
+    ]
+
+    # Resolve all category columns up front, in a single pass per category
+    for _, prefix in categories or []:
+        graph.compute_closure(prefix, base_reqs)
+
+    def generate_rows() -> Iterator[List[str]]:
+        for req in base_reqs:
+            req_test_case = graph.get_test_case(req.id)
+
+            category_entries: List[str] = []
+            used_prefix_ids: Set[str] = set()
+            if categories:
+                for _, prefix in categories:
+                    prefix_ids = graph.traverse(req, prefix)
+                    if prefix_ids:
+                        category_entries.append(", ".join(sorted(prefix_ids)))
+                        used_prefix_ids.update(prefix_ids)
+                    else:
+                        category_entries.append("-")
+
+            yield category_entries + [
                 str(req.id),
                 req.desc,
                 # Remove the used prefixes from the list of references
-                ", ".join(sorted(_get_ids_for_req(req, req_test_case) - used_prefix_ids)),
+                ", ".join(sorted(graph.get_ref_ids(req) - used_prefix_ids)),
                 str(
                     req_test_case.testcase_id if req_test_case and req_test_case.testcase_id else ""
                 ),
             ]
-        )
-
-    report = _render_md_table(header, rows, max_col_width=max_col_width)
 
-    return report
+    _write_md_table(sink, header, _RowSource(generate_rows), max_col_width=max_col_width)
 
 
-def create_test_overview_report(
-    reqs: List[Requirement],
-    test_cases: List[TestCase],
+def create_traceability_matrix(
+    reqs: Iterable[Requirement],
+    test_cases: Iterable[TestCase],
+    categories: Optional[List[Tuple[str, str]]] = None,
+    base_prefix: Optional[str] = None,
+    max_col_width=100,
 ) -> str:
-    report = ""
+    """Creates a traceability matrix in markdown format.
+
+    See `write_traceability_matrix` for a description of the arguments.
+
+    Returns:
+        Traceability matrix table in Markdown format.
+    """
+    return _render(
+        write_traceability_matrix,
+        reqs,
+        test_cases,
+        categories=categories,
+        base_prefix=base_prefix,
+        max_col_width=max_col_width,
+    )
+
 
+def _get_report_test_cases(test_cases: Iterable[TestCase]) -> Dict[str, TestCase]:
     # TestCases are repeated if duplicated IDs, use first one
     report_test_cases: Dict[str, TestCase] = {}
     for test_case in sorted(test_cases, key=lambda x: x.testcase_id):
         if test_case.testcase_id not in report_test_cases:
             report_test_cases[test_case.testcase_id] = test_case
+    return report_test_cases
+
+
+def write_test_overview_report(
+    sink: TextIO,
+    reqs: Iterable[Requirement],
+    test_cases: Iterable[TestCase],
+) -> None:
+    report_test_cases = _get_report_test_cases(test_cases)
 
     # Print summary table
-    report += (
-        _render_md_table(
-            ["Test case", "Description", "Passed"],
-            [
+    _write_md_table(
+        sink,
+        ["Test case", "Description", "Passed"],
+        _RowSource(
+            lambda: (
                 [
                     tc.testcase_id,
                     tc.desc,
                     "Pass" if tc.passed else "**Fail**",
                 ]
                 for tc in report_test_cases.values()
-            ],
-        )
-        + "\n\n"
+            )
+        ),
     )
-
-    return report
+    sink.write("\n\n")
 
 
-def create_test_case_report(
-    reqs: List[Requirement],
-    test_cases: List[TestCase],
+def create_test_overview_report(
+    reqs: Iterable[Requirement],
+    test_cases: Iterable[TestCase],
 ) -> str:
-    report = ""
+    return _render(write_test_overview_report, reqs, test_cases)
 
-    # TestCases are repeated if duplicated IDs, use first one
-    report_test_cases: Dict[str, TestCase] = {}
-    for test_case in sorted(test_cases, key=lambda x: x.testcase_id):
-        if test_case.testcase_id not in report_test_cases:
-            report_test_cases[test_case.testcase_id] = test_case
+
+def write_test_case_report(
+    sink: TextIO,
+    reqs: Iterable[Requirement],
+    test_cases: Iterable[TestCase],
+    graph: Optional[TraceabilityGraph] = None,
+) -> None:
+    test_cases = list(test_cases)
+    if graph is None:
+        graph = TraceabilityGraph(reqs, test_cases)
+    report_test_cases = _get_report_test_cases(test_cases)
 
     # Print individual test cases
     for test_case in report_test_cases.values():
-        impl_reqs = [s for s in reqs if s.id in test_case.ids]
+        impl_reqs = graph.get_requirements_for_test_case(test_case)
 
-        testdata_table = ""
-        if test_case.io:
-            rows: List[List[str]] = list()
-            for io_entry in test_case.io:
-                rows.append([str(io_entry[0]), str(io_entry[1])])
-
-            testdata_table = _render_md_table(["Input", "Output"], rows)
-
-        report += f"## {test_case.testcase_id}{': ' + test_case.desc if test_case.desc else ''}\n\n"
+        sink.write(
+            f"## {test_case.testcase_id}{': ' + test_case.desc if test_case.desc else ''}\n\n"
+        )
 
-        report += _render_md_table(["ID", "Description"], [[req.id, req.desc] for req in impl_reqs])
-        report += "\n\n"
+        _write_md_table(sink, ["ID", "Description"], [[req.id, req.desc] for req in impl_reqs])
+        sink.write("\n\n")
 
-        if testdata_table:
-            report += f"### Test data:\n\n{testdata_table}\n"
+        if test_case.io:
+            sink.write("### Test data:\n\n")
+            _write_md_table(
+                sink,
+                ["Input", "Output"],
+                [[str(io_entry[0]), str(io_entry[1])] for io_entry in test_case.io],
+            )
+            sink.write("\n")
 
         if test_case.func_src:
-            report += "### Test case implementation:\n\n"
-            report += f"```python\n{test_case.func_src}```\n\n"
+            sink.write("### Test case implementation:\n\n")
+            sink.write(f"```python\n{test_case.func_src}```\n\n")
 
-    return report
+
+def create_test_case_report(
+    reqs: Iterable[Requirement],
+    test_cases: Iterable[TestCase],
+) -> str:
+    return _render(write_test_case_report, reqs, test_cases)
 
 
 RISK_ITEM_TEMPLATE = """
@@ -261,21 +343,19 @@ RISK_ITEM_TEMPLATE = """
 """  # noqa: E501
 
 
-def create_risk_report(
-    risk_assessments: Dict[str, RiskAssessment],
-) -> str:
+def write_risk_report(
+    sink: TextIO,
+    risk_assessments: Mapping[str, RiskAssessment],
+) -> None:
     """
-    Create a risk report from a list of risk assessments as a HTML table.
+    Write a risk report from a list of risk assessments as a HTML table to a text sink.
 
     The table is sorted by risk assessment ID.
 
     Args:
+        sink: Text stream to write the report to.
         risk_assessments: A dictionary of risk assessments, given their ID.
-
-    Returns:
-        A HTML table with the risk assessments.
     """
-    report = ""
 
     def get_risk_item(item: str, desc: bool = False, _class: str = "", colspan: str = "1") -> str:
         """Creates a <td> for a risk item.
@@ -322,7 +402,7 @@ def create_risk_report(
         )
 
     if risk_assessments:
-        report += '<table class="nydok-risk-assessment">'
+        sink.write('<table class="nydok-risk-assessment">')
         for ra in sorted(risk_assessments.values(), key=lambda x: x.id):
             mitigation_text = ra.mitigation
 
@@ -336,68 +416,115 @@ def create_risk_report(
                     + "."
                 )
 
-            report += RISK_ITEM_TEMPLATE.format(
-                _id=ra.id,
-                description=ra.description,
-                consequence=ra.consequence,
-                mitigation=mitigation_text,
-                prior_probability=get_risk_item(ra.prior_probability, _class="nydok-risk-prior"),
-                prior_severity=get_risk_item(ra.prior_severity, _class="nydok-risk-prior"),
-                prior_detectability=get_risk_item(
-                    ra.prior_detectability, desc=True, _class="nydok-risk-prior"
-                ),
-                prior_risk_priority=get_risk_item(
-                    ra.prior_risk_priority, colspan="3", _class="nydok-risk-prior"
-                ),
-                residual_probability=get_risk_item(
-                    ra.residual_probability, _class="nydok-risk-residual"
-                ),
-                residual_severity=get_risk_item(ra.residual_severity, _class="nydok-risk-residual"),
-                residual_detectability=get_risk_item(
-                    ra.residual_detectability, desc=True, _class="nydok-risk-residual"
-                ),
-                residual_risk_priority=get_risk_item(
-                    ra.residual_risk_priority, colspan="3", _class="nydok-risk-residual"
-                ),
+            sink.write(
+                RISK_ITEM_TEMPLATE.format(
+                    _id=ra.id,
+                    description=ra.description,
+                    consequence=ra.consequence,
+                    mitigation=mitigation_text,
+                    prior_probability=get_risk_item(
+                        ra.prior_probability, _class="nydok-risk-prior"
+                    ),
+                    prior_severity=get_risk_item(ra.prior_severity, _class="nydok-risk-prior"),
+                    prior_detectability=get_risk_item(
+                        ra.prior_detectability, desc=True, _class="nydok-risk-prior"
+                    ),
+                    prior_risk_priority=get_risk_item(
+                        ra.prior_risk_priority, colspan="3", _class="nydok-risk-prior"
+                    ),
+                    residual_probability=get_risk_item(
+                        ra.residual_probability, _class="nydok-risk-residual"
+                    ),
+                    residual_severity=get_risk_item(
+                        ra.residual_severity, _class="nydok-risk-residual"
+                    ),
+                    residual_detectability=get_risk_item(
+                        ra.residual_detectability, desc=True, _class="nydok-risk-residual"
+                    ),
+                    residual_risk_priority=get_risk_item(
+                        ra.residual_risk_priority, colspan="3", _class="nydok-risk-residual"
+                    ),
+                )
             )
-        report += "</table>"
+        sink.write("</table>")
 
-    return report
 
+def create_risk_report(
+    risk_assessments: Mapping[str, RiskAssessment],
+) -> str:
+    """
+    Create a risk report from a list of risk assessments as a HTML table.
 
-def create_codereview_report(
+    The table is sorted by risk assessment ID.
+
+    Args:
+        risk_assessments: A dictionary of risk assessments, given their ID.
+
+    Returns:
+        A HTML table with the risk assessments.
+    """
+    return _render(write_risk_report, risk_assessments)
+
+
+def write_codereview_report(
+    sink: TextIO,
     repo_path: str,
     to_ref: Optional[str] = None,
     from_ref: Optional[str] = None,
-) -> str:
-    """Create a report of code changes and their approval status since a given commit.
+    mr_lookup: str = "auto",
+    mr_api: str = "rest",
+    commit_source: str = "api",
+    git_dir: str = ".",
+) -> None:
+    """Write a report of code changes and their approval status since a given commit.
 
     Args:
+        sink: Text stream to write the report to.
         repo_path: Path to the repository to generate the report for.
         to_ref: The commit to generate the report for. If not given, repository
             HEAD is used.
         from_ref: The commit to generate the report from. If not given, all
             commits up until `to_ref` are considered.
-
-    Returns:
-        A markdown formatted string containing the report.
+        mr_lookup: How to look up the merge requests for the commit range, one of
+            `auto`, `list` or `commits`. See `fetch_mergerequests_for_range`.
+        mr_api: API to fetch merge requests with, `rest` or `graphql`. With `graphql`,
+            the approvers of each merge request are reported rather than its reviewers.
+        commit_source: Where to list the commits of the range from, one of `auto`, `git`
+            or `api`. See `resolve_commit_range`.
+        git_dir: Local clone of the repository, for listing the commits with `git`.
     """
 
     # Get commits from to_ref so we can figure out which merge requests
     # were merged into the commit range. If a from_ref is given, only merge requests
     # merged since the from_ref are considered.
 
-    commits = get_commits_for_ref(repo_path, to_ref, from_ref=from_ref)
+    commit_range = resolve_commit_range(
+        repo_path, to_ref, from_ref, commit_source=commit_source, git_dir=git_dir
+    )
+
+    mrs = fetch_mergerequests_for_range(
+        repo_path,
+        commit_range.commits,
+        full_history=not from_ref,
+        mr_lookup=mr_lookup,
+        mr_api=mr_api,
+    )
 
-    since_prev_text = f" since version {from_ref}" if from_ref else ""
-    report = f"## Approved code changes{since_prev_text}\n\n"
+    _write_codereview_table(sink, commit_range, mrs, from_ref)
 
-    mrs = fetch_mergerequests(repo_path)
 
+def _write_codereview_table(
+    sink: TextIO, commit_range: CommitRange, mrs: List[Dict[str, str]], from_ref: Optional[str]
+) -> None:
     # Filter the merge requests against the commits
-    to_include_mrs = [mr for mr in mrs if mr["merge_commit_sha"] in set(commits)]
+    to_include_mrs = [mr for mr in mrs if mr["merge_commit_sha"] in commit_range.ids]
+    to_include_mrs.sort(key=lambda mr: mr["merged_at"], reverse=True)
 
-    report += _render_md_table(
+    since_prev_text = f" since version {from_ref}" if from_ref else ""
+    sink.write(f"## Approved code changes{since_prev_text}\n\n")
+
+    _write_md_table(
+        sink,
         ["Commit", "Title", "Date", "Author", "Approver(s)"],
         [
             [
@@ -411,21 +538,299 @@ def create_codereview_report(
         ],
     )
 
-    return report
 
+def write_local_codereview_report(
+    sink: TextIO,
+    git_dir: str = ".",
+    to_ref: Optional[str] = None,
+    from_ref: Optional[str] = None,
+    mr_dump: Optional[str] = None,
+) -> None:
+    """Write a report of code changes and their approval status from a local clone.
 
-def create_pipeline_logs_report(
-    repo_path: str, pipeline_id: int, job_names: Optional[List[str]] = None
+    Unlike `write_codereview_report`, no access to Gitlab is needed. The merge requests
+    are derived from the merge commits in the clone, and optionally from merge requests
+    exported from Gitlab. See `get_local_mergerequests`.
+
+    Args:
+        sink: Text stream to write the report to.
+        git_dir: Complete (not shallow) clone of the repository.
+        to_ref: The commit to generate the report for. If not given, HEAD is used.
+        from_ref: The commit to generate the report from. If not given, all
+            commits up until `to_ref` are considered.
+        mr_dump: Path to a JSON file with merge requests exported from Gitlab.
+    """
+    commit_range, mrs = get_local_mergerequests(
+        git_dir, to_ref, from_ref, mr_dump=Path(mr_dump) if mr_dump else None
+    )
+    _write_codereview_table(sink, commit_range, mrs, from_ref)
+
+
+async def write_codereview_report_async(
+    sink: TextIO,
+    repo_path: str,
+    to_ref: Optional[str] = None,
+    from_ref: Optional[str] = None,
+    mr_lookup: str = "auto",
+    mr_api: str = "rest",
+    commit_source: str = "api",
+    git_dir: str = ".",
+    client: Optional[AsyncGitLabClient] = None,
+) -> None:
+    """Asyncio version of `write_codereview_report`, for running alongside other fetches.
+
+    Without `from_ref`, merge requests are listed while the commits are being fetched.
+
+    See `write_codereview_report` for a description of the other arguments.
+
+    Args:
+        client: Gitlab client. Default: A client using the shared `GitLabClient`.
+    """
+    client = client or AsyncGitLabClient()
+
+    if not from_ref and mr_lookup != "commits":
+        # The full history is listed, which doesn't depend on the commits
+        fetch_mrs = (
+            gitlab_async.fetch_mergerequests_graphql
+            if mr_api == "graphql"
+            else gitlab_async.fetch_mergerequests
+        )
+        commit_range, mrs = await asyncio.gather(
+            resolve_commit_range_async(
+                repo_path, to_ref, commit_source=commit_source, git_dir=git_dir, client=client
+            ),
+            fetch_mrs(repo_path, client=client),
+        )
+    else:
+        commit_range = await resolve_commit_range_async(
+            repo_path,
+            to_ref,
+            from_ref,
+            commit_source=commit_source,
+            git_dir=git_dir,
+            client=client,
+        )
+        mrs = await gitlab_async.fetch_mergerequests_for_range(
+            repo_path,
+            commit_range.commits,
+            full_history=not from_ref,
+            mr_lookup=mr_lookup,
+            client=client,
+            mr_api=mr_api,
+        )
+
+    _write_codereview_table(sink, commit_range, mrs, from_ref)
+
+
+def create_codereview_report(
+    repo_path: str,
+    to_ref: Optional[str] = None,
+    from_ref: Optional[str] = None,
+    mr_lookup: str = "auto",
+    mr_api: str = "rest",
+    commit_source: str = "api",
+    git_dir: str = ".",
 ) -> str:
-    logs = get_pipeline_logs(repo_path, pipeline_id, job_names=job_names)
+    """Create a report of code changes and their approval status since a given commit.
 
-    def ansi_to_plain(ansi):
-        return re.sub(r"\x1B\[[0-9;]*[ABCDEFGHJKSTfmnsulh]", "", ansi)
+    See `write_codereview_report` for a description of the arguments.
+
+    Returns:
+        A markdown formatted string containing the report.
+    """
+    return _render(
+        write_codereview_report,
+        repo_path,
+        to_ref=to_ref,
+        from_ref=from_ref,
+        mr_lookup=mr_lookup,
+        mr_api=mr_api,
+        commit_source=commit_source,
+        git_dir=git_dir,
+    )
 
-    report = ""
-    for job_name, job_log in sorted(logs.items()):
-        job_log = ansi_to_plain(job_log.replace("\n", "<br>"))
-        report += f"## {job_name}\n\n"
-        report += f'<div class="codehilite"><pre><code>\n{job_log}\n</code></pre></div>\n\n'
 
-    return report
+def create_local_codereview_report(
+    git_dir: str = ".",
+    to_ref: Optional[str] = None,
+    from_ref: Optional[str] = None,
+    mr_dump: Optional[str] = None,
+) -> str:
+    """Create a report of code changes and their approval status from a local clone.
+
+    See `write_local_codereview_report` for a description of the arguments.
+
+    Returns:
+        A markdown formatted string containing the report.
+    """
+    return _render(
+        write_local_codereview_report, git_dir, to_ref=to_ref, from_ref=from_ref, mr_dump=mr_dump
+    )
+
+
+def _download_job_log(
+    job: Dict[str, Any], log_options: LogOptions, client: Optional[GitLabClient] = None
+) -> IO[str]:
+    # Keep the log in memory while small, otherwise spill to disk
+    log_file = tempfile.SpooledTemporaryFile(max_size=LOG_SPOOL_SIZE, mode="w+", newline="")
+
+    with contextlib.ExitStack() as stack:
+        artifact_file = None
+        if log_options.artifacts_dir:
+            artifact_file = stack.enter_context(
+                gzip.open(
+                    Path(log_options.artifacts_dir) / get_artifact_name(job["name"], job["id"]),
+                    "wt",
+                    encoding="utf-8",
+                    newline="",
+                )
+            )
+
+        def iter_plain_chunks() -> Iterator[str]:
+            stripper = AnsiStripper()
+            for chunk in iter_job_trace(job["project_path"], job["id"], client=client):
+                chunk = stripper.feed(chunk)
+                if artifact_file:
+                    artifact_file.write(chunk)
+                yield chunk
+            chunk = stripper.flush()
+            if artifact_file:
+                artifact_file.write(chunk)
+            yield chunk
+
+        # ANSI escape sequences are already removed, for the filters and artifacts
+        sanitizer = LogSanitizer(strip_ansi=False)
+        if log_options.mode == "full":
+            for chunk in iter_plain_chunks():
+                log_file.write(sanitizer.feed(chunk))
+        else:
+            log_filter = create_log_filter(log_options)
+            for line in iter_lines(iter_plain_chunks()):
+                for kept_line in log_filter.feed(line):
+                    log_file.write(sanitizer.feed(kept_line))
+            for kept_line in log_filter.finish():
+                log_file.write(sanitizer.feed(kept_line))
+        log_file.write(sanitizer.flush())
+
+    log_file.seek(0)
+    return log_file
+
+
+def write_pipeline_logs_report(
+    sink: TextIO,
+    repo_path: str,
+    pipeline_id: int,
+    job_names: Optional[List[str]] = None,
+    job_regex: Optional[str] = None,
+    include_downstream: bool = False,
+    log_options: Optional[LogOptions] = None,
+) -> None:
+    """Write a report of the logs of the jobs in a pipeline.
+
+    Job logs are downloaded concurrently and streamed to temporary files, so only
+    a bounded part of each log is kept in memory. They are then written to the
+    report in order of job name. Optionally, only parts of each log are included,
+    with the full logs written as compressed files linked from the report.
+
+    Args:
+        sink: Text stream to write the report to.
+        repo_path: Path to the repository of the pipeline.
+        pipeline_id: ID of the pipeline.
+        job_names: Names or glob patterns of the jobs to include. Default is all jobs.
+        job_regex: Regex which the names of the jobs to include must contain a match for.
+        include_downstream: Whether to include jobs of downstream pipelines.
+        log_options: Which parts of the logs to include. Default is the full logs.
+    """
+    log_options = log_options or LogOptions()
+    if log_options.artifacts_dir:
+        Path(log_options.artifacts_dir).mkdir(parents=True, exist_ok=True)
+
+    jobs = sorted(
+        get_pipeline_jobs(
+            repo_path,
+            pipeline_id,
+            job_names=job_names,
+            job_regex=job_regex,
+            include_downstream=include_downstream,
+        ),
+        key=lambda job: job["name"],
+    )
+
+    log_files = get_client().map(lambda job: _download_job_log(job, log_options), jobs)
+    _write_job_logs(sink, jobs, log_files, log_options)
+
+
+def _write_job_logs(
+    sink: TextIO, jobs: List[Dict[str, Any]], log_files: List[IO[str]], log_options: LogOptions
+) -> None:
+    artifacts_link = log_options.artifacts_link or log_options.artifacts_dir
+    for job, log_file in zip(jobs, log_files):
+        with log_file:
+            sink.write(f"## {job['name']}\n\n")
+            if artifacts_link:
+                artifact_link = (
+                    f"{artifacts_link.rstrip('/')}/{get_artifact_name(job['name'], job['id'])}"
+                )
+                sink.write(f"[Full log]({artifact_link})\n\n")
+            sink.write('<div class="codehilite"><pre><code>\n')
+            shutil.copyfileobj(log_file, sink)
+            sink.write("\n</code></pre></div>\n\n")
+
+
+async def write_pipeline_logs_report_async(
+    sink: TextIO,
+    repo_path: str,
+    pipeline_id: int,
+    job_names: Optional[List[str]] = None,
+    job_regex: Optional[str] = None,
+    include_downstream: bool = False,
+    log_options: Optional[LogOptions] = None,
+    client: Optional[AsyncGitLabClient] = None,
+) -> None:
+    """Asyncio version of `write_pipeline_logs_report`, for running alongside other fetches.
+
+    See `write_pipeline_logs_report` for a description of the other arguments.
+
+    Args:
+        client: Gitlab client. Default: A client using the shared `GitLabClient`.
+    """
+    client = client or AsyncGitLabClient()
+    log_options = log_options or LogOptions()
+    if log_options.artifacts_dir:
+        Path(log_options.artifacts_dir).mkdir(parents=True, exist_ok=True)
+
+    jobs = sorted(
+        await gitlab_async.get_pipeline_jobs(
+            repo_path,
+            pipeline_id,
+            job_names=job_names,
+            client=client,
+            job_regex=job_regex,
+            include_downstream=include_downstream,
+        ),
+        key=lambda job: job["name"],
+    )
+
+    log_files = await asyncio.gather(
+        *(client.run(_download_job_log, job, log_options, client.client) for job in jobs)
+    )
+    _write_job_logs(sink, jobs, list(log_files), log_options)
+
+
+def create_pipeline_logs_report(
+    repo_path: str,
+    pipeline_id: int,
+    job_names: Optional[List[str]] = None,
+    job_regex: Optional[str] = None,
+    include_downstream: bool = False,
+    log_options: Optional[LogOptions] = None,
+) -> str:
+    return _render(
+        write_pipeline_logs_report,
+        repo_path,
+        pipeline_id=pipeline_id,
+        job_names=job_names,
+        job_regex=job_regex,
+        include_downstream=include_downstream,
+        log_options=log_options,
+    )
@@ -0,0 +1,475 @@
+import dataclasses
+import json
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Callable, Collection, Dict, Iterator, List, Mapping, Optional, TypeVar
+
+from . import jsonwriter
+from .schema import (
+    DataclassJsonEncoder,
+    FrozenRequirement,
+    FrozenTestCase,
+    InternTable,
+    Requirement,
+    RiskAssessment,
+    TestCase,
+)
+from .traceability import TraceabilityIndex
+
+# Results files with these suffixes are written in the compact SQLite format
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+SQLITE_FORMAT_VERSION = "1"
+
+SQLITE_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE strings (id INTEGER PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE test_cases (
+    id INTEGER PRIMARY KEY,
+    ids TEXT NOT NULL,
+    testcase_id INTEGER,
+    description TEXT,
+    io TEXT,
+    func_name TEXT,
+    func_src TEXT,
+    ref_ids TEXT,
+    skip INTEGER NOT NULL,
+    passed INTEGER NOT NULL
+);
+CREATE TABLE requirement_test_cases (
+    position INTEGER PRIMARY KEY,
+    req_id INTEGER NOT NULL,
+    test_case INTEGER NOT NULL REFERENCES test_cases (id)
+);
+CREATE TABLE requirements (
+    position INTEGER PRIMARY KEY,
+    id INTEGER NOT NULL,
+    description TEXT,
+    file_path INTEGER NOT NULL,
+    line_no INTEGER NOT NULL,
+    ref_ids TEXT
+);
+CREATE TABLE risk_assessments (
+    position INTEGER PRIMARY KEY,
+    id INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE index_entries (
+    position INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    key INTEGER NOT NULL,
+    value INTEGER NOT NULL
+);
+"""
+
+# Relations of the traceability index, stored as (key, value) entries of each kind
+INDEX_KINDS = ("req_test_cases", "test_case_reqs", "referrers")
+
+SECTIONS = ("test_cases", "requirements", "risk_assessments")
+
+T = TypeVar("T")
+
+
+def is_sqlite_path(path: Path) -> bool:
+    return path.suffix.lower() in SQLITE_SUFFIXES
+
+
+class _StringTable:
+    """Interns strings, such as IDs and file paths, as integer references."""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+
+    def get_id(self, value: str) -> int:
+        if value not in self.ids:
+            self.ids[value] = len(self.ids)
+        return self.ids[value]
+
+    def get_ids(self, values: Optional[List[str]]) -> Optional[str]:
+        if values is None:
+            return None
+        return json.dumps([self.get_id(value) for value in values])
+
+
+def write_json(
+    path: Path,
+    test_cases: Dict[str, TestCase],
+    requirements: Dict[str, Requirement],
+    risk_assessments: Dict[str, RiskAssessment],
+    index: Optional[TraceabilityIndex] = None,
+) -> None:
+    """Writes results in the JSON format, including the traceability index.
+
+    The index is built from the test cases and requirements if not given. Records are
+    written to the file one at a time, see `nydok.jsonwriter.dump`.
+    """
+    document = {
+        "test_cases": test_cases,
+        "requirements": requirements,
+        "risk_assessments": risk_assessments,
+        "index": index or TraceabilityIndex.build(requirements, test_cases),
+    }
+    with open(path, "w") as sink:
+        jsonwriter.dump(document, sink)
+
+
+def write_sqlite(
+    path: Path,
+    test_cases: Dict[str, TestCase],
+    requirements: Dict[str, Requirement],
+    risk_assessments: Dict[str, RiskAssessment],
+    index: Optional[TraceabilityIndex] = None,
+) -> None:
+    """Writes results in the compact SQLite format, including the traceability index.
+
+    IDs and file paths are interned in a string table, and a test case covering
+    several requirements is only stored once. The index is built from the test cases
+    and requirements if not given.
+    """
+    strings = _StringTable()
+
+    # The same TestCase object is registered once per requirement it covers
+    test_case_rows: Dict[int, tuple] = {}
+    requirement_test_case_rows = []
+    for req_id, test_case in test_cases.items():
+        if id(test_case) not in test_case_rows:
+            test_case_rows[id(test_case)] = (
+                len(test_case_rows),
+                strings.get_ids(test_case.ids),
+                None if test_case.testcase_id is None else strings.get_id(test_case.testcase_id),
+                test_case.desc,
+                None
+                if test_case.io is None
+                else json.dumps(test_case.io, cls=DataclassJsonEncoder),
+                test_case.func_name,
+                test_case.func_src,
+                strings.get_ids(test_case.ref_ids),
+                test_case.skip,
+                test_case.passed,
+            )
+        requirement_test_case_rows.append(
+            (strings.get_id(req_id), test_case_rows[id(test_case)][0])
+        )
+
+    requirement_rows = [
+        (
+            strings.get_id(req.id),
+            req.desc,
+            strings.get_id(str(req.file_path)),
+            req.line_no,
+            strings.get_ids(req.ref_ids),
+        )
+        for req in requirements.values()
+    ]
+
+    risk_assessment_rows = [
+        (strings.get_id(_id), json.dumps(dataclasses.asdict(ra), cls=DataclassJsonEncoder))
+        for _id, ra in risk_assessments.items()
+    ]
+
+    index = index or TraceabilityIndex.build(requirements, test_cases)
+    index_rows = [
+        (kind, strings.get_id(key), strings.get_id(value))
+        for kind in INDEX_KINDS
+        for key, values in getattr(index, kind).items()
+        for value in values
+    ]
+
+    path.unlink(missing_ok=True)
+    with closing(sqlite3.connect(path)) as conn, conn:
+        conn.executescript(SQLITE_SCHEMA)
+        conn.execute("INSERT INTO meta VALUES ('format_version', ?)", (SQLITE_FORMAT_VERSION,))
+        conn.executemany(
+            "INSERT INTO strings VALUES (?, ?)", ((i, s) for s, i in strings.ids.items())
+        )
+        conn.executemany(
+            "INSERT INTO test_cases VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            test_case_rows.values(),
+        )
+        conn.executemany(
+            "INSERT INTO requirement_test_cases (req_id, test_case) VALUES (?, ?)",
+            requirement_test_case_rows,
+        )
+        conn.executemany(
+            "INSERT INTO requirements (id, description, file_path, line_no, ref_ids) "
+            "VALUES (?, ?, ?, ?, ?)",
+            requirement_rows,
+        )
+        conn.executemany(
+            "INSERT INTO risk_assessments (id, data) VALUES (?, ?)", risk_assessment_rows
+        )
+        conn.executemany(
+            "INSERT INTO index_entries (kind, key, value) VALUES (?, ?, ?)", index_rows
+        )
+
+
+def write_results(
+    path: Path,
+    test_cases: Dict[str, TestCase],
+    requirements: Dict[str, Requirement],
+    risk_assessments: Dict[str, RiskAssessment],
+    index: Optional[TraceabilityIndex] = None,
+) -> None:
+    """Writes results to a file, in SQLite format if the suffix asks for it and JSON otherwise."""
+    write = write_sqlite if is_sqlite_path(path) else write_json
+    write(path, test_cases, requirements, risk_assessments, index)
+
+
+class LazySection(Mapping[str, T]):
+    """Mapping of a results section, decoding each record the first time it is accessed.
+
+    Args:
+        raw: Undecoded records, given their key.
+        decode: Function creating the object for a key and its undecoded record.
+    """
+
+    def __init__(self, raw: Dict[str, Any], decode: Callable[[str, Any], T]):
+        self._raw = raw
+        self._decode = decode
+        self._decoded: Dict[str, T] = {}
+
+    def __getitem__(self, key: str) -> T:
+        if key not in self._decoded:
+            self._decoded[key] = self._decode(key, self._raw[key])
+        return self._decoded[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._raw)
+
+    def __len__(self) -> int:
+        return len(self._raw)
+
+
+class Results(Mapping[str, LazySection]):
+    """Lazily loaded results file.
+
+    Behaves like the results document, a mapping from section name
+    ("test_cases", "requirements" or "risk_assessments") to the section's objects.
+    Each section is only read the first time it is accessed, and each record in
+    it is only decoded the first time it is looked up.
+
+    Fields which a report doesn't use can be omitted, in which case they are set
+    to None on the decoded objects. For the SQLite format, omitted fields are
+    never read from the file.
+
+    The traceability index stored with the results is available as `index`.
+
+    Decoded objects share equal IDs, texts and file paths, rather than having a copy
+    each. They are slotted, and optionally frozen, to keep memory use down for large
+    results.
+
+    Args:
+        path: Path to a results file, in either JSON or SQLite format.
+        omit_fields: Fields to leave out, given their section.
+        frozen: Whether to decode test cases and requirements as read-only
+            `FrozenTestCase` and `FrozenRequirement` objects.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        omit_fields: Optional[Mapping[str, Collection[str]]] = None,
+        frozen: bool = False,
+    ):
+        self.path = path
+        self.omit_fields: Mapping[str, Collection[str]] = omit_fields or {}
+        self.frozen = frozen
+        self._intern_table = InternTable()
+        self._sections: Dict[str, LazySection] = {}
+        self._json_data: Optional[Dict[str, Any]] = None
+        self._strings: Optional[List[str]] = None
+        self._index: Optional[TraceabilityIndex] = None
+
+    def __getitem__(self, section: str) -> LazySection:
+        if section not in SECTIONS:
+            raise KeyError(section)
+        if section not in self._sections:
+            if is_sqlite_path(self.path):
+                self._sections[section] = getattr(self, f"_load_sqlite_{section}")()
+            else:
+                self._sections[section] = getattr(self, f"_load_json_{section}")()
+        return self._sections[section]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(SECTIONS)
+
+    def __len__(self) -> int:
+        return len(SECTIONS)
+
+    @property
+    def index(self) -> Optional[TraceabilityIndex]:
+        """The stored traceability index, or None if a JSON file was written without one."""
+        if self._index is None:
+            if is_sqlite_path(self.path):
+                self._index = self._load_sqlite_index()
+            elif "index" in self._get_json_data():
+                self._index = TraceabilityIndex(**self._get_json_data()["index"])
+        return self._index
+
+    def _omit(self, section: str, record: Dict[str, Any]) -> Dict[str, Any]:
+        if omit_fields := self.omit_fields.get(section):
+            return {k: (None if k in omit_fields else v) for k, v in record.items()}
+        return record
+
+    def _create_test_case(self, test_case: Dict[str, Any]) -> TestCase:
+        table = self._intern_table
+        testcase_id = test_case["testcase_id"]
+        test_case = {
+            **test_case,
+            "ids": table.get_ids(test_case["ids"]),
+            "testcase_id": None if testcase_id is None else table.get_id(testcase_id),
+            "func_name": table.get_text(test_case["func_name"]),
+            "func_src": table.get_text(test_case["func_src"]),
+            "ref_ids": table.get_ids(test_case["ref_ids"]),
+        }
+        return (FrozenTestCase if self.frozen else TestCase)(**test_case)
+
+    def _create_requirement(self, requirement: Dict[str, Any]) -> Requirement:
+        table = self._intern_table
+        requirement = {
+            **requirement,
+            "id": table.get_id(requirement["id"]),
+            "file_path": table.get_path(requirement["file_path"]),
+            "ref_ids": table.get_ids(requirement["ref_ids"]),
+        }
+        return (FrozenRequirement if self.frozen else Requirement)(**requirement)
+
+    def _get_json_data(self) -> Dict[str, Any]:
+        if self._json_data is None:
+            self._json_data = json.loads(self.path.read_text())
+        return self._json_data
+
+    def _get_json_section(self, section: str) -> Dict[str, Any]:
+        return self._get_json_data()[section]
+
+    def _load_json_test_cases(self) -> LazySection[TestCase]:
+        return LazySection(
+            self._get_json_section("test_cases"),
+            lambda _id, test_case: self._create_test_case(self._omit("test_cases", test_case)),
+        )
+
+    def _load_json_requirements(self) -> LazySection[Requirement]:
+        return LazySection(
+            self._get_json_section("requirements"),
+            lambda _id, requirement: self._create_requirement(
+                self._omit("requirements", requirement)
+            ),
+        )
+
+    def _load_json_risk_assessments(self) -> LazySection[RiskAssessment]:
+        return LazySection(
+            self._get_json_section("risk_assessments"),
+            lambda _id, risk_assessment: RiskAssessment.from_dict(_id, risk_assessment),
+        )
+
+    def _query(self, sql: str) -> List[tuple]:
+        # Opened read-only, so a missing or misnamed file isn't silently created
+        with closing(sqlite3.connect(f"{self.path.absolute().as_uri()}?mode=ro", uri=True)) as conn:
+            if self._strings is None:
+                self._strings = [
+                    value for (value,) in conn.execute("SELECT value FROM strings ORDER BY id")
+                ]
+            return conn.execute(sql).fetchall()
+
+    def _get_columns(self, section: str, columns: Dict[str, str]) -> str:
+        # Select NULL in place of omitted fields, so they are never read
+        omit_fields = self.omit_fields.get(section, ())
+        return ", ".join(
+            "NULL" if field in omit_fields else column for field, column in columns.items()
+        )
+
+    def _get_strings(self, ids: Optional[str]) -> Optional[List[str]]:
+        if ids is None:
+            return None
+        assert self._strings is not None
+        return [self._strings[i] for i in json.loads(ids)]
+
+    def _load_sqlite_test_cases(self) -> LazySection[TestCase]:
+        columns = self._get_columns(
+            "test_cases",
+            {
+                "ids": "t.ids",
+                "testcase_id": "t.testcase_id",
+                "desc": "t.description",
+                "io": "t.io",
+                "func_name": "t.func_name",
+                "func_src": "t.func_src",
+                "ref_ids": "t.ref_ids",
+                "skip": "t.skip",
+                "passed": "t.passed",
+            },
+        )
+        rows = self._query(
+            f"SELECT r.req_id, t.id, {columns} FROM requirement_test_cases r "
+            "JOIN test_cases t ON t.id = r.test_case ORDER BY r.position"
+        )
+        strings = self._strings
+        assert strings is not None
+
+        # Requirements covered by the same test case share the TestCase object
+        test_cases: Dict[int, TestCase] = {}
+
+        def decode(req_id: str, row: tuple) -> TestCase:
+            row_id, ids, testcase_id, desc, io, func_name, func_src, ref_ids, skip, passed = row
+            if row_id not in test_cases:
+                test_case: Dict[str, Any] = {
+                    "ids": self._get_strings(ids),
+                    "testcase_id": None if testcase_id is None else strings[testcase_id],
+                    "desc": desc,
+                    "io": None if io is None else json.loads(io),
+                    "func_name": func_name,
+                    "func_src": func_src,
+                    "ref_ids": self._get_strings(ref_ids),
+                    "skip": None if skip is None else bool(skip),
+                    "passed": None if passed is None else bool(passed),
+                }
+                test_cases[row_id] = self._create_test_case(test_case)
+            return test_cases[row_id]
+
+        return LazySection({strings[row[0]]: row[1:] for row in rows}, decode)
+
+    def _load_sqlite_requirements(self) -> LazySection[Requirement]:
+        columns = self._get_columns(
+            "requirements",
+            {
+                "desc": "description",
+                "file_path": "file_path",
+                "line_no": "line_no",
+                "ref_ids": "ref_ids",
+            },
+        )
+        rows = self._query(f"SELECT id, {columns} FROM requirements ORDER BY position")
+        strings = self._strings
+        assert strings is not None
+
+        def decode(req_id: str, row: tuple) -> Requirement:
+            desc, file_path, line_no, ref_ids = row
+            requirement: Dict[str, Any] = {
+                "id": req_id,
+                "desc": desc,
+                "file_path": None if file_path is None else strings[file_path],
+                "line_no": line_no,
+                "ref_ids": self._get_strings(ref_ids),
+            }
+            return self._create_requirement(requirement)
+
+        return LazySection({strings[row[0]]: row[1:] for row in rows}, decode)
+
+    def _load_sqlite_risk_assessments(self) -> LazySection[RiskAssessment]:
+        rows = self._query("SELECT id, data FROM risk_assessments ORDER BY position")
+        strings = self._strings
+        assert strings is not None
+        return LazySection(
+            {strings[_id]: data for _id, data in rows},
+            lambda _id, data: RiskAssessment.from_dict(_id, json.loads(data)),
+        )
+
+    def _load_sqlite_index(self) -> TraceabilityIndex:
+        rows = self._query("SELECT kind, key, value FROM index_entries ORDER BY position")
+        strings = self._strings
+        assert strings is not None
+        index = TraceabilityIndex()
+        for kind, key, value in rows:
+            getattr(index, kind).setdefault(strings[key], []).append(strings[value])
+        return index
@@ -1,9 +1,10 @@
 import dataclasses
 import json
+import sys
 from dataclasses import dataclass
 from datetime import date, datetime
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, ClassVar, Dict, List, Optional, Tuple, Union
 
 
 class DataclassJsonEncoder(json.JSONEncoder):
@@ -49,7 +50,7 @@ RISK_ASSESSMENT_PRIORITY = {
 }
 
 
-@dataclass
+@dataclass(slots=True)
 class TestCase:
     ids: List[str]
     testcase_id: str
@@ -62,7 +63,7 @@ class TestCase:
     passed: bool
 
 
-@dataclass
+@dataclass(slots=True)
 class Requirement:
     id: str
     desc: str
@@ -71,6 +72,89 @@ class Requirement:
     ref_ids: List[str]
 
 
+class _Frozen:
+    """Makes a slotted dataclass read-only, like `frozen=True`.
+
+    Unlike a frozen dataclass, a subclass is still an instance of the mutable class,
+    so it can be used wherever that is expected.
+    """
+
+    __slots__ = ()
+    _mutable_cls: ClassVar[type]
+    _field_names: ClassVar[Tuple[str, ...]]
+
+    def __init_subclass__(cls, **kwargs: Any):
+        super().__init_subclass__(**kwargs)
+        cls._field_names = tuple(f.name for f in dataclasses.fields(cls._mutable_cls))
+
+    def __new__(cls, *args: Any, **kwargs: Any):
+        # The dataclass __init__ assigns each field, which is refused once frozen, so
+        # the instance is created as the mutable class, which has the same layout
+        instance = cls._mutable_cls(*args, **kwargs)
+        instance.__class__ = cls
+        return instance
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        # The fields are already set by __new__
+        pass
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise dataclasses.FrozenInstanceError(f"cannot assign to field '{name}'")
+
+    def __delattr__(self, name: str) -> None:
+        raise dataclasses.FrozenInstanceError(f"cannot delete field '{name}'")
+
+    def __reduce__(self):
+        return type(self), tuple(getattr(self, name) for name in self._field_names)
+
+
+class FrozenTestCase(_Frozen, TestCase):
+    """Read-only `TestCase`, e.g. for results shared between concurrently created reports."""
+
+    __slots__ = ()
+    _mutable_cls = TestCase
+
+
+class FrozenRequirement(_Frozen, Requirement):
+    """Read-only `Requirement`, e.g. for results shared between concurrently created reports."""
+
+    __slots__ = ()
+    _mutable_cls = Requirement
+
+
+class InternTable:
+    """Shares equal IDs, texts and file paths between records, instead of a copy per record.
+
+    IDs are interned with `sys.intern`. Other texts, such as the source of a test case
+    repeated for each requirement it covers, and file paths are stored once in the table.
+    """
+
+    def __init__(self):
+        self.paths: Dict[str, Path] = {}
+        self.texts: Dict[str, str] = {}
+
+    def get_id(self, value: str) -> str:
+        return sys.intern(value)
+
+    def get_ids(self, values: Optional[List[str]]) -> Optional[List[str]]:
+        if values is None:
+            return None
+        return [sys.intern(value) for value in values]
+
+    def get_text(self, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            return None
+        return self.texts.setdefault(value, value)
+
+    def get_path(self, value: Union[str, Path, None]) -> Optional[Path]:
+        if value is None:
+            return None
+        key = str(value)
+        if key not in self.paths:
+            self.paths[key] = Path(value)
+        return self.paths[key]
+
+
 @dataclass
 class RiskAssessment:
     id: str
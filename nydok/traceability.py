@@ -0,0 +1,303 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Set
+
+from .schema import Requirement, TestCase
+
+
+def _get_ids_for_req(req: Requirement, req_impl: Optional[TestCase] = None) -> Set[str]:
+    ref_ids: Set[str] = set()
+    if req.ref_ids:
+        ref_ids.update(req.ref_ids)
+    if req_impl and req_impl.ref_ids:
+        ref_ids.update(req_impl.ref_ids)
+
+    return ref_ids
+
+
+@dataclass
+class TraceabilityIndex:
+    """Bidirectional index between requirements, test cases and the IDs they reference.
+
+    Test cases are identified by their test case ID, e.g. `TC001`, and all lists
+    are in requirement order. The index is stored in results files, so reports can
+    look up relations without scanning all requirements for each test case.
+
+    Attributes:
+        req_test_cases: Test case IDs of each requirement ID.
+        test_case_reqs: Requirements covered by each test case.
+        referrers: Requirements referencing each ID, themselves or through their test case.
+    """
+
+    req_test_cases: Dict[str, List[str]] = field(default_factory=dict)
+    test_case_reqs: Dict[str, List[str]] = field(default_factory=dict)
+    referrers: Dict[str, List[str]] = field(default_factory=dict)
+
+    @classmethod
+    def build(
+        cls, requirements: Mapping[str, Requirement], test_cases: Mapping[str, TestCase]
+    ) -> "TraceabilityIndex":
+        """Builds the index in a single pass over each collection.
+
+        Args:
+            requirements: Requirements, given their ID.
+            test_cases: TestCases, given the ID of each requirement they cover.
+        """
+        index = cls()
+        req_order = {req_id: i for i, req_id in enumerate(requirements)}
+
+        for req_id, test_case in test_cases.items():
+            # Skipped test cases have no test case ID
+            if test_case.testcase_id is None:
+                continue
+            index.req_test_cases.setdefault(req_id, []).append(test_case.testcase_id)
+            if test_case.testcase_id not in index.test_case_reqs:
+                index.test_case_reqs[test_case.testcase_id] = sorted(
+                    {_id for _id in test_case.ids if _id in req_order},
+                    key=req_order.__getitem__,
+                )
+
+        for req_id, req in requirements.items():
+            for ref_id in sorted(_get_ids_for_req(req, test_cases.get(req_id))):
+                index.referrers.setdefault(ref_id, []).append(req_id)
+
+        return index
+
+
+class TraceabilityGraph:
+    """Indexed view of requirements, test cases and the references between them.
+
+    The graph is built once from the requirement and test case collections,
+    after which looking up a requirement or its test case is a dictionary lookup.
+    If an ID occurs several times, lookups return the first occurrence, while
+    `all_requirements` keeps every requirement, e.g. for one matrix row each.
+
+    Args:
+        reqs: Requirements to index.
+        test_cases: TestCases implementing the requirements.
+        index: Index of the requirements and test cases, e.g. as stored in the results
+            file. Built on first use if not given.
+    """
+
+    def __init__(
+        self,
+        reqs: Iterable[Requirement],
+        test_cases: Iterable[TestCase],
+        index: Optional[TraceabilityIndex] = None,
+    ):
+        self.all_requirements: List[Requirement] = list(reqs)
+        self.requirements: Dict[str, Requirement] = {}
+        self.test_cases: Dict[str, TestCase] = {}
+        self._index = index
+        # Position of each requirement in the input, for stable ordering of lookups
+        self._req_order: Dict[str, int] = {}
+        self._ref_ids: Dict[str, Set[str]] = {}
+        self._closures: Dict[str, _PrefixClosure] = {}
+
+        for req in self.all_requirements:
+            if req.id not in self.requirements:
+                self._req_order[req.id] = len(self._req_order)
+                self.requirements[req.id] = req
+
+        for test_case in test_cases:
+            for _id in test_case.ids:
+                self.test_cases.setdefault(_id, test_case)
+
+    @property
+    def index(self) -> TraceabilityIndex:
+        if self._index is None:
+            self._index = TraceabilityIndex.build(self.requirements, self.test_cases)
+        return self._index
+
+    def get_requirement(self, req_id: str) -> Optional[Requirement]:
+        return self.requirements.get(req_id)
+
+    def get_test_case(self, req_id: str) -> Optional[TestCase]:
+        return self.test_cases.get(req_id)
+
+    def get_ref_ids(self, req: Requirement) -> Set[str]:
+        """Returns the IDs referenced by a requirement and its test case."""
+        return _get_ids_for_req(req, self.get_test_case(req.id))
+
+    def get_requirements_for_test_case(self, test_case: TestCase) -> List[Requirement]:
+        """Returns the requirements covered by a test case, in input order."""
+        req_ids = self.index.test_case_reqs.get(test_case.testcase_id)
+        if req_ids is None:
+            req_ids = sorted(
+                {_id for _id in test_case.ids if _id in self.requirements},
+                key=self._req_order.__getitem__,
+            )
+        return [self.requirements[_id] for _id in req_ids if _id in self.requirements]
+
+    def get_referrers(self, _id: str) -> List[Requirement]:
+        """Returns the requirements referencing an ID, themselves or through their test case."""
+        return [
+            self.requirements[req_id]
+            for req_id in self.index.referrers.get(_id, [])
+            if req_id in self.requirements
+        ]
+
+    def _get_successors(self, req_id: str, prefix: str) -> List[str]:
+        # References which the traversal continues through for the given prefix
+        return [
+            _id
+            for _id in self._get_cached_ref_ids(req_id)
+            if not _id.startswith(prefix) and _id in self.requirements
+        ]
+
+    def _get_cached_ref_ids(self, req_id: str) -> Set[str]:
+        if req_id not in self._ref_ids:
+            self._ref_ids[req_id] = self.get_ref_ids(self.requirements[req_id])
+        return self._ref_ids[req_id]
+
+    def _find_cycle(self, component: List[str], prefix: str) -> List[str]:
+        """Returns a shortest reference cycle through the smallest ID of a component."""
+        members = set(component)
+        start = min(component)
+        parents: Dict[str, str] = {}
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            for succ in sorted(self._get_successors(node, prefix)):
+                if succ not in members:
+                    continue
+                if succ == start:
+                    path = [node]
+                    while path[-1] != start:
+                        path.append(parents[path[-1]])
+                    return list(reversed(path)) + [start]
+                if succ not in parents:
+                    parents[succ] = node
+                    queue.append(succ)
+        raise AssertionError(f"No cycle found in component {component}")
+
+    def compute_closure(self, prefix: str, reqs: Iterable[Requirement]) -> None:
+        """Computes the prefix IDs reachable from each of the given requirements.
+
+        The reference graph is walked once, using Tarjan's algorithm for strongly
+        connected components. Components are completed in reverse topological order,
+        so the result for a requirement is the union of the already computed results
+        of the requirements it references. Results are memoized per prefix as bitsets,
+        and shared by all subsequent calls to `traverse`.
+
+        Args:
+            prefix: ID prefix to search for.
+            reqs: Requirements to compute the result for.
+
+        Raises:
+            RuntimeError: If any circular references are found. All cycles are reported.
+        """
+        closure = self._closures.setdefault(prefix, _PrefixClosure())
+
+        index: Dict[str, int] = {}
+        lowlink: Dict[str, int] = {}
+        stack: List[str] = []
+        on_stack: Set[str] = set()
+        cycles: List[List[str]] = []
+
+        def visit(req_id: str) -> Iterator[str]:
+            index[req_id] = lowlink[req_id] = len(index)
+            stack.append(req_id)
+            on_stack.add(req_id)
+            return iter(self._get_successors(req_id, prefix))
+
+        for req in reqs:
+            if req.id in closure.bits or req.id in index:
+                continue
+
+            work = [(req.id, visit(req.id))]
+            while work:
+                node, successors = work[-1]
+                for succ in successors:
+                    if succ in closure.bits:
+                        continue
+                    if succ not in index:
+                        work.append((succ, visit(succ)))
+                        break
+                    if succ in on_stack:
+                        lowlink[node] = min(lowlink[node], index[succ])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+                    if lowlink[node] != index[node]:
+                        continue
+
+                    component: List[str] = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+
+                    if len(component) > 1 or node in self._get_successors(node, prefix):
+                        cycles.append(self._find_cycle(component, prefix))
+
+                    for member in component:
+                        bits = 0
+                        for _id in self._get_cached_ref_ids(member):
+                            if _id.startswith(prefix):
+                                bits |= closure.get_bit(_id)
+                            elif _id in self.requirements:
+                                bits |= closure.bits.get(_id, 0)
+                        closure.bits[member] = bits
+
+        if cycles:
+            raise RuntimeError(
+                "Circular reference detected: "
+                + "; ".join(" -> ".join(cycle) for cycle in sorted(cycles))
+            )
+
+    def traverse(self, req: Requirement, prefix: str) -> Set[str]:
+        """Finds all IDs with a given prefix reachable through the references of a requirement.
+
+        References not matching the prefix are followed if they point to a known
+        requirement, while references matching the prefix end the traversal.
+
+        Args:
+            req: Requirement to start from.
+            prefix: ID prefix to search for.
+
+        Returns:
+            The set of matching IDs.
+        """
+        if self.requirements.get(req.id) is not req:
+            # A duplicate of an indexed requirement, which has references of its own
+            ids: Set[str] = set()
+            for _id in self.get_ref_ids(req):
+                if _id.startswith(prefix):
+                    ids.add(_id)
+                elif _id in self.requirements:
+                    ids.update(self.traverse(self.requirements[_id], prefix))
+            return ids
+
+        closure = self._closures.get(prefix)
+        if closure is None or req.id not in closure.bits:
+            self.compute_closure(prefix, [req])
+            closure = self._closures[prefix]
+        return closure.get_ids(closure.bits[req.id])
+
+
+class _PrefixClosure:
+    """Memoized traversal results for a single prefix, stored as bitsets of matching IDs."""
+
+    def __init__(self):
+        self.bits: Dict[str, int] = {}
+        self.ids: List[str] = []
+        self._bit_for_id: Dict[str, int] = {}
+
+    def get_bit(self, _id: str) -> int:
+        if _id not in self._bit_for_id:
+            self._bit_for_id[_id] = 1 << len(self.ids)
+            self.ids.append(_id)
+        return self._bit_for_id[_id]
+
+    def get_ids(self, bits: int) -> Set[str]:
+        result: Set[str] = set()
+        while bits:
+            lowest = bits & -bits
+            result.add(self.ids[lowest.bit_length() - 1])
+            bits ^= lowest
+        return result
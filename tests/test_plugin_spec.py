@@ -1,4 +1,16 @@
-from nydok import testcase
+import dataclasses
+import io
+import json
+import subprocess
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from nydok import jsonwriter, schema, testcase
+from nydok.results import Results, write_json, write_results
+from nydok.schema import DataclassJsonEncoder, FrozenRequirement, Requirement, RiskAssessment
+from nydok.traceability import TraceabilityGraph, TraceabilityIndex
 
 
 @testcase("FR001")
@@ -128,6 +140,122 @@ def test_change_regex_config(pytester):
     result.assert_outcomes(passed=2)
 
 
+@testcase("FR022")
+def test_spec_cache(pytester):
+    pytester.plugins = ["nydok"]
+
+    pytester.makepyfile(
+        """
+
+        from nydok import testcase
+
+        @testcase("FR001")
+        def test_hello_default():
+            assert True
+
+        """
+    )
+    spec_path = pytester.makefile(".spec.md", ("# Some heading\n\n- FR001: Some requirement\n"))
+
+    def get_desc():
+        result = pytester.runpytest_subprocess(
+            "-p", "nydok", "--nydok-spec-cache", "--nydok-output", "nydok.json"
+        )
+        result.assert_outcomes(passed=2)
+        return json.loads((pytester.path / "nydok.json").read_text())["requirements"]["FR001"][
+            "desc"
+        ]
+
+    assert get_desc() == "Some requirement"
+
+    # Unchanged file is read from the cache, so tampering with the entry is visible
+    (cache_file,) = (pytester.path / ".pytest_cache" / "v" / "nydok" / "specs").iterdir()
+    entry = json.loads(cache_file.read_text())
+    entry["requirements"][0][1] = "Cached requirement"
+    cache_file.write_text(json.dumps(entry))
+    assert get_desc() == "Cached requirement"
+
+    # Changed file is parsed again
+    spec_path.write_text("# Some heading\n\n- FR001: Changed requirement\n")
+    assert get_desc() == "Changed requirement"
+
+
+@testcase("FR023")
+def test_parse_workers(pytester):
+    pytester.plugins = ["nydok"]
+
+    pytester.makepyfile(
+        """
+
+        from nydok import testcase
+
+        @testcase("FR003")
+        def test_hello_default():
+            assert True
+
+        """
+    )
+    pytester.makefile(
+        ".junit.xml",
+        JUNIT_XML_TEMPLATE.format(
+            testcase1="FR001: Foo",
+            testcase1failure="",
+            testcase2="FR002: Bar",
+            testcase2failure="",
+        ),
+    )
+    pytester.mkdir("specs")
+    (pytester.path / "specs" / "a.spec.md").write_text("# A\n\n- FR001: Foo\n- FR002: Bar\n")
+    (pytester.path / "specs" / "b.spec.md").write_text("# B\n\n- FR003 [FR001]: Baz\n")
+
+    outputs = []
+    for args in [[], ["--nydok-parse-workers", "2"]]:
+        result = pytester.runpytest_subprocess("-p", "nydok", "--nydok-output", "nydok.json", *args)
+        result.assert_outcomes(passed=6)
+        outputs.append((pytester.path / "nydok.json").read_text())
+    assert outputs[0] == outputs[1]
+
+
+@testcase("FR024")
+def test_parse_workers_ignored_files(pytester):
+    pytester.plugins = ["nydok"]
+
+    pytester.makeconftest(
+        """
+        from pathlib import Path
+
+        from nydok.plugin.parsepool import parse_pool
+
+        collect_ignore = ["c.spec.md"]
+
+        _submit = parse_pool.submit
+
+        def submit(path, *args):
+            with open("submitted.txt", "a") as f:
+                f.write(Path(path).name + "\\n")
+            _submit(path, *args)
+
+        parse_pool.submit = submit
+        """
+    )
+    pytester.mkdir("specs")
+    (pytester.path / "specs" / "a.spec.md").write_text("# A\n\n- FR001: Foo\n")
+    (pytester.path / "specs" / "b.spec.md").write_text("# B\n\n- FR002: Bar\n")
+    (pytester.path / "c.spec.md").write_text("# C\n\n- FR003: Baz\n")
+
+    result = pytester.runpytest_subprocess(
+        "-p", "nydok", "--nydok-parse-workers", "2", "--ignore", "specs/b.spec.md"
+    )
+    result.assert_outcomes(failed=1)
+    assert (pytester.path / "submitted.txt").read_text() == "a.spec.md\n"
+
+    # Invalid number of workers in the configuration file
+    pytester.makeini("[pytest]\nnydok-parse-workers = many\n")
+    result = pytester.runpytest_subprocess("-p", "nydok")
+    assert result.ret == pytest.ExitCode.USAGE_ERROR
+    result.stderr.fnmatch_lines(["*nydok-parse-workers must be an integer, got 'many'*"])
+
+
 @testcase(["FR030"])
 def test_one_implementation_must_be_able_to_reference_multiple(pytester):
     pytester.plugins = ["nydok"]
@@ -151,6 +279,167 @@ def test_one_implementation_must_be_able_to_reference_multiple(pytester):
     result.assert_outcomes(passed=3)
 
 
+@testcase("FR040")
+def test_compact_results_format(pytester):
+    pytester.plugins = ["nydok"]
+
+    pytester.makepyfile(
+        """
+
+        from nydok import testcase
+
+        @testcase(["FR001", "FR002"], io=[((1, 2), 3)], ref_ids=["RA001"])
+        def test_hello_default(io=None):
+            assert True
+
+        """
+    )
+    pytester.makefile(
+        ".spec.md",
+        ("# Some heading\n\n- FR001: Requirement 1\n- FR002 [FR001]: Requirement 2\n"),
+    )
+    for output in ["nydok.json", "nydok.db"]:
+        result = pytester.runpytest_subprocess("-s", "-p", "nydok", "--nydok-output", output)
+        result.assert_outcomes(passed=3)
+
+    subprocess.check_call("nydok export-json --output exported.json nydok.db", shell=True)
+    assert (pytester.path / "exported.json").read_text() == (
+        pytester.path / "nydok.json"
+    ).read_text()
+
+    # Reports are identical regardless of results format
+    for report in ["traceability-matrix", "test-cases"]:
+        reports = [
+            subprocess.check_output(f"nydok report {report} {output}", shell=True)
+            for output in ["nydok.json", "nydok.db"]
+        ]
+        assert reports[0] == reports[1]
+
+
+@testcase("FR041")
+def test_results_index(pytester):
+    pytester.plugins = ["nydok"]
+
+    pytester.makepyfile(
+        """
+
+        from nydok import testcase
+
+        @testcase(["FR001", "FR002"], ref_ids=["RA001"])
+        def test_first():
+            assert True
+
+        @testcase("FR003")
+        def test_second():
+            assert True
+
+        """
+    )
+    pytester.makefile(
+        ".spec.md",
+        (
+            "# Some heading\n\n- FR001: Requirement 1\n- FR002 [FR001]: Requirement 2\n"
+            "- FR003 [FR001]: Requirement 3\n"
+        ),
+    )
+    for output in ["nydok.json", "nydok.db"]:
+        result = pytester.runpytest_subprocess("-p", "nydok", "--nydok-output", output)
+        result.assert_outcomes(passed=5)
+
+        index = Results(pytester.path / output).index
+        assert index is not None
+        assert index.req_test_cases == {"FR001": ["TC001"], "FR002": ["TC001"], "FR003": ["TC002"]}
+        assert index.test_case_reqs == {"TC001": ["FR001", "FR002"], "TC002": ["FR003"]}
+        assert index.referrers == {
+            "RA001": ["FR001", "FR002"],
+            "FR001": ["FR002", "FR003"],
+        }
+
+        results = Results(pytester.path / output)
+        graph = TraceabilityGraph(
+            results["requirements"].values(), results["test_cases"].values(), results.index
+        )
+        assert [req.id for req in graph.get_referrers("FR001")] == ["FR002", "FR003"]
+
+
+@testcase("FR042")
+def test_compact_records(tmp_path):
+    test_case = schema.TestCase(
+        ["FR001", "FR002"], "TC001", None, None, "test", "", [], False, True
+    )
+    requirements = {
+        "FR001": Requirement("FR001", "Requirement 1", Path("a.spec.md"), 1, []),
+        "FR002": Requirement("FR002", "Requirement 2", Path("a.spec.md"), 2, ["FR001"]),
+    }
+    for name in ["nydok.json", "nydok.db"]:
+        write_results(tmp_path / name, {"FR001": test_case, "FR002": test_case}, requirements, {})
+
+        results = Results(tmp_path / name, frozen=True)
+        req_1, req_2 = results["requirements"]["FR001"], results["requirements"]["FR002"]
+        assert isinstance(req_1, FrozenRequirement)
+        assert dataclasses.asdict(req_2) == dataclasses.asdict(requirements["FR002"])
+        assert req_1.file_path is req_2.file_path
+        assert req_2.ref_ids[0] is req_1.id
+        assert not hasattr(req_1, "__dict__")
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            results["test_cases"]["FR001"].passed = False
+
+
+@testcase("FR043")
+def test_json_results_writer(tmp_path):
+    test_cases = {
+        "FR001": schema.TestCase(
+            ["FR001", "FR002"],
+            "TC001",
+            'Tést "case" 😀\n<1>',
+            [((1, 2.5, float("nan")), {"a": [], "b": {}, 3: None}), (Path("x"), date(2024, 1, 2))],
+            "test_1",
+            "def test_1():\n\tpass\n",
+            [],
+            False,
+            True,
+        ),
+        "FR003": schema.FrozenTestCase(
+            ["FR003"], None, None, None, "test_2", "", None, True, False
+        ),
+    }
+    test_cases["FR002"] = test_cases["FR001"]
+    requirements = {
+        "FR001": Requirement("FR001", "Requirement 1", Path("a.spec.md"), 1, []),
+        "FR002": FrozenRequirement("FR002", "Requirement 2", "b.spec.md", 2, ["FR001", "RA001"]),
+    }
+    risk_assessments = {
+        "RA001": RiskAssessment(
+            "RA001", "Risk", "Bad", "low", "low", "low", "Test", ["FR001"], "low", "low", "low"
+        )
+    }
+
+    documents = [
+        {},
+        {
+            "test_cases": {},
+            "requirements": {},
+            "risk_assessments": {},
+            "index": TraceabilityIndex(),
+        },
+        {
+            "test_cases": test_cases,
+            "requirements": requirements,
+            "risk_assessments": risk_assessments,
+            "index": TraceabilityIndex.build(requirements, test_cases),
+        },
+    ]
+    for document in documents:
+        sink = io.StringIO()
+        jsonwriter.dump(document, sink)
+        assert sink.getvalue() == json.dumps(document, cls=DataclassJsonEncoder, indent=4)
+
+    write_json(tmp_path / "nydok.json", test_cases, requirements, risk_assessments)
+    assert (tmp_path / "nydok.json").read_text() == json.dumps(
+        documents[-1], cls=DataclassJsonEncoder, indent=4
+    )
+
+
 @testcase(["UR032", "FR120"])
 def test_each_requirement_must_have_a_test_case(pytester):
     pytester.plugins = ["nydok"]
@@ -1,8 +1,20 @@
+import json
 import os
 import subprocess
 from pathlib import Path
 
-from nydok import testcase
+import pytest
+
+from nydok import schema, testcase
+from nydok.cli import UNUSED_FIELDS, _load_results
+from nydok.report import (
+    create_risk_report,
+    create_test_case_report,
+    create_test_overview_report,
+    create_traceability_matrix,
+)
+from nydok.results import Results, write_results
+from nydok.schema import Requirement, RiskAssessment
 
 SCRIPT_DIR = Path(__file__).parent
 
@@ -78,6 +90,78 @@ def test_traceability_matrix_report(pytester):
             assert expected.read() == f.read()
 
 
+@testcase("FR540")
+def test_traceability_matrix_shared_and_circular_references(pytester):
+    pytester.plugins = ["nydok"]
+
+    pytester.makepyfile(
+        """
+
+        from nydok import testcase
+
+        @testcase(["UR001", "FR001", "FR002", "DS001"])
+        def test_hello():
+            assert True
+
+        """
+    )
+    pytester.makefile(
+        ".spec.md",
+        (
+            "# Some heading\n\n- UR001: User specification\n"
+            "- FR001 [UR001]: First functional specification\n"
+            "- FR002 [UR001]: Second functional specification\n"
+            "- DS001 [FR001,FR002]: Design specification\n"
+        ),
+    )
+
+    result = pytester.runpytest_subprocess("-s", "-p", "nydok", "--nydok-output", "nydok.json")
+    assert result.ret == 0
+
+    # DS001 reaches UR001 through both FR001 and FR002
+    tm_output_file: Path = pytester.makefile(".md", "")
+    subprocess.check_call(
+        (
+            "nydok report traceability-matrix --categories 'User specification,UR' --base-prefix DS"
+            f" --output {tm_output_file.absolute()} nydok.json"
+        ),
+        shell=True,
+    )
+    assert tm_output_file.read_text().splitlines()[2].split(" | ")[:3] == [
+        "UR001             ",
+        "DS001",
+        "Design specification",
+    ]
+
+    reqs = [
+        Requirement("DS001", "", Path("spec.md"), 1, ["FR001"]),
+        Requirement("FR001", "", Path("spec.md"), 2, ["FR002"]),
+        Requirement("FR002", "", Path("spec.md"), 3, ["FR001"]),
+        Requirement("FR003", "", Path("spec.md"), 4, ["FR003"]),
+    ]
+    with pytest.raises(RuntimeError) as excinfo:
+        create_traceability_matrix(reqs, [], categories=[("User specification", "UR")])
+    assert str(excinfo.value) == (
+        "Circular reference detected: FR001 -> FR002 -> FR001; FR003 -> FR003"
+    )
+
+
+@testcase("FR541")
+def test_traceability_matrix_duplicate_requirements():
+    reqs = [
+        Requirement("FR001", "First", Path("a.spec.md"), 1, ["UR001"]),
+        Requirement("UR001", "User specification", Path("a.spec.md"), 2, []),
+        Requirement("FR001", "Duplicate", Path("b.spec.md"), 1, ["UR002"]),
+    ]
+    matrix = create_traceability_matrix(reqs, [], categories=[("User specification", "UR")])
+    rows = [[col.strip() for col in line.split(" | ")] for line in matrix.splitlines()[2:]]
+    assert rows == [
+        ["UR001", "FR001", "First", "", ""],
+        ["UR002", "FR001", "Duplicate", "", ""],
+        ["-", "UR001", "User specification", "", ""],
+    ]
+
+
 @testcase("FR550")
 def test_risk_assessment_report(pytester):
     pytester.plugins = ["nydok"]
@@ -246,6 +330,69 @@ def test_test_case_report(pytester):
             assert expected.read() == f.read()
 
 
+@testcase("FR640")
+def test_all_reports(pytester):
+    pytester.plugins = ["nydok"]
+
+    pytester.makepyfile(
+        """
+        from nydok import testcase
+
+        @testcase(["UR001", "FR001"])
+        def test_hello():
+            assert True
+
+        """
+    )
+    pytester.makefile(
+        ".spec.md",
+        ("# Some heading\n\n- UR001: User specification\n- FR001 [UR001]: Functional spec\n"),
+    )
+    ra_file: Path = pytester.makefile(
+        ".yml",
+        """
+            RA001:
+                description: Risk assessment description.
+                consequence: Consequence description.
+                prior_probability: low
+                prior_severity: low
+                prior_detectability: high
+                mitigation: Mitigation description.
+                residual_probability: low
+                residual_severity: low
+                residual_detectability: high
+        """,
+    )
+    result = pytester.runpytest_subprocess(
+        "-s", "-p", "nydok", "--nydok-output", "nydok.json", "--nydok-risk-assessment", ra_file
+    )
+    assert result.ret == 0
+
+    subprocess.check_call(
+        (
+            "nydok report all --categories 'User specification,UR' --base-prefix FR"
+            " --jobs 2 --output-dir reports nydok.json"
+        ),
+        shell=True,
+    )
+
+    # Each report is identical to the one created by its own command
+    report_args = {
+        "traceability-matrix": "--categories 'User specification,UR' --base-prefix FR",
+        "risk-assessment": "",
+        "test-overview": "",
+        "test-cases": "",
+    }
+    for report_name, args in report_args.items():
+        output_file = pytester.path / f"{report_name}.md"
+        subprocess.check_call(
+            f"nydok report {report_name} {args} --output {output_file} nydok.json", shell=True
+        )
+        assert (pytester.path / "reports" / f"{report_name}.md").read_text() == (
+            output_file.read_text()
+        )
+
+
 @testcase(["FR650", "FR651", "FR660", "FR670"])
 def test_code_change_report(pytester):
     pytester.plugins = ["nydok"]
@@ -315,7 +462,7 @@ def test_code_change_report(pytester):
         cc_output_file: Path = pytester.makefile(".md", "")
         subprocess.check_call(
             (
-                "nydok report code-review --to-ref main --from-ref v1.0"
+                "nydok report code-review --to-ref main --from-ref v1.0 --mr-lookup list"
                 f" --repo-path repo --output {cc_output_file.absolute()}"
             ),
             shell=True,
@@ -331,6 +478,794 @@ def test_code_change_report(pytester):
         os.environ["GITLAB_URL"] = _gitlab_url
 
 
+@testcase("FR641")
+def test_report_output_replaced_on_success(pytester):
+    from pytest_httpserver import HTTPServer
+
+    output_file: Path = pytester.makefile(".md", "Previous report")
+    with HTTPServer() as server:
+        env = {
+            **os.environ,
+            "GITLAB_TOKEN": "test-token",
+            "GITLAB_URL": f"http://localhost:{server.port}",
+        }
+        server.expect_request("/api/v4/projects/repo/repository/commits").respond_with_data(
+            "Not found", status=404
+        )
+        command = f"nydok report code-review --to-ref main --repo-path repo --output {output_file}"
+
+        # A failing report leaves the previous one in place
+        assert subprocess.call(command, shell=True, env=env) != 0
+        assert output_file.read_text() == "Previous report"
+        assert list(pytester.path.glob(f".{output_file.name}.*")) == []
+
+        server.clear()
+        server.expect_request("/api/v4/projects/repo/repository/commits").respond_with_json([])
+        server.expect_request("/api/v4/projects/repo/merge_requests").respond_with_json([])
+        subprocess.check_call(command, shell=True, env=env)
+        assert output_file.read_text().startswith("## Approved code changes")
+        assert list(pytester.path.glob(f".{output_file.name}.*")) == []
+
+
+@testcase("FR642")
+def test_reports_omitted_fields(tmp_path):
+    test_case = schema.TestCase(
+        ["FR001", "DS001"], "TC001", "Test", [(1, 2)], "test", "def test():\n", [], False, True
+    )
+    requirements = {
+        "UR001": Requirement("UR001", "User specification", Path("a.spec.md"), 1, []),
+        "FR001": Requirement("FR001", "Requirement", Path("a.spec.md"), 2, ["UR001"]),
+        "DS001": Requirement("DS001", "Design", Path("b.spec.md"), 1, ["FR001", "RA001"]),
+    }
+    risk_assessments = {
+        "RA001": RiskAssessment(
+            "RA001", "Risk", "Bad", "low", "low", "low", "Test", ["DS001"], "low", "low", "low"
+        )
+    }
+
+    def create_reports(results: Results):
+        reqs = list(results["requirements"].values())
+        test_cases = list(results["test_cases"].values())
+        return {
+            "traceability-matrix": create_traceability_matrix(
+                reqs, test_cases, categories=[("User specification", "UR")], base_prefix="DS"
+            ),
+            "risk-assessment": create_risk_report(results["risk_assessments"]),
+            "test-overview": create_test_overview_report(reqs, test_cases),
+            "test-cases": create_test_case_report(reqs, test_cases),
+        }
+
+    for name in ["nydok.json", "nydok.db"]:
+        path = tmp_path / name
+        write_results(
+            path, {"FR001": test_case, "DS001": test_case}, requirements, risk_assessments
+        )
+        expected = create_reports(Results(path))
+        assert set(expected) == set(UNUSED_FIELDS)
+
+        for report_name, unused_fields in UNUSED_FIELDS.items():
+            results = _load_results(path, [report_name])
+            for section, fields in unused_fields.items():
+                for record in results[section].values():
+                    assert all(getattr(record, field) is None for field in fields)
+            # Reports don't depend on the fields they leave out
+            assert create_reports(results)[report_name] == expected[report_name]
+
+
+@testcase("FR652")
+def test_code_change_report_server_side_lookup(pytester):
+    pytester.plugins = ["nydok"]
+
+    from pytest_httpserver import HTTPServer
+
+    def merge_request(title, merged_at, sha):
+        return {
+            "title": title,
+            "state": "merged",
+            "merged_at": merged_at,
+            "merge_commit_sha": sha,
+            "author": {"name": "Test user"},
+            "reviewers": [{"name": "Test reviewer"}],
+        }
+
+    mr4 = merge_request(
+        "Title 4", "2022-06-14T11:08:35Z", "ec00b4f28b7b494d2c0f7f2e31511f81316c8044"
+    )
+    mr3 = merge_request(
+        "Title 3", "2022-05-25T10:27:10Z", "f5f2a240d58d415b460911fa759eb25a08d1f427"
+    )
+
+    with HTTPServer() as server:
+        # For restoring original env afterwards
+        _gitlab_url = os.environ.get("GITLAB_URL")
+        _gitlab_token = os.environ.get("GITLAB_TOKEN")
+        os.environ["GITLAB_TOKEN"] = "test-token"
+        os.environ["GITLAB_URL"] = f"http://localhost:{server.port}"
+
+        server.expect_request(
+            "/api/v4/projects/repo/repository/commits",
+            query_string="ref_name=v1.0...main&per_page=100",
+        ).respond_with_json(
+            [
+                {
+                    "id": "ec00b4f28b7b494d2c0f7f2e31511f81316c8044",
+                    "parent_ids": ["be5ab2735fff02364d09dca19cde8e61905368a3", "a" * 40],
+                    "committed_date": "2022-06-14T11:08:35.000+00:00",
+                },
+                {
+                    "id": "be5ab2735fff02364d09dca19cde8e61905368a3",
+                    "parent_ids": ["f5f2a240d58d415b460911fa759eb25a08d1f427"],
+                    "committed_date": "2022-06-01T09:00:00.000+00:00",
+                },
+                {
+                    "id": "f5f2a240d58d415b460911fa759eb25a08d1f427",
+                    "parent_ids": ["268580c4cecca0c6957a7d0af5f0b3d080a9dcdd", "b" * 40],
+                    "committed_date": "2022-05-25T10:27:10.000+00:00",
+                },
+            ]
+        )
+
+        # Per merge commit lookup, only for commits with several parents
+        commits_url = "/api/v4/projects/repo/repository/commits/{}/merge_requests"
+        server.expect_request(commits_url.format(mr4["merge_commit_sha"])).respond_with_json([mr4])
+        server.expect_request(commits_url.format(mr3["merge_commit_sha"])).respond_with_json(
+            # Merge requests of the commits on a source branch aren't included
+            [merge_request("Source branch", "2022-05-20T10:00:00Z", "c" * 40), mr3]
+        )
+
+        # Listing, only merge requests updated since the oldest commit in the range
+        server.expect_request(
+            "/api/v4/projects/repo/merge_requests",
+            query_string="state=merged&updated_after=2022-05-24T10%3A27%3A10%2B00%3A00&per_page=100",
+        ).respond_with_json([mr3, mr4])
+
+        outputs = []
+        for mr_lookup in ["commits", "list", "auto"]:
+            output_file: Path = pytester.makefile(".md", "")
+            subprocess.check_call(
+                (
+                    f"nydok report code-review --to-ref main --from-ref v1.0 --mr-lookup {mr_lookup}"
+                    f" --repo-path repo --output {output_file.absolute()}"
+                ),
+                shell=True,
+            )
+            outputs.append(output_file.read_text())
+
+        server.check_assertions()
+
+    with open(SCRIPT_DIR / "snapshots" / "code-change-report.md", "r") as expected:
+        assert outputs == [expected.read()] * 3
+
+    if _gitlab_token:
+        os.environ["GITLAB_TOKEN"] = _gitlab_token
+    if _gitlab_url:
+        os.environ["GITLAB_URL"] = _gitlab_url
+
+
+@testcase("FR653")
+def test_code_change_report_graphql() -> None:
+    import json
+
+    from pytest_httpserver import HTTPServer
+    from werkzeug import Response
+
+    from nydok import gitlab
+    from nydok.gitlab import GitLabClient, set_client
+    from nydok.report import create_codereview_report
+
+    def graphql_merge_request(title, merged_at, sha):
+        return {
+            "mergeCommitSha": sha,
+            "title": title,
+            "mergedAt": merged_at,
+            "author": {"name": "Test user"},
+            "reviewers": {"nodes": [{"name": "Test reviewer"}]},
+            "approvedBy": {"nodes": [{"name": "Test approver"}]},
+        }
+
+    # By internal ID
+    graphql_mrs = {
+        "4": graphql_merge_request(
+            "Title 4", "2022-06-14T11:08:35Z", "ec00b4f28b7b494d2c0f7f2e31511f81316c8044"
+        ),
+        "3": graphql_merge_request(
+            "Title 3", "2022-05-25T10:27:10Z", "f5f2a240d58d415b460911fa759eb25a08d1f427"
+        ),
+        "2": graphql_merge_request("Not in range", "2022-05-23T12:32:00Z", "d" * 40),
+    }
+    queries = []
+
+    def graphql(request):
+        variables = request.json["variables"]
+        queries.append(variables)
+        nodes = [
+            mr
+            for iid, mr in graphql_mrs.items()
+            if variables.get("iids") is None or iid in variables["iids"]
+        ]
+        # One merge request per page, to follow the cursors
+        start = int(variables["after"] or 0)
+        connection = {
+            "pageInfo": {"hasNextPage": start + 1 < len(nodes), "endCursor": str(start + 1)},
+            "nodes": nodes[start : start + 1],
+        }
+        return Response(
+            json.dumps({"data": {"project": {"mergeRequests": connection}}}),
+            content_type="application/json",
+        )
+
+    with HTTPServer() as server:
+        server.expect_request("/api/graphql", method="POST").respond_with_handler(graphql)
+        server.expect_request(
+            "/api/v4/projects/repo/repository/commits",
+            query_string="ref_name=v1.0...main&per_page=100",
+        ).respond_with_json(
+            [
+                {
+                    "id": "ec00b4f28b7b494d2c0f7f2e31511f81316c8044",
+                    "parent_ids": ["be5ab2735fff02364d09dca19cde8e61905368a3", "a" * 40],
+                },
+                {
+                    "id": "be5ab2735fff02364d09dca19cde8e61905368a3",
+                    "parent_ids": ["f5f2a240d58d415b460911fa759eb25a08d1f427"],
+                },
+                {
+                    "id": "f5f2a240d58d415b460911fa759eb25a08d1f427",
+                    "parent_ids": ["268580c4cecca0c6957a7d0af5f0b3d080a9dcdd", "b" * 40],
+                },
+            ]
+        )
+        commits_url = "/api/v4/projects/repo/repository/commits/{}/merge_requests"
+        for iid in ["4", "3"]:
+            sha = graphql_mrs[iid]["mergeCommitSha"]
+            server.expect_request(commits_url.format(sha)).respond_with_json(
+                [{"iid": int(iid), "state": "merged", "merge_commit_sha": sha}]
+            )
+
+        _client = gitlab._client
+        set_client(GitLabClient(f"http://localhost:{server.port}/api/v4", "test-token"))
+        try:
+            reports = [
+                create_codereview_report(
+                    "repo", "main", "v1.0", mr_lookup=mr_lookup, mr_api="graphql"
+                )
+                for mr_lookup in ["commits", "list"]
+            ]
+        finally:
+            gitlab._client = _client
+
+    with open(SCRIPT_DIR / "snapshots" / "code-change-report.md", "r") as expected:
+        assert reports == [expected.read().replace("Test reviewer", "Test approver")] * 2
+
+    # The merge requests found per commit are fetched in one batch
+    assert [(q.get("iids"), q["after"]) for q in queries] == [
+        (["4", "3"], None),
+        (["4", "3"], "1"),
+        (None, None),
+        (None, "1"),
+        (None, "2"),
+    ]
+
+
+@testcase("FR654")
+def test_code_change_report_local_commits(tmp_path) -> None:
+    from pytest_httpserver import HTTPServer
+
+    from nydok import gitlab
+    from nydok.commitrange import resolve_commit_range
+    from nydok.gitlab import GitLabClient, set_client
+    from nydok.report import create_codereview_report
+
+    env = {
+        **os.environ,
+        "GIT_AUTHOR_NAME": "Test user",
+        "GIT_AUTHOR_EMAIL": "test@example.com",
+        "GIT_COMMITTER_NAME": "Test user",
+        "GIT_COMMITTER_EMAIL": "test@example.com",
+    }
+
+    def git(repo: Path, *args: str) -> str:
+        return subprocess.run(
+            ["git", "-C", str(repo), *args], check=True, capture_output=True, text=True, env=env
+        ).stdout.strip()
+
+    # Clone with a merge commit after the v1.0 tag
+    clone = tmp_path / "clone"
+    clone.mkdir()
+    git(clone, "init", "-b", "main")
+    git(clone, "commit", "--allow-empty", "-m", "Initial commit")
+    git(clone, "tag", "v1.0")
+    git(clone, "checkout", "-b", "feature")
+    git(clone, "commit", "--allow-empty", "-m", "Feature")
+    git(clone, "checkout", "main")
+    git(clone, "merge", "--no-ff", "-m", "Merge branch 'feature'", "feature")
+    tag_sha, feature_sha, merge_sha = (
+        git(clone, "rev-parse", ref) for ref in ["v1.0", "feature", "main"]
+    )
+
+    shallow_clone = tmp_path / "shallow"
+    git(tmp_path, "clone", "--depth", "1", clone.as_uri(), str(shallow_clone))
+
+    with HTTPServer() as server:
+        server.expect_request("/api/v4/projects/repo/repository/commits/v1.0").respond_with_json(
+            {"id": tag_sha}
+        )
+        server.expect_request("/api/v4/projects/repo/repository/commits/main").respond_with_json(
+            {"id": merge_sha}
+        )
+        server.expect_request(
+            f"/api/v4/projects/repo/repository/commits/{merge_sha}/merge_requests"
+        ).respond_with_json(
+            [
+                {
+                    "title": "Feature",
+                    "state": "merged",
+                    "merged_at": "2022-06-14T11:08:35Z",
+                    "merge_commit_sha": merge_sha,
+                    "author": {"name": "Test user"},
+                    "reviewers": [{"name": "Test reviewer"}],
+                }
+            ]
+        )
+        server.expect_request(
+            "/api/v4/projects/repo/repository/commits",
+            query_string="ref_name=v1.0...main&per_page=100",
+        ).respond_with_json(
+            [
+                {"id": merge_sha, "parent_ids": [tag_sha, feature_sha]},
+                {"id": feature_sha, "parent_ids": [tag_sha]},
+            ]
+        )
+
+        _client = gitlab._client
+        set_client(GitLabClient(f"http://localhost:{server.port}/api/v4", "test-token"))
+        try:
+            # The commits are listed from the complete clone, without paging through them
+            commit_range = resolve_commit_range("repo", "main", "v1.0", "auto", str(clone))
+            assert commit_range.source == "git"
+            assert [c["id"] for c in commit_range.commits] == [merge_sha, feature_sha]
+            assert commit_range.commits[0]["parent_ids"] == [tag_sha, feature_sha]
+            assert merge_sha in commit_range and tag_sha not in commit_range
+            assert not any(
+                request.path == "/api/v4/projects/repo/repository/commits"
+                for request, _ in server.log
+            )
+
+            report = create_codereview_report(
+                "repo", "main", "v1.0", commit_source="git", git_dir=str(clone)
+            )
+            assert f"{merge_sha[:7]} | Feature | 2022-06-14 | Test user | Test reviewer" in report
+
+            # Shallow clones lack the older commits, so the API is used
+            assert resolve_commit_range("repo", "main", "v1.0", "auto", str(shallow_clone)) == (
+                resolve_commit_range("repo", "main", "v1.0", "api")
+            )
+            assert resolve_commit_range("repo", "main", "v1.0", "auto").source == "api"
+            with pytest.raises(RuntimeError):
+                resolve_commit_range("repo", "main", "v1.0", "git", str(shallow_clone))
+        finally:
+            gitlab._client = _client
+
+
+@testcase("FR655")
+def test_code_change_report_offline(pytester) -> None:
+    import json
+
+    env = {
+        key: value for key, value in os.environ.items() if key not in ("GITLAB_URL", "GITLAB_TOKEN")
+    }
+    clone = pytester.path / "clone"
+    clone.mkdir()
+
+    def git(*args: str, author: str = "Test user", date: str = "2022-05-20T10:00:00Z") -> str:
+        commit_env = {
+            **env,
+            "GIT_AUTHOR_NAME": author,
+            "GIT_AUTHOR_EMAIL": "author@example.com",
+            "GIT_COMMITTER_NAME": "Gitlab",
+            "GIT_COMMITTER_EMAIL": "gitlab@example.com",
+            "GIT_AUTHOR_DATE": date,
+            "GIT_COMMITTER_DATE": date,
+        }
+        return subprocess.run(
+            ["git", "-C", str(clone), *args],
+            check=True,
+            capture_output=True,
+            text=True,
+            env=commit_env,
+        ).stdout.strip()
+
+    def merge(branch: str, message: str, date: str) -> str:
+        git("checkout", "-b", branch)
+        git("commit", "--allow-empty", "-m", f"Work on {branch}", author="Test user")
+        git("checkout", "main")
+        git("merge", "--no-ff", "-m", message, branch, date=date)
+        return git("rev-parse", "HEAD")
+
+    git("init", "-b", "main")
+    git("commit", "--allow-empty", "-m", "Initial commit")
+    git("tag", "v1.0")
+    mr_sha = merge(
+        "feature",
+        "Merge branch 'feature' into 'main'\n\nAdd feature\n\n"
+        "See merge request group/repo!4\n\n"
+        "Approved-by: Test reviewer <reviewer@example.com>\n"
+        "Approved-by: Another reviewer <another@example.com>",
+        # Merged on 2022-06-15 in UTC, by a committer in another time zone
+        "2022-06-16T02:00:00+05:00",
+    )
+    # Not created by Gitlab
+    merge("local", "Merge branch 'local'", "2022-06-15T09:00:00Z")
+    git("commit", "--allow-empty", "-m", "Squashed change", date="2022-06-15T22:00:00Z")
+    squash_sha = git("rev-parse", "HEAD")
+    git("commit", "--allow-empty", "-m", "Fast-forwarded change", date="2022-06-16T08:00:00Z")
+    fast_forward_sha = git("rev-parse", "HEAD")
+    # CI clones are detached, without local branches
+    git("checkout", "--detach")
+    git("branch", "-D", "main")
+
+    # Squashed and fast-forwarded merge requests are only known from Gitlab
+    mr_dump = pytester.path / "mrs.json"
+    mr_dump.write_text(
+        json.dumps(
+            [
+                {
+                    "title": "Squashed change",
+                    "merged_at": "2022-06-15T22:00:00.000Z",
+                    "merge_commit_sha": None,
+                    "squash_commit_sha": squash_sha,
+                    "author": {"name": "Test user"},
+                    "reviewers": [{"name": "Test reviewer"}],
+                    "approved_by": [{"user": {"name": "Test approver"}}],
+                },
+                {
+                    "title": "Fast-forwarded change",
+                    "merged_at": "2022-06-16T08:00:00Z",
+                    "merge_commit_sha": None,
+                    "squash_commit_sha": None,
+                    "sha": fast_forward_sha,
+                    "author": {"name": "Test user"},
+                    "reviewers": [{"name": "Test reviewer"}],
+                },
+                {
+                    "title": "Not in range",
+                    "merged_at": "2022-05-01T08:00:00Z",
+                    "merge_commit_sha": "d" * 40,
+                    "author": {"name": "Test user"},
+                    "reviewers": [],
+                },
+            ]
+        )
+    )
+
+    output_file = pytester.path / "code-review.md"
+    subprocess.check_call(
+        [
+            "nydok",
+            "report",
+            "code-review",
+            "--offline",
+            "--git-dir",
+            str(clone),
+            "--from-ref",
+            "v1.0",
+            "--mr-dump",
+            str(mr_dump),
+            "--output",
+            str(output_file),
+        ],
+        env=env,
+    )
+
+    assert output_file.read_text() == (
+        "## Approved code changes since version v1.0\n\n"
+        "Commit  | Title                 | Date       | Author    | Approver(s)                   \n"
+        "------- | --------------------- | ---------- | --------- | ------------------------------\n"
+        f"{fast_forward_sha[:7]} | Fast-forwarded change | 2022-06-16 | Test user | Test reviewer                 \n"
+        f"{squash_sha[:7]} | Squashed change       | 2022-06-15 | Test user | Test approver                 \n"
+        f"{mr_sha[:7]} | Add feature           | 2022-06-15 | Test user | Another reviewer,Test reviewer\n"
+    )
+
+
+@testcase("FR680")
+def test_gitlab_client_retries() -> None:
+    from pytest_httpserver import HTTPServer
+
+    from nydok.gitlab import GitLabClient, get_commit_for_tag
+
+    with HTTPServer() as server:
+        # Rate limited and failing first, then succeeding
+        url = "/api/v4/projects/repo/repository/tags/v1.0"
+        server.expect_ordered_request(url).respond_with_data(
+            "", status=429, headers={"Retry-After": "0"}
+        )
+        server.expect_ordered_request(url).respond_with_data("", status=502)
+        server.expect_ordered_request(
+            url, headers={"Authorization": "Bearer test-token"}
+        ).respond_with_json({"commit": {"id": "ec00b4f28b7b494d2c0f7f2e31511f81316c8044"}})
+
+        client = GitLabClient(
+            f"http://localhost:{server.port}/api/v4", "test-token", backoff_factor=0
+        )
+        assert get_commit_for_tag("repo", "v1.0", client=client) == (
+            "ec00b4f28b7b494d2c0f7f2e31511f81316c8044"
+        )
+        assert client.map(lambda x: x * 2, [1, 2, 3]) == [2, 4, 6]
+        client.close()
+
+        server.check_assertions()
+        assert len(server.log) == 3
+
+
+@testcase("FR681")
+def test_gitlab_client_pagination() -> None:
+    from pytest_httpserver import HTTPServer
+
+    from nydok.gitlab import GitLabClient
+
+    with HTTPServer() as server:
+        url = "/api/v4/projects/repo/merge_requests"
+        for page in [1, 2, 3]:
+            server.expect_request(
+                url,
+                query_string="state=merged&per_page=2" + (f"&page={page}" if page > 1 else ""),
+            ).respond_with_json(
+                [{"id": 2 * page - 1}, {"id": 2 * page}],
+                headers={"X-Page": str(page), "X-Total-Pages": "3"},
+            )
+
+        # Without totals, Link headers are followed
+        link_url = f"http://localhost:{server.port}/api/v4/projects/repo/jobs"
+        server.expect_request(
+            "/api/v4/projects/repo/jobs", query_string="per_page=2"
+        ).respond_with_json([{"id": 1}], headers={"Link": f'<{link_url}?cursor=a>; rel="next"'})
+        server.expect_request(
+            "/api/v4/projects/repo/jobs", query_string="cursor=a&per_page=2"
+        ).respond_with_json([{"id": 2}])
+
+        client = GitLabClient(f"http://localhost:{server.port}/api/v4", "test-token")
+        results = client.get_paginated(
+            client.api_url + "/projects/repo/merge_requests", {"state": "merged", "per_page": 2}
+        )
+        assert [r["id"] for r in results] == [1, 2, 3, 4, 5, 6]
+
+        results = client.get_paginated(client.api_url + "/projects/repo/jobs", {"per_page": 2})
+        assert [r["id"] for r in results] == [1, 2]
+        client.close()
+
+
+@testcase("FR682")
+def test_gitlab_client_cache(tmp_path) -> None:
+    from pytest_httpserver import HTTPServer
+
+    from nydok.gitlab import GitLabClient
+    from nydok.httpcache import HttpCache
+
+    with HTTPServer() as server:
+        server.expect_request("/api/v4/jobs/1/trace").respond_with_data("TRACE1")
+        server.expect_request("/api/v4/jobs/2/trace").respond_with_data("TRACE2")
+        server.expect_request("/api/v4/jobs/3/trace").respond_with_data("TRACE3")
+
+        # Mutable resource, revalidated by ETag
+        url = "/api/v4/projects/repo/merge_requests"
+        server.expect_oneshot_request(url).respond_with_json([{"id": 1}], headers={"ETag": '"a"'})
+        server.expect_oneshot_request(url, headers={"If-None-Match": '"a"'}).respond_with_data(
+            "", status=304
+        )
+        server.expect_oneshot_request(url, headers={"If-None-Match": '"a"'}).respond_with_json(
+            [{"id": 1}, {"id": 2}], headers={"ETag": '"b"'}
+        )
+
+        api_url = f"http://localhost:{server.port}/api/v4"
+        for expected_mrs in [[{"id": 1}], [{"id": 1}], [{"id": 1}, {"id": 2}]]:
+            client = GitLabClient(api_url, "test-token", cache=HttpCache(tmp_path))
+            assert client.get_paginated(api_url + "/projects/repo/merge_requests", {}) == (
+                expected_mrs
+            )
+            assert client.get(api_url + "/jobs/1/trace", immutable=True).text == "TRACE1"
+            client.close()
+        server.check_assertions()
+        # Immutable resource is only fetched once
+        assert [request.path for request, _ in server.log].count("/api/v4/jobs/1/trace") == 1
+
+        # Responses are not shared with other tokens, even for immutable resources
+        client = GitLabClient(api_url, "other-token", cache=HttpCache(tmp_path))
+        assert client.get(api_url + "/jobs/1/trace", immutable=True).text == "TRACE1"
+        client.close()
+        trace_requests = [r for r, _ in server.log if r.path == "/api/v4/jobs/1/trace"]
+        assert [r.headers["Authorization"] for r in trace_requests] == [
+            "Bearer test-token",
+            "Bearer other-token",
+        ]
+
+        # Streamed bodies are copied to files, and streamed from them when reused
+        server.clear_log()
+        for _ in range(2):
+            client = GitLabClient(api_url, "test-token", cache=HttpCache(tmp_path / "streamed"))
+            with client.get(api_url + "/jobs/2/trace", immutable=True, stream=True) as resp:
+                assert list(resp.iter_content(4)) == [b"TRAC", b"E2"]
+            client.close()
+        assert len(list((tmp_path / "streamed" / "bodies").iterdir())) == 1
+        assert [request.path for request, _ in server.log] == ["/api/v4/jobs/2/trace"]
+
+        # Streamed bodies beyond the maximum size are still returned, but not kept
+        client = GitLabClient(api_url, "test-token", cache=HttpCache(tmp_path / "tiny", 4))
+        with client.get(api_url + "/jobs/3/trace", immutable=True, stream=True) as resp:
+            assert resp.text == "TRACE3"
+        client.close()
+        assert list((tmp_path / "tiny" / "bodies").iterdir()) == []
+
+        # Least recently used responses are evicted beyond the maximum size, whether
+        # stored in the database or as files
+        for stream in [False, True]:
+            server.clear_log()
+            cache_dir = tmp_path / f"small-{stream}"
+            cache = HttpCache(cache_dir, max_size=len("TRACE1") + len("TRACE2"))
+            client = GitLabClient(api_url, "test-token", cache=cache)
+            for job_id in [1, 2, 1, 3, 1, 2]:
+                url = api_url + f"/jobs/{job_id}/trace"
+                with client.get(url, immutable=True, stream=stream) as resp:
+                    assert resp.text == f"TRACE{job_id}"
+            client.close()
+            # Job 2 was least recently used when job 3 was stored
+            assert [request.path for request, _ in server.log] == [
+                "/api/v4/jobs/1/trace",
+                "/api/v4/jobs/2/trace",
+                "/api/v4/jobs/3/trace",
+                "/api/v4/jobs/2/trace",
+            ]
+            assert len(list((cache_dir / "bodies").iterdir())) == (2 if stream else 0)
+
+
+@testcase("FR683")
+def test_gitlab_reports(pytester) -> None:
+    import asyncio
+    import threading
+    import time
+
+    from pytest_httpserver import HTTPServer
+
+    from werkzeug import Response
+
+    from nydok import gitlab_async
+    from nydok.gitlab import GitLabClient
+    from nydok.gitlab_async import AsyncGitLabClient
+
+    with HTTPServer() as server:
+        env = {
+            **os.environ,
+            "GITLAB_TOKEN": "test-token",
+            "GITLAB_URL": f"http://localhost:{server.port}",
+        }
+
+        server.expect_request(
+            "/api/v4/projects/repo/repository/commits",
+            query_string="ref_name=v1.0...main&per_page=100",
+        ).respond_with_json(
+            [
+                {"id": "ec00b4f28b7b494d2c0f7f2e31511f81316c8044"},
+                {"id": "be5ab2735fff02364d09dca19cde8e61905368a3"},
+                {"id": "f5f2a240d58d415b460911fa759eb25a08d1f427"},
+                {"id": "268580c4cecca0c6957a7d0af5f0b3d080a9dcdd"},
+            ]
+        )
+        server.expect_request(
+            "/api/v4/projects/repo/merge_requests",
+            query_string="state=merged&per_page=100",
+        ).respond_with_json(
+            [
+                {
+                    "title": "Title 4",
+                    "merged_at": "2022-06-14T11:08:35Z",
+                    "merge_commit_sha": "ec00b4f28b7b494d2c0f7f2e31511f81316c8044",
+                    "author": {"name": "Test user"},
+                    "reviewers": [{"name": "Test reviewer"}],
+                },
+                {
+                    "title": "Title 3",
+                    "merged_at": "2022-05-25T10:27:10Z",
+                    "merge_commit_sha": "f5f2a240d58d415b460911fa759eb25a08d1f427",
+                    "author": {"name": "Test user"},
+                    "reviewers": [{"name": "Test reviewer"}],
+                },
+            ]
+        )
+        server.expect_request("/api/v4/projects/repo/pipelines/1/jobs").respond_with_json(
+            [
+                {"id": 1, "status": "success", "name": "job1"},
+                {"id": 2, "status": "failure", "name": "job2"},
+                {"id": 3, "status": "success", "name": "job_not_included"},
+            ]
+        )
+        for job_id in [1, 2]:
+            server.expect_request(f"/api/v4/projects/repo/jobs/{job_id}/trace").respond_with_data(
+                f"TRACE{job_id}"
+            )
+
+        # Same reports as created by the code-review and pipeline-logs commands
+        output_dir = pytester.path / "reports"
+        subprocess.check_call(
+            (
+                "nydok report gitlab --repo-path repo --to-ref main --from-ref v1.0"
+                f" --mr-lookup list --pipeline-id 1 --job-names job1,job2 -d {output_dir}"
+            ),
+            shell=True,
+            env=env,
+        )
+        for report_name, snapshot in [
+            ("code-review", "code-change-report.md"),
+            ("pipeline-logs", "pipeline-logs-report.md"),
+        ]:
+            with open(SCRIPT_DIR / "snapshots" / snapshot, "r") as expected:
+                assert (output_dir / f"{report_name}.md").read_text() == expected.read()
+
+        # Concurrent calls are bounded
+        client = AsyncGitLabClient(
+            GitLabClient(f"http://localhost:{server.port}/api/v4", "test-token"),
+            max_concurrency=2,
+        )
+        lock = threading.Lock()
+        running = []
+        max_running = 0
+
+        def call() -> None:
+            nonlocal max_running
+            with lock:
+                running.append(1)
+                max_running = max(max_running, len(running))
+            time.sleep(0.05)
+            with lock:
+                running.pop()
+
+        async def call_all() -> None:
+            await asyncio.gather(*(client.run(call) for _ in range(6)))
+
+        asyncio.run(call_all())
+        assert max_running == 2
+
+    # Requests are bounded by the client's max_workers, also across concurrent fetches
+    # which each fetch pages concurrently
+    with HTTPServer(threaded=True) as server:
+        lock = threading.Lock()
+        running = []
+        max_running = 0
+
+        def handler(request):
+            nonlocal max_running
+            with lock:
+                running.append(1)
+                max_running = max(max_running, len(running))
+            time.sleep(0.05)
+            with lock:
+                running.pop()
+            return Response(json.dumps([{"id": "a"}]), headers={"X-Total-Pages": "3"})
+
+        server.expect_request("/api/v4/projects/repo/repository/commits").respond_with_handler(
+            handler
+        )
+        server.expect_request("/api/v4/projects/repo/repository/tags/v1.0").respond_with_json(
+            {"commit": {"id": "a"}}
+        )
+        client = AsyncGitLabClient(
+            GitLabClient(f"http://localhost:{server.port}/api/v4", "test-token", max_workers=2),
+            max_concurrency=4,
+        )
+
+        async def fetch_all():
+            return await asyncio.gather(
+                gitlab_async.get_commit_for_tag("repo", "v1.0", client),
+                *(
+                    gitlab_async.get_commits_for_ref("repo", "main", client=client)
+                    for _ in range(4)
+                ),
+            )
+
+        tag_commit, *commits = asyncio.run(fetch_all())
+        assert tag_commit == "a"
+        assert commits == [["a", "a", "a"]] * 4
+        assert max_running == 2
+
+
 @testcase("FR700")
 def test_pipeline_logs(pytester) -> None:
     pytester.plugins = ["nydok"]
@@ -393,3 +1328,240 @@ def test_pipeline_logs(pytester) -> None:
         os.environ["GITLAB_TOKEN"] = _gitlab_token
     if _gitlab_url:
         os.environ["GITLAB_URL"] = _gitlab_url
+
+
+@testcase("FR701")
+def test_pipeline_logs_streamed() -> None:
+    from pytest_httpserver import HTTPServer
+
+    from nydok import gitlab
+    from nydok.gitlab import TRACE_CHUNK_SIZE, GitLabClient, set_client
+    from nydok.report import create_pipeline_logs_report
+
+    # Escape sequences across the chunk boundaries of downloaded traces
+    head = "a" * (TRACE_CHUNK_SIZE - 3) + "\x1b[31mred\x1b[0m\nline 2\x1b["
+    padding = "b" * (2 * TRACE_CHUNK_SIZE - len(head) - 2)
+    trace = head + padding + "\x1b[1;32mgreen\x1b[0m"
+
+    with HTTPServer() as server:
+        server.expect_request("/api/v4/projects/repo/pipelines/1/jobs").respond_with_json(
+            [{"id": job_id, "status": "success", "name": f"job{job_id}"} for job_id in [2, 1]]
+        )
+        for job_id in [1, 2]:
+            server.expect_request(f"/api/v4/projects/repo/jobs/{job_id}/trace").respond_with_data(
+                trace
+            )
+
+        _client = gitlab._client
+        set_client(GitLabClient(f"http://localhost:{server.port}/api/v4", "test-token"))
+        try:
+            report = create_pipeline_logs_report("repo", 1)
+        finally:
+            gitlab._client = _client
+
+    log = "a" * (TRACE_CHUNK_SIZE - 3) + "red<br>line 2\x1b[" + padding + "green"
+    assert report == "".join(
+        f'## job{job_id}\n\n<div class="codehilite"><pre><code>\n{log}\n</code></pre></div>\n\n'
+        for job_id in [1, 2]
+    )
+
+
+@testcase("FR702")
+def test_pipeline_logs_job_selection() -> None:
+    from pytest_httpserver import HTTPServer
+
+    from nydok import gitlab
+    from nydok.gitlab import GitLabClient, set_client
+    from nydok.report import create_pipeline_logs_report
+
+    with HTTPServer() as server:
+        server.expect_request("/api/v4/projects/repo/pipelines/1/jobs").respond_with_json(
+            [
+                {"id": 4, "name": "test-unit"},
+                {"id": 3, "name": "test-integration"},
+                # Earlier attempt of the same job
+                {"id": 2, "name": "test-unit"},
+                {"id": 1, "name": "build"},
+            ]
+        )
+        server.expect_request("/api/v4/projects/repo/pipelines/1/bridges").respond_with_json(
+            [
+                {"name": "deploy", "downstream_pipeline": {"id": 7, "project_id": 42}},
+                {"name": "not-triggered", "downstream_pipeline": None},
+            ]
+        )
+        server.expect_request("/api/v4/projects/42/pipelines/7/jobs").respond_with_json(
+            [{"id": 8, "name": "test-smoke"}, {"id": 9, "name": "release"}]
+        )
+        server.expect_request("/api/v4/projects/42/pipelines/7/bridges").respond_with_json([])
+        for project, job_id in [("repo", 1), ("repo", 2), ("repo", 3), ("repo", 4), ("42", 8)]:
+            server.expect_request(
+                f"/api/v4/projects/{project}/jobs/{job_id}/trace"
+            ).respond_with_data(f"TRACE{job_id}")
+
+        _client = gitlab._client
+        set_client(GitLabClient(f"http://localhost:{server.port}/api/v4", "test-token"))
+        try:
+            report = create_pipeline_logs_report(
+                "repo",
+                1,
+                job_names=["build", "*test-*"],
+                job_regex="unit|smoke|build",
+                include_downstream=True,
+            )
+        finally:
+            gitlab._client = _client
+
+        traces = [request.path for request, _ in server.log if request.path.endswith("/trace")]
+
+    assert [line for line in report.splitlines() if line.startswith(("##", "TRACE"))] == [
+        "## build",
+        "TRACE1",
+        "## deploy/test-smoke",
+        "TRACE8",
+        "## test-unit",
+        "TRACE4",
+    ]
+    # Only the logs included in the report are downloaded
+    assert sorted(traces) == [
+        "/api/v4/projects/42/jobs/8/trace",
+        "/api/v4/projects/repo/jobs/1/trace",
+        "/api/v4/projects/repo/jobs/4/trace",
+    ]
+
+
+@testcase("FR703")
+def test_pipeline_logs_modes(tmp_path) -> None:
+    import gzip
+
+    from pytest_httpserver import HTTPServer
+
+    from nydok import gitlab
+    from nydok.gitlab import GitLabClient, set_client
+    from nydok.logs import LogOptions
+    from nydok.report import create_pipeline_logs_report
+
+    log_lines = [
+        "section_start:1:setup\rSetup",
+        "setup 1",
+        "section_end:1:setup\r",
+        "section_start:2:tests[collapsed=true]\rTests",
+        "test 1 ok",
+        "test 2 ok",
+        "test 3 FAILED",
+        "test 4 ok",
+        "section_end:2:tests\r",
+        "done",
+    ]
+    trace = "\n".join(log_lines).replace("section_", "\x1b[0Ksection_") + "\n"
+    # As shown in the report, without text overwritten using carriage returns
+    shown_lines = [line.rstrip("\r").split("\r")[-1] for line in log_lines]
+
+    def omitted(no_lines):
+        return f"[... {no_lines} lines omitted ...]"
+
+    def create_report(log_options):
+        _client = gitlab._client
+        set_client(GitLabClient(f"http://localhost:{server.port}/api/v4", "test-token"))
+        try:
+            report = create_pipeline_logs_report("repo", 1, log_options=log_options)
+        finally:
+            gitlab._client = _client
+        return report.split("<code>\n")[1].split("\n</code>")[0].split("<br>")
+
+    with HTTPServer() as server:
+        server.expect_request("/api/v4/projects/repo/pipelines/1/jobs").respond_with_json(
+            [{"id": 1, "name": "test/unit"}]
+        )
+        server.expect_request("/api/v4/projects/repo/jobs/1/trace").respond_with_data(trace)
+
+        assert create_report(LogOptions()) == shown_lines + [""]
+        assert create_report(LogOptions(mode="head-tail", lines=2)) == (
+            shown_lines[:2] + [omitted(6)] + shown_lines[-2:] + [""]
+        )
+        assert create_report(LogOptions(mode="matches", context=1)) == (
+            [omitted(5)] + shown_lines[5:8] + [omitted(2), ""]
+        )
+        assert create_report(
+            LogOptions(mode="matches", context=0, patterns=["^setup", "^done"])
+        ) == ([omitted(1)] + shown_lines[1:2] + [omitted(7)] + shown_lines[-1:] + [""])
+        assert create_report(LogOptions(mode="sections", sections=["test*"])) == (
+            [omitted(3)] + shown_lines[3:9] + [omitted(1), ""]
+        )
+
+        # Gitlab runner writes the end of a section and the start of the next on one line
+        server.expect_request("/api/v4/projects/repo/pipelines/3/jobs").respond_with_json(
+            [{"id": 3, "name": "test/unit"}]
+        )
+        server.expect_request("/api/v4/projects/repo/jobs/3/trace").respond_with_data(
+            "\x1b[0Ksection_start:1:setup\r\x1b[0KSetup\n"
+            "setup 1\n"
+            "\x1b[0Ksection_end:1:setup\r\x1b[0Ksection_start:2:tests\r\x1b[0KTests\n"
+            "test 1 ok\n"
+            "\x1b[0Ksection_end:2:tests\r\x1b[0Ksection_start:3:cleanup\r\x1b[0KCleanup\n"
+            "cleanup 1\n"
+            "\x1b[0Ksection_end:3:cleanup\r\x1b[0K\n"
+        )
+        _client = gitlab._client
+        set_client(GitLabClient(f"http://localhost:{server.port}/api/v4", "test-token"))
+        try:
+            report = create_pipeline_logs_report(
+                "repo", 3, log_options=LogOptions(mode="sections", sections=["test*"])
+            )
+        finally:
+            gitlab._client = _client
+        assert report.split("<code>\n")[1].split("\n</code>")[0].split("<br>") == (
+            [omitted(2), "Tests", "test 1 ok", "Cleanup", omitted(2), ""]
+        )
+
+        # Full logs are written compressed, and linked from the report. Job names which
+        # map to the same file name still get a file each.
+        server.expect_request("/api/v4/projects/repo/pipelines/2/jobs").respond_with_json(
+            [{"id": 1, "name": "test/unit"}, {"id": 2, "name": "test_unit"}]
+        )
+        server.expect_request("/api/v4/projects/repo/jobs/2/trace").respond_with_data("other\n")
+        artifacts_dir = tmp_path / "artifacts"
+        _client = gitlab._client
+        set_client(GitLabClient(f"http://localhost:{server.port}/api/v4", "test-token"))
+        try:
+            report = create_pipeline_logs_report(
+                "repo",
+                2,
+                log_options=LogOptions(
+                    mode="head-tail", artifacts_dir=str(artifacts_dir), artifacts_link="logs"
+                ),
+            )
+        finally:
+            gitlab._client = _client
+        assert "[Full log](logs/test_unit-1.log.gz)" in report
+        assert "[Full log](logs/test_unit-2.log.gz)" in report
+        with gzip.open(artifacts_dir / "test_unit-1.log.gz", "rt", newline="") as f:
+            assert f.read() == "\n".join(log_lines) + "\n"
+        with gzip.open(artifacts_dir / "test_unit-2.log.gz", "rt", newline="") as f:
+            assert f.read() == "other\n"
+
+
+@testcase("FR704")
+def test_log_sanitizer() -> None:
+    from nydok.logs import LogSanitizer
+
+    log = (
+        "\x1b[32;1m$ make test\x1b[0;m\r\n"
+        "Downloading 10%\rDownloading 50%\r\x1b[KDownloading 100%\n"
+        "assert a < b && b > c\n"
+        "no newline at end\r"
+    )
+    expected = (
+        "$ make test<br>"
+        "Downloading 100%<br>"
+        "assert a &lt; b &amp;&amp; b &gt; c<br>"
+        "no newline at end"
+    )
+
+    # Same result regardless of how the log is split into chunks
+    for chunk_size in [1, 2, 3, 5, 8, len(log)]:
+        sanitizer = LogSanitizer()
+        html = "".join(
+            sanitizer.feed(log[i : i + chunk_size]) for i in range(0, len(log), chunk_size)
+        )
+        assert html + sanitizer.flush() == expected